@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: batched vs per-record stats
+
+Times recur_dict on one record at a time against batch_stats on blocks of
+records, on the same parsed records, checks that both give the same
+exported stats, and reports records per second for each. Whether NumPy was
+available for the batch path is printed with the results.
+
+Usage: python benchmarks/bench_batch.py
+"""
+from __future__ import print_function, division
+
+import random
+import timeit
+
+from malort import accumulators
+from malort.accumulators import JSONFloat
+from malort.stats import ShapeCache, batch_stats, export_stats, recur_dict
+
+
+def records(n=50000, seed=0):
+    rand = random.Random(seed)
+    blobs = []
+    for _ in range(n):
+        blob = {'id': rand.randint(0, 10 ** 9),
+                'name': 'user-{}'.format(rand.randint(0, 5000)),
+                'score': JSONFloat('{:.4f}'.format(rand.random())),
+                'created': '2014-09-26 17:{:02d}:00'.format(
+                    rand.randint(0, 59)),
+                'tags': {'kind': rand.choice(['a', 'b', 'c']),
+                         'flag': rand.random() < 0.5,
+                         'count': rand.randint(0, 100)},
+                'values': [rand.randint(0, 9) for _ in range(3)]}
+        if rand.random() < 0.2:
+            blob['note'] = None
+        blobs.append(blob)
+    return blobs
+
+
+def per_record(blobs):
+    stats = {}
+    cache = ShapeCache()
+    for blob in blobs:
+        recur_dict(stats, blob, shape_cache=cache)
+    return stats
+
+
+def batched(blobs, batch_size):
+    stats = {}
+    cache = ShapeCache()
+    for start in range(0, len(blobs), batch_size):
+        batch_stats(stats, blobs[start:start + batch_size], shape_cache=cache)
+    return stats
+
+
+def main():
+    blobs = records()
+    expected = export_stats(per_record(blobs))
+    print('NumPy: {}'.format('yes' if accumulators.np is not None else 'no'))
+    print('{:>12} {:>14} {:>10}'.format('batch size', 'records/s', 'speedup'))
+    base = None
+    for batch_size in [None, 64, 1024, 8192]:
+        if batch_size is None:
+            run = lambda: per_record(blobs)
+        else:
+            assert export_stats(batched(blobs, batch_size)) == expected
+            run = lambda: batched(blobs, batch_size)
+        seconds = min(timeit.repeat(run, number=1, repeat=3))
+        rate = len(blobs) / seconds
+        base = base or rate
+        print('{:>12} {:>14.0f} {:>9.2f}x'.format(batch_size or 'per record',
+                                                  rate, rate / base))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: compressed input
+
+Writes the same newline-delimited JSON with each codec (zstd only if the
+zstandard package is installed, and gzip both as one member and as BGZF
+members), then reports for each:
+
+* decompress: MB/s of uncompressed data through malort.compression.open_file
+* records: records/s from iter_file_records, which decompresses in a
+  background thread while the records are split
+* analyze: records/s for malort.analyze with the process backend, where
+  BGZF and multi-frame zstd files are split across workers
+
+Usage: python benchmarks/bench_compression.py
+"""
+from __future__ import print_function, division
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+import random
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+
+import malort as mt
+from malort.compression import open_file
+from malort.readers import iter_file_records
+
+
+def ndjson(n=200000, seed=0):
+    rand = random.Random(seed)
+    return b''.join(
+        json.dumps({'id': rand.randint(0, 10 ** 9),
+                    'name': 'user-{}'.format(rand.randint(0, 5000)),
+                    'score': round(rand.random(), 4),
+                    'tags': [rand.choice('abc') for _ in range(3)]}
+                   ).encode('utf-8') + b'\n'
+        for _ in range(n))
+
+
+def bgzf(data, size=64000):
+    members = []
+    for start in range(0, len(data), size):
+        block = data[start:start + size]
+        compress = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        body = compress.compress(block) + compress.flush()
+        header = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff'
+                  + struct.pack('<H2sHH', 6, b'BC', 2, len(body) + 25))
+        members.append(header + body + struct.pack(
+            '<II', zlib.crc32(block) & 0xFFFFFFFF, len(block)))
+    return b''.join(members)
+
+
+def codecs(data):
+    yield 'gzip', 'data.gz', gzip.compress(data, 6)
+    yield 'gzip (BGZF)', 'data.bgz', bgzf(data)
+    yield 'bz2', 'data.bz2', bz2.compress(data)
+    yield 'xz', 'data.xz', lzma.compress(data, preset=1)
+    try:
+        import zstandard
+    except ImportError:
+        return
+    compress = zstandard.ZstdCompressor().compress
+    yield 'zstd', 'data.zst', compress(data)
+    yield 'zstd (frames)', 'data.zst', b''.join(
+        compress(data[i:i + (1 << 20)]) for i in range(0, len(data), 1 << 20))
+
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def main():
+    data = ndjson()
+    count = data.count(b'\n')
+    mbytes = len(data) / (1 << 20)
+    print('{:.1f} MB, {} records'.format(mbytes, count))
+    print('{:<14} {:>8} {:>12} {:>12} {:>12}'.format(
+        'codec', 'ratio', 'decompress', 'records/s', 'analyze/s'))
+    for name, filename, blob in codecs(data):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, filename)
+            with open(path, 'wb') as fwrite:
+                fwrite.write(blob)
+
+            def decompress():
+                with open_file(path) as fread:
+                    while fread.read(1 << 20):
+                        pass
+
+            _, seconds = timed(decompress)
+            rate = mbytes / seconds
+            records, seconds = timed(
+                lambda: sum(1 for r in iter_file_records(path) if r))
+            assert records == count
+            record_rate = records / seconds
+            result, seconds = timed(
+                lambda: mt.analyze(tmpdir, blocksize=len(blob) // 8 + 1))
+            assert result.count == count
+            print('{:<14} {:>7.1f}x {:>7.0f} MB/s {:>12.0f} {:>12.0f}'.format(
+                name, len(data) / len(blob), rate, record_rate,
+                count / seconds))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
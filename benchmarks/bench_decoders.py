@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: JSON decoders
+
+Scales up the records in the test fixtures, and times each installed
+decoder (see malort.decoders) on them as bytes, as used by analyze, against
+the standard library's json. For third-party decoders the raw loads is
+timed too, to show the cost of the fallback checks. Each decoder's results
+are checked against json's.
+
+Usage: python benchmarks/bench_decoders.py
+"""
+from __future__ import print_function, division
+
+import json
+import os
+import timeit
+
+from malort.decoders import (FAST_DECODERS, _import, available_decoders,
+                             get_decoder)
+from malort.readers import is_blank, iter_file_records
+from malort.test_helpers import (TEST_FILES_1, TEST_FILES_2, TEST_FILES_3,
+                                 TEST_FILES_4)
+
+
+def fixture_records():
+    blobs = []
+    for path in [TEST_FILES_1, TEST_FILES_2, TEST_FILES_3, TEST_FILES_4]:
+        for name in sorted(os.listdir(path)):
+            filepath = os.path.join(path, name)
+            if name.endswith('.json'):
+                with open(filepath, 'rb') as fread:
+                    blobs.append(fread.read())
+            else:
+                blobs.extend(row for row in iter_file_records(filepath, '\n')
+                             if not is_blank(row))
+    return blobs
+
+
+def records(n=50000):
+    blobs = fixture_records()
+    return (blobs * (n // len(blobs) + 1))[:n]
+
+
+def main():
+    blobs = records()
+    expected = [json.dumps(json.loads(b)) for b in blobs]
+    modules = dict(FAST_DECODERS)
+    print('{:>16} {:>14} {:>10}'.format('decoder', 'records/s', 'speedup'))
+    base = None
+    for name in available_decoders()[::-1]:
+        loads = get_decoder(name)
+        assert [json.dumps(loads(b)) for b in blobs] == expected
+        runs = [(name, loads)]
+        if name != 'json':
+            runs.append((name + ' (raw)', _import(modules[name]).loads))
+        for label, run in runs:
+            seconds = min(timeit.repeat(lambda: [run(b) for b in blobs],
+                                        number=1, repeat=3))
+            rate = len(blobs) / seconds
+            base = base or rate
+            print('{:>16} {:>14.0f} {:>9.2f}x'.format(label, rate,
+                                                      rate / base))
+
+
+if __name__ == '__main__':
+    main()
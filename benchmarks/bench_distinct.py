@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: per-value cost of approx_distinct
+
+Times accumulator updates for str, int and float values with and without a
+HyperLogLog (distinct_precision), and recur_dict on whole records, and
+reports the estimate error.
+
+Usage: python benchmarks/bench_distinct.py
+"""
+from __future__ import print_function, division
+
+import random
+import timeit
+
+from malort.accumulators import FloatStats, IntStats, StatsOptions, StrStats
+from malort.stats import ShapeCache, recur_dict
+
+
+def values(n=100000, seed=0):
+    rand = random.Random(seed)
+    return {
+        'str': ['user-{}'.format(rand.randint(0, 20000)) for _ in range(n)],
+        'int': [rand.randint(0, 10 ** 6) for _ in range(n)],
+        'float': [round(rand.random() * 100, 3) for _ in range(n)],
+    }
+
+
+def records(n=20000, seed=0):
+    rand = random.Random(seed)
+    return [{'id': rand.randint(0, 10 ** 6),
+             'name': 'user-{}'.format(rand.randint(0, 5000)),
+             'score': round(rand.random(), 4),
+             'tags': {'kind': rand.choice(['a', 'b', 'c']),
+                      'flag': rand.random() < 0.5}} for _ in range(n)]
+
+
+def update_all(acc_cls, precision, items):
+    acc = acc_cls(StatsOptions(distinct_precision=precision))
+    for item in items:
+        acc.update(item)
+    return acc
+
+
+def main():
+    accumulators = {'str': StrStats, 'int': IntStats, 'float': FloatStats}
+    print('{:>8} {:>10} {:>12} {:>12} {:>10}'.format(
+        'type', 'precision', 'ns/value', 'overhead', 'error %'))
+    for name, items in sorted(values().items()):
+        base = None
+        for precision in [None, 10, 12, 14]:
+            seconds = min(timeit.repeat(
+                lambda: update_all(accumulators[name], precision, items),
+                number=1, repeat=3))
+            per_value = seconds / len(items) * 1e9
+            if base is None:
+                base = per_value
+                error = ''
+            else:
+                acc = update_all(accumulators[name], precision, items)
+                exact = len(set(items))
+                error = '{:.2f}'.format(
+                    abs(acc.distinct.estimate() - exact) / exact * 100)
+            print('{:>8} {:>10} {:>12.0f} {:>11.0f}% {:>10}'.format(
+                name, precision or '-', per_value,
+                (per_value / base - 1) * 100, error))
+
+    blobs = records()
+    print('\n{:>10} {:>14}'.format('precision', 'records/s'))
+    for precision in [None, 12]:
+        options = StatsOptions(distinct_precision=precision)
+
+        def run():
+            stats = {}
+            cache = ShapeCache()
+            for blob in blobs:
+                recur_dict(stats, blob, shape_cache=cache, options=options)
+        seconds = min(timeit.repeat(run, number=1, repeat=3))
+        print('{:>10} {:>14.0f}'.format(precision or '-',
+                                        len(blobs) / seconds))
+
+
+if __name__ == '__main__':
+    main()
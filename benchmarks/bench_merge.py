@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: merging partition stats
+
+Merges N partial stats dicts, arriving in random order, with
+malort.backends.tree_reduce at several fan-ins. Reports the total merge
+time, and the tail: the time left after the last partial arrives, which is
+what a run waits on once all partitions are parsed. The baseline is the
+previous approach of folding every partial with combine_stats once all of
+them are in.
+
+Usage: python benchmarks/bench_merge.py
+"""
+from __future__ import print_function, division
+
+from functools import reduce
+import pickle
+import random
+import time
+
+from malort.backends import tree_reduce
+from malort.stats import combine_stats, recur_dict
+
+
+def partial_stats(n, width=200, records=20, seed=0):
+    """Pickled partial stats, so each run merges fresh copies"""
+    rand = random.Random(seed)
+    partials = []
+    for _ in range(n):
+        stats = {}
+        for _ in range(records):
+            record = {}
+            for i in range(width):
+                kind = i % 3
+                if kind == 0:
+                    record['f{}'.format(i)] = rand.random()
+                elif kind == 1:
+                    record['f{}'.format(i)] = 's{}'.format(rand.randint(0, 99))
+                else:
+                    record['f{}'.format(i)] = rand.randint(0, 1000)
+            recur_dict(stats, record)
+        partials.append(pickle.dumps(stats, -1))
+    return partials
+
+
+def run(partials, merge, seed=0):
+    """Return (total merge seconds, seconds left after the last arrival)"""
+    order = list(enumerate(partials))
+    random.Random(seed).shuffle(order)
+    loaded = [(i, pickle.loads(blob)) for i, blob in order]
+    timing = {}
+
+    def arrivals():
+        for item in loaded[:-1]:
+            yield item
+        timing['last'] = time.time()
+        yield loaded[-1]
+
+    start = time.time()
+    merge(arrivals())
+    end = time.time()
+    return end - start, end - timing['last']
+
+
+def fold_all(items):
+    items = sorted(items, key=lambda item: item[0])
+    return reduce(combine_stats, [stats for _, stats in items])
+
+
+def main():
+    print('{:>10} {:>12} {:>12} {:>12}'.format('partials', 'merge', 'total ms',
+                                               'tail ms'))
+    for n in [16, 128, 1024]:
+        partials = partial_stats(n)
+        merges = [('fold', fold_all)]
+        for fan_in in [2, 8, 32]:
+            merges.append(('tree/{}'.format(fan_in),
+                           lambda items, f=fan_in: tree_reduce(
+                               combine_stats, items, f)))
+        for name, merge in merges:
+            total, tail = min(run(partials, merge, seed) for seed in range(3))
+            print('{:>10} {:>12} {:>12.1f} {:>12.1f}'.format(
+                n, name, total * 1e3, tail * 1e3))
+
+
+if __name__ == '__main__':
+    main()
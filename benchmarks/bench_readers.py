@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: splitting delimited JSON files into records
+
+Compares the original 4 KB text-mode `delimited` loop with the chunked
+binary splitter and the mmap splitter in malort.readers, and times
+iter_array_records on the same records as one top-level JSON array.
+
+Usage: python benchmarks/bench_readers.py
+"""
+from __future__ import print_function, division
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from malort.readers import iter_array_records, iter_file_records, split_stream
+
+
+def legacy_delimited(file, delimiter='\n', bufsize=4096):
+    """malort.stats.delimited before the binary readers"""
+    buf = ''
+    while True:
+        newbuf = file.read(bufsize)
+        if not newbuf:
+            yield buf
+            return
+        buf += newbuf
+        lines = buf.split(delimiter)
+        for line in lines[:-1]:
+            yield line
+        buf = lines[-1]
+
+
+def legacy(path):
+    with open(path, 'r') as fread:
+        return sum(1 for _ in legacy_delimited(fread))
+
+
+def chunked(path):
+    with open(path, 'rb') as fread:
+        return sum(1 for _ in split_stream(fread))
+
+
+def mmapped(path):
+    return sum(1 for _ in iter_file_records(path))
+
+
+def array(path):
+    return sum(1 for _ in iter_array_records(path + '.json'))
+
+
+def write_file(path, record, size):
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    with open(path, 'wb') as fwrite:
+        for _ in range(size // len(line)):
+            fwrite.write(line)
+    with open(path + '.json', 'wb') as fwrite:
+        fwrite.write(b'[')
+        for i in range(size // len(line)):
+            fwrite.write(line if i == 0 else b',' + line)
+        fwrite.write(b']')
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        datasets = [
+            ('200 B records', {'id': 1, 'text': 'x' * 170}, 64 << 20),
+            ('256 KB records', {'id': 1, 'text': 'x' * (256 << 10)}, 32 << 20),
+        ]
+        for name, record, size in datasets:
+            path = os.path.join(tmpdir, 'data')
+            write_file(path, record, size)
+            mbytes = os.path.getsize(path) / (1 << 20)
+            for reader in [legacy, chunked, mmapped, array]:
+                start = time.time()
+                count = reader(path)
+                elapsed = time.time() - start
+                print('{:<15} {:<8} {:8d} records  {:8.1f} MB/s'.format(
+                    name, reader.__name__, count, mbytes / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
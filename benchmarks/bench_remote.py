@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: remote sources
+
+Serves newline-delimited JSON from the local object store stand-in in
+malort.test_helpers, with a fixed latency per request to mimic a remote
+endpoint, and reports MB/s for reading one object, and records/s for
+analyze over an S3Source, as the number of concurrent range requests per
+reader grows.
+
+Usage: python benchmarks/bench_remote.py
+"""
+from __future__ import print_function, division
+
+import json
+import random
+import time
+
+import malort as mt
+from malort.remote import HTTPClient, RemoteObject
+from malort.sources import S3Source
+from malort.test_helpers import ObjectStoreServer
+
+
+def ndjson(n, seed=0):
+    rand = random.Random(seed)
+    return b''.join(
+        json.dumps({'id': rand.randint(0, 10 ** 9),
+                    'name': 'user-{}'.format(rand.randint(0, 5000)),
+                    'score': round(rand.random(), 4)}).encode('utf-8')
+        + b'\n' for _ in range(n))
+
+
+def main(latency=0.02, chunksize=128 << 10):
+    objects = dict(('bucket/part-{:03d}.ndjson'.format(i), ndjson(20000, i))
+                   for i in range(8))
+    first = sorted(objects)[0]
+    mbytes = len(objects[first]) / (1 << 20)
+    count = sum(data.count(b'\n') for data in objects.values())
+    print('{} objects of {:.1f} MB, {} ms per request'.format(
+        len(objects), mbytes, latency * 1000))
+    print('{:>12} {:>10} {:>12}'.format('concurrency', 'read MB/s',
+                                        'analyze/s'))
+    with ObjectStoreServer(objects, latency=latency) as server:
+        for concurrency in [1, 2, 4, 8]:
+            client = HTTPClient(concurrency, chunksize)
+            obj = RemoteObject.from_url(server.url + '/' + first,
+                                        client=client)
+            start = time.time()
+            with obj.open() as fread:
+                while fread.read(1 << 20):
+                    pass
+            rate = mbytes / (time.time() - start)
+            source = S3Source(server.url, 'bucket', concurrency=concurrency,
+                              chunksize=chunksize)
+            start = time.time()
+            result = mt.analyze(source, backend='thread')
+            assert result.count == count
+            print('{:>12} {:>10.1f} {:>12.0f}'.format(
+                concurrency, rate, count / (time.time() - start)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: ISO8601 classification of string values
+
+Compares running the full ISO8601 regex on every value against
+malort.timestamps.is_timestamp with a per-path layout memo.
+
+Usage: python benchmarks/bench_timestamps.py
+"""
+from __future__ import print_function, division
+
+import random
+import timeit
+
+from malort.accumulators import PathStats
+from malort.timestamps import ISO8601, is_timestamp
+
+
+def fields(n=50000, seed=0):
+    rand = random.Random(seed)
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur']
+    return {
+        'text': [' '.join(rand.choice(words) for _ in range(40))
+                 for _ in range(n)],
+        'timestamp': ['2015-{:02d}-{:02d} {:02d}:{:02d}:{:02d}'.format(
+            rand.randint(1, 12), rand.randint(1, 28), rand.randint(0, 23),
+            rand.randint(0, 59), rand.randint(0, 59)) for _ in range(n)],
+        'timestamp_tz': ['2015-06-{:02d}T12:00:{:02d}.{:03d}+05:30'.format(
+            rand.randint(1, 28), rand.randint(0, 59), rand.randint(0, 999))
+            for _ in range(n)],
+        'numeric_id': [str(rand.randint(10 ** 9, 10 ** 10))
+                       for _ in range(n)],
+    }
+
+
+def main():
+    for name, values in sorted(fields().items()):
+        path_stats = PathStats(name)
+        assert ([bool(ISO8601.match(v)) for v in values]
+                == [is_timestamp(v, path_stats) for v in values])
+
+        def regex():
+            for v in values:
+                ISO8601.match(v)
+
+        def classifier():
+            path_stats = PathStats(name)
+            for v in values:
+                is_timestamp(v, path_stats)
+
+        regex_time = min(timeit.repeat(regex, number=1, repeat=5))
+        fast_time = min(timeit.repeat(classifier, number=1, repeat=5))
+        print('{:<14} regex {:7.1f} ns/value  is_timestamp {:7.1f} ns/value'
+              '  speedup {:.2f}x'.format(
+                  name, regex_time / len(values) * 1e9,
+                  fast_time / len(values) * 1e9, regex_time / fast_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
 # -*- coding: utf-8 -*-
 from malort import stats
-from malort.core import analyze
\ No newline at end of file
+from malort.core import analyze, merge
+from malort.metrics import Metrics
+from malort.sampling import Sampling
+from malort.streaming import StreamAnalyzer, WindowedAnalyzer, analyze_iter
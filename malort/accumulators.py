@@ -0,0 +1,661 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Accumulators
+-------
+
+Typed, in-place accumulators for per-path Malort stats. Each accumulator
+tracks one value type for one key path, and can be exported to (and
+rebuilt from) the plain stats dicts found in `MalortResult.stats`.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+from collections import namedtuple
+import decimal
+import math
+
+from malort.sketches import (QUANTILES, HyperLogLog, KLLSketch,
+                             ReservoirSample, SpaceSaving)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def get_new_mean(value, current_mean, count):
+    """Given a value, current mean, and count, return new mean"""
+    summed = current_mean * count
+    return (summed + value)/(count + 1)
+
+
+def combine_means(means, counts):
+    """Combine ordered iter of means and counts"""
+    numer = sum([mean * count for mean, count in zip(means, counts)
+                 if mean is not None and count is not None])
+    denom = sum([c for c in counts if c is not None])
+    return round(numer / denom, 3)
+
+
+class JSONFloat(float):
+    """
+    Float that remembers the text of the JSON number it was parsed from.
+    Pass as `parse_float` to json.loads so that precision and scale can be
+    read off the original digits ("1.10" has scale 2, though it is 1.1).
+    """
+
+    __slots__ = ('raw',)
+
+    def __new__(cls, raw):
+        new = float.__new__(cls, raw)
+        new.raw = raw
+        return new
+
+
+def float_precision_scale(value):
+    """
+    Return the (precision, scale) of a float as a decimal, from its JSON
+    token text if it is a JSONFloat, else from its repr
+    """
+    text = value.raw if type(value) is JSONFloat else repr(value)
+    dot = text.find('.')
+    if dot < 0 or 'e' in text or 'E' in text:
+        sign, digits, exponent = decimal.Decimal(text).as_tuple()
+        if not isinstance(exponent, int):
+            # nan/inf
+            return 0, 0
+        if exponent >= 0:
+            return len(digits) + exponent, 0
+        return len(digits), -exponent
+
+    start = 1 if text[0] == '-' else 0
+    if text[start] == '0':
+        precision = len(text[dot + 1:].lstrip('0')) or 1
+    else:
+        precision = len(text) - start - 1
+    return precision, len(text) - dot - 1
+
+
+class StatsOptions(namedtuple('StatsOptions',
+                              ['distinct_precision', 'top_k', 'sample_size',
+                               'salt'])):
+    """
+    Options for the sketches kept by accumulators.
+
+    distinct_precision: int, default None
+        HyperLogLog precision for approx_distinct; None to skip
+    top_k: int, default 10
+        Number of Space-Saving counters for the most frequent strings;
+        0 or None to skip
+    sample_size: int, default 3
+        Size of the uniform sample of string values
+    salt: int, default None
+        Salt for the samples' priorities (see ReservoirSample). Stats that
+        will be merged, e.g. those of different partitions, need different
+        salts for the merged samples to be uniform.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, distinct_precision=None, top_k=10, sample_size=3,
+                salt=None):
+        return super(StatsOptions, cls).__new__(cls, distinct_precision,
+                                                top_k, sample_size, salt)
+
+
+DEFAULT_OPTIONS = StatsOptions()
+
+
+class CountStats(object):
+    """
+    Accumulator that only counts values, used for bool/null/datetime.
+    Accumulators take StatsOptions; count-only types ignore them.
+    """
+
+    __slots__ = ('count',)
+    name = None
+
+    def __init__(self, options=None):
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+
+    def update_many(self, values):
+        """Add a sequence of values; the same as updating with each"""
+        self.count += len(values)
+
+    def merge(self, other):
+        self.count += other.count
+        return self
+
+    def copy(self):
+        new = self.__class__()
+        new.merge(self)
+        return new
+
+    def to_dict(self):
+        return {'count': self.count}
+
+    def to_state(self):
+        """
+        Return the full, JSON serializable state of the accumulator. Unlike
+        to_dict, nothing is rounded, so merging states is lossless.
+        """
+        return self.to_dict()
+
+    @classmethod
+    def from_dict(cls, stats):
+        new = cls()
+        new.count = stats.get('count', 0)
+        return new
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild an accumulator from to_state"""
+        return cls.from_dict(state)
+
+
+class BoolStats(CountStats):
+    __slots__ = ()
+    name = 'bool'
+
+
+class NullStats(CountStats):
+    __slots__ = ()
+    name = 'NoneType'
+
+
+class DatetimeStats(CountStats):
+    __slots__ = ()
+    name = 'datetime'
+
+
+class NumericStats(CountStats):
+    """
+    Accumulator for count/min/max/mean/stddev of numeric values, and a KLL
+    sketch of their distribution for p50/p95/p99/p99.9. With a
+    distinct_precision option, also keeps a HyperLogLog of the values for
+    approx_distinct.
+
+    The mean comes from a compensated (Neumaier) sum of the values, and the
+    population stddev from the sum of squared deviations `m2`, updated with
+    Welford's method and merged with Chan et al.'s formula, so neither loses
+    precision as values or partitions add up. Only exported stats are
+    rounded.
+
+    Stats rebuilt from a non-empty exported dict have no sketches, and
+    neither does anything they are merged with, so quantiles and distinct
+    counts are never reported for only part of the values. The same goes
+    for stddev when the dict doesn't have one.
+    """
+
+    __slots__ = ('min', 'max', 'total', 'compensation', 'm2', 'sketch',
+                 'distinct')
+    sketch_k = 128
+
+    def __init__(self, options=None):
+        precision = (options or DEFAULT_OPTIONS).distinct_precision
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0
+        self.compensation = 0
+        self.m2 = 0
+        self.sketch = KLLSketch(self.sketch_k)
+        self.distinct = HyperLogLog(precision) if precision else None
+
+    @property
+    def mean(self):
+        if not self.count:
+            return 0
+        return (self.total + self.compensation) / self.count
+
+    @property
+    def stddev(self):
+        if self.m2 is None or not self.count:
+            return None
+        return math.sqrt(self.m2 / self.count)
+
+    def _add(self, value):
+        """Add `value` to the compensated sum"""
+        total = self.total + value
+        if abs(self.total) >= abs(value):
+            self.compensation += (self.total - total) + value
+        else:
+            self.compensation += (value - total) + self.total
+        self.total = total
+
+    def update(self, value):
+        if self.distinct is not None:
+            self.distinct.add(repr(value).encode('ascii'))
+        self._update_number(value)
+
+    def _update_number(self, value):
+        count = self.count
+        total = self.total
+        if count:
+            if value > self.max:
+                self.max = value
+            if value < self.min:
+                self.min = value
+            mean = (total + self.compensation) / count
+        else:
+            self.max = self.min = value
+            mean = 0
+        # Neumaier sum and Welford update, inlined from _add for speed
+        new_total = total + value
+        if abs(total) >= abs(value):
+            self.compensation += (total - new_total) + value
+        else:
+            self.compensation += (value - new_total) + total
+        self.total = new_total
+        self.count = count = count + 1
+        if self.m2 is not None:
+            delta = value - mean
+            self.m2 += delta * (value - mean - delta / count)
+        if self.sketch is not None:
+            self.sketch.update(value)
+
+    def update_many(self, values):
+        """
+        Add a sequence of values at once. The result is the same as updating
+        with each in turn, up to float rounding in the sum and m2.
+        """
+        if not values:
+            return
+        if self.distinct is not None:
+            add = self.distinct.add
+            for value in values:
+                add(repr(value).encode('ascii'))
+        self._update_numbers(values)
+
+    def _update_numbers(self, values):
+        count = len(values)
+        low, high = min(values), max(values)
+        if self.count:
+            self.max = max(self.max, high)
+            self.min = min(self.min, low)
+        else:
+            self.min, self.max = low, high
+        if isinstance(values[0], float):
+            total = math.fsum(values)
+        else:
+            total = sum(values)
+        m2 = None
+        if self.m2 is not None:
+            mean = total / count
+            if np is not None:
+                deviations = np.asarray(values, dtype=np.float64) - mean
+                m2 = float(np.dot(deviations, deviations))
+            else:
+                m2 = math.fsum([(value - mean) ** 2 for value in values])
+        self._merge_moments(count, total, 0, m2)
+        if self.sketch is not None:
+            self.sketch.update_many(values)
+
+    def _merge_moments(self, count, total, compensation, m2):
+        """
+        Merge the sum and m2 of `count` other values into these (Chan et
+        al.), and add them to the count
+        """
+        if not self.count:
+            self.total, self.compensation, self.m2 = total, compensation, m2
+        else:
+            if self.m2 is not None and m2 is not None:
+                delta = (total + compensation) / count - self.mean
+                self.m2 += m2 + (delta * delta * self.count * count
+                                 / (self.count + count))
+            else:
+                self.m2 = None
+            self._add(total)
+            self.compensation += compensation
+        self.count += count
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.min, self.max = other.min, other.max
+            self.sketch = other.sketch and other.sketch.copy()
+            self.distinct = other.distinct and other.distinct.copy()
+        else:
+            self.max = max(self.max, other.max)
+            self.min = min(self.min, other.min)
+            if self.sketch is not None and other.sketch is not None:
+                self.sketch.merge(other.sketch)
+            else:
+                self.sketch = None
+            if self.distinct is not None and other.distinct is not None:
+                self.distinct.merge(other.distinct)
+            else:
+                self.distinct = None
+        self._merge_moments(other.count, other.total, other.compensation,
+                            other.m2)
+        return self
+
+    def to_dict(self):
+        stats = self.to_state()
+        stats['mean'] = round(self.mean, 3)
+        del stats['sketch'], stats['distinct']
+        del stats['sum'], stats['sum_error'], stats['m2']
+        if self.stddev is not None:
+            stats['stddev'] = round(self.stddev, 3)
+        if self.sketch is not None and self.count:
+            values = self.sketch.quantiles([q for _, q in QUANTILES])
+            stats.update(zip([name for name, _ in QUANTILES], values))
+        if self.distinct is not None and self.count:
+            stats['approx_distinct'] = self.distinct.estimate()
+        return stats
+
+    def to_state(self):
+        return {'count': self.count, 'max': self.max, 'min': self.min,
+                'mean': self.mean, 'sum': self.total,
+                'sum_error': self.compensation, 'm2': self.m2,
+                'sketch': self.sketch and self.sketch.to_state(),
+                'distinct': self.distinct and self.distinct.to_state()}
+
+    @classmethod
+    def from_dict(cls, stats):
+        new = cls()
+        new.count = stats.get('count', 0)
+        new.min = stats.get('min')
+        new.max = stats.get('max')
+        new.total = stats.get('mean', 0) * new.count
+        if new.count:
+            new.sketch = None
+            stddev = stats.get('stddev')
+            new.m2 = None if stddev is None else stddev * stddev * new.count
+        return new
+
+    @classmethod
+    def from_state(cls, state):
+        new = cls.from_dict(state)
+        if 'sum' in state:
+            new.total = state['sum']
+            new.compensation = state['sum_error']
+            new.m2 = state['m2']
+        if state.get('sketch'):
+            new.sketch = KLLSketch.from_state(state['sketch'])
+        if state.get('distinct'):
+            new.distinct = HyperLogLog.from_state(state['distinct'])
+        return new
+
+
+class IntStats(NumericStats):
+    __slots__ = ()
+    name = 'int'
+
+
+class FloatStats(NumericStats):
+    """Numeric accumulator that also tracks decimal precision and scale"""
+
+    __slots__ = ('max_precision', 'max_scale', 'fixed_length')
+    name = 'float'
+
+    def __init__(self, options=None):
+        super(FloatStats, self).__init__(options)
+        self.max_precision = None
+        self.max_scale = None
+        self.fixed_length = True
+
+    def update(self, value):
+        vprec, vscale = float_precision_scale(value)
+        if self.count:
+            if self.max_precision != vprec or self.max_scale != vscale:
+                self.fixed_length = False
+            if vprec > self.max_precision:
+                self.max_precision = vprec
+            if vscale > self.max_scale:
+                self.max_scale = vscale
+        else:
+            self.max_precision, self.max_scale = vprec, vscale
+        super(FloatStats, self).update(float(value))
+
+    def update_many(self, values):
+        if not values:
+            return
+        # Fixed length as long as every value has the same precision/scale
+        kinds = set(map(float_precision_scale, values))
+        if self.count:
+            kinds.add((self.max_precision, self.max_scale))
+        if len(kinds) > 1:
+            self.fixed_length = False
+        self.max_precision = max(precision for precision, _ in kinds)
+        self.max_scale = max(scale for _, scale in kinds)
+        super(FloatStats, self).update_many([float(value) for value in values])
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.fixed_length = other.fixed_length
+            self.max_precision = other.max_precision
+            self.max_scale = other.max_scale
+        else:
+            if (not other.fixed_length
+                    or self.max_precision != other.max_precision
+                    or self.max_scale != other.max_scale):
+                self.fixed_length = False
+            self.max_precision = max(self.max_precision, other.max_precision)
+            self.max_scale = max(self.max_scale, other.max_scale)
+        return super(FloatStats, self).merge(other)
+
+    def to_state(self):
+        stats = super(FloatStats, self).to_state()
+        stats.update({'max': float(self.max), 'min': float(self.min),
+                      'max_precision': self.max_precision,
+                      'max_scale': self.max_scale,
+                      'fixed_length': self.fixed_length})
+        return stats
+
+    @classmethod
+    def from_dict(cls, stats):
+        new = super(FloatStats, cls).from_dict(stats)
+        new.max_precision = stats.get('max_precision')
+        new.max_scale = stats.get('max_scale')
+        new.fixed_length = stats.get('fixed_length', True)
+        return new
+
+
+class StrStats(NumericStats):
+    """
+    Length stats for strings, plus a uniform sample of values
+    (ReservoirSample, of the sample_size option) and the most frequent
+    values with their counts (SpaceSaving, of the top_k option). Like the
+    other sketches, top values are dropped when merged with stats rebuilt
+    from an exported dict.
+    """
+
+    __slots__ = ('reservoir', 'top')
+    name = 'str'
+
+    def __init__(self, options=None):
+        options = options or DEFAULT_OPTIONS
+        super(StrStats, self).__init__(options)
+        self.reservoir = ReservoirSample(options.sample_size, options.salt)
+        self.top = SpaceSaving(options.top_k) if options.top_k else None
+
+    @property
+    def sample(self):
+        return self.reservoir.values
+
+    def update(self, value):
+        self.reservoir.update(value)
+        if self.top is not None:
+            self.top.update(value)
+        if self.distinct is not None:
+            self.distinct.add(value.encode('utf-8', 'surrogatepass'))
+        self._update_number(len(value))
+
+    def update_many(self, values):
+        if not values:
+            return
+        self.reservoir.update_many(values)
+        if self.top is not None:
+            self.top.update_many(values)
+        if self.distinct is not None:
+            add = self.distinct.add
+            for value in values:
+                add(value.encode('utf-8', 'surrogatepass'))
+        self._update_numbers(list(map(len, values)))
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.reservoir = other.reservoir.copy()
+            self.top = other.top and other.top.copy()
+        else:
+            self.reservoir.merge(other.reservoir)
+            if self.top is not None and other.top is not None:
+                self.top.merge(other.top)
+            else:
+                self.top = None
+        return super(StrStats, self).merge(other)
+
+    def to_dict(self):
+        stats = super(StrStats, self).to_dict()
+        del stats['reservoir']
+        if stats['top_k'] is None or not self.count:
+            del stats['top_k']
+        else:
+            stats['top_k'] = self.top.top()
+        return stats
+
+    def to_state(self):
+        stats = super(StrStats, self).to_state()
+        stats['sample'] = self.sample
+        stats['reservoir'] = self.reservoir.to_state()
+        stats['top_k'] = self.top and self.top.to_state()
+        return stats
+
+    @classmethod
+    def from_dict(cls, stats):
+        new = super(StrStats, cls).from_dict(stats)
+        new.reservoir = ReservoirSample.from_values(
+            stats.get('sample', []), new.count,
+            max(DEFAULT_OPTIONS.sample_size, len(stats.get('sample', []))))
+        if new.count:
+            new.top = None
+        return new
+
+    @classmethod
+    def from_state(cls, state):
+        new = super(StrStats, cls).from_state(state)
+        if state.get('reservoir'):
+            new.reservoir = ReservoirSample.from_state(state['reservoir'])
+        if state.get('top_k'):
+            new.top = SpaceSaving.from_state(state['top_k'])
+        return new
+
+
+TYPE_ACCUMULATORS = {
+    'bool': BoolStats,
+    'NoneType': NullStats,
+    'datetime': DatetimeStats,
+    'int': IntStats,
+    'float': FloatStats,
+    'JSONFloat': FloatStats,
+    'str': StrStats,
+}
+
+
+def accumulator_class(name):
+    """
+    Return the accumulator class for type `name`. Types without a dedicated
+    accumulator get a count-only class, created once and cached.
+    """
+    acc_cls = TYPE_ACCUMULATORS.get(name)
+    if acc_cls is None:
+        acc_cls = type(str('{}Stats'.format(name)), (CountStats,),
+                       {'__slots__': (), 'name': name})
+        TYPE_ACCUMULATORS[name] = acc_cls
+    return acc_cls
+
+
+class PathStats(object):
+    """
+    All stats for a single key path: the base key, and one accumulator
+    per value type seen at that path. `timestamp_layout` caches the matcher
+    for the last timestamp layout seen at the path, and
+    `timestamp_rejected` the last layout that can't be a timestamp; neither
+    is exported.
+    Accumulators are created with the path's StatsOptions.
+    """
+
+    __slots__ = ('base_key', 'types', 'timestamp_layout',
+                 'timestamp_rejected', 'options')
+
+    def __init__(self, base_key=None, options=None):
+        self.base_key = base_key
+        self.types = {}
+        self.timestamp_layout = None
+        self.timestamp_rejected = None
+        self.options = options
+
+    def update(self, acc_cls, value):
+        """Update the `acc_cls` accumulator for this path in place"""
+        acc = self.types.get(acc_cls.name)
+        if acc is None:
+            acc = self.types[acc_cls.name] = acc_cls(self.options)
+        acc.update(value)
+
+    def update_many(self, acc_cls, values):
+        """Update the `acc_cls` accumulator with a sequence of values"""
+        acc = self.types.get(acc_cls.name)
+        if acc is None:
+            acc = self.types[acc_cls.name] = acc_cls(self.options)
+        acc.update_many(values)
+
+    def merge(self, other):
+        """Merge another PathStats into this one in place"""
+        if not self.base_key:
+            self.base_key = other.base_key
+        if self.options is None:
+            self.options = other.options
+        types = self.types
+        for name, other_acc in other.types.items():
+            acc = types.get(name)
+            if acc is None:
+                types[name] = other_acc.copy()
+            else:
+                acc.merge(other_acc)
+        return self
+
+    def copy(self):
+        return PathStats(self.base_key, self.options).merge(self)
+
+    def to_dict(self):
+        stats = dict((name, acc.to_dict()) for name, acc in self.types.items())
+        stats['base_key'] = self.base_key
+        return stats
+
+    def to_state(self):
+        """Raw state of every accumulator, see CountStats.to_state"""
+        return {'base_key': self.base_key,
+                'types': dict((name, acc.to_state())
+                              for name, acc in self.types.items())}
+
+    @classmethod
+    def from_dict(cls, stats):
+        new = cls(stats.get('base_key'))
+        for name, type_stats in stats.items():
+            if name != 'base_key':
+                new.types[name] = accumulator_class(name).from_dict(type_stats)
+        return new
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a PathStats from to_state"""
+        new = cls(state.get('base_key'))
+        for name, type_state in state['types'].items():
+            new.types[name] = accumulator_class(name).from_state(type_state)
+        return new
+
+    @classmethod
+    def coerce(cls, stats):
+        """Return `stats` as a PathStats, converting from a dict if needed"""
+        if isinstance(stats, cls):
+            return stats
+        return cls.from_dict(stats)
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Backends
+-------
+
+Execution backends that map a function over partitions, and the reduction
+used to merge their partial results
+
+"""
+from __future__ import absolute_import, print_function, division
+
+from concurrent import futures
+from functools import reduce
+from itertools import chain, islice
+import multiprocessing
+
+from malort.metrics import clock
+
+
+class Backend(object):
+    """
+    Base class for execution backends. Subclasses implement `map`, which
+    applies a function to each item and yields the results as they complete.
+    Backends can be used as context managers, and are closed on exit.
+    """
+
+    name = None
+
+    def map(self, func, items):
+        """
+        Yield func(item) for each item in the iterable `items`, in
+        completion order. Closing the generator cancels outstanding work.
+        """
+        raise NotImplementedError
+
+    def submit(self, func, *args):
+        """
+        Run func(*args) on a worker and return a concurrent.futures.Future
+        for its result. Runs in the calling thread unless overridden.
+        """
+        future = futures.Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def close(self):
+        """Release workers. The backend can't be used afterwards."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SerialBackend(Backend):
+    """Run everything in the calling thread, in order"""
+
+    name = 'serial'
+
+    def __init__(self, workers=None):
+        self.workers = 1
+
+    def map(self, func, items):
+        for item in items:
+            yield func(item)
+
+
+class ExecutorBackend(Backend):
+    """
+    Backend on a concurrent.futures executor. At most `max_pending` items
+    are submitted at a time, so `items` can be a lazy iterable of any length.
+
+    Parameters
+    ----------
+    workers: int, default None
+        Number of workers; defaults to the number of CPUs
+    max_pending: int, default None
+        Maximum number of submitted but unfinished items; defaults to twice
+        the number of workers
+    """
+
+    executor_class = None
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_pending = max_pending or 2 * self.workers
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self.executor_class(self.workers)
+        return self._executor
+
+    def map(self, func, items):
+        items = iter(items)
+        pending = set()
+        try:
+            while True:
+                for item in items:
+                    pending.add(self.executor.submit(func, item))
+                    if len(pending) >= self.max_pending:
+                        break
+                if not pending:
+                    return
+                done, pending = futures.wait(
+                    pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def submit(self, func, *args):
+        return self.executor.submit(func, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class ThreadBackend(ExecutorBackend):
+    """
+    Thread pool backend. Parsing holds the GIL, so this mostly helps when
+    reads are slow (network filesystems) rather than for CPU-bound runs.
+    """
+
+    name = 'thread'
+    executor_class = futures.ThreadPoolExecutor
+
+
+class ProcessBackend(ExecutorBackend):
+    """
+    Process pool backend, for parallel parsing across all cores of a
+    machine. Functions and items must be picklable.
+    """
+
+    name = 'process'
+    executor_class = futures.ProcessPoolExecutor
+
+
+class DaskBackend(Backend):
+    """
+    Backend on dask.bag, for running on a dask scheduler. Requires dask,
+    which is imported on first use. Items are materialized into one bag, and
+    results are returned once all of them have been computed.
+
+    Parameters
+    ----------
+    workers: int, default None
+        Unused; the dask scheduler decides parallelism
+    scheduler: string or callable, default None
+        Passed through to compute(), e.g. 'threads' or a distributed
+        client's get
+    """
+
+    name = 'dask'
+
+    def __init__(self, workers=None, scheduler=None):
+        self.workers = workers
+        self.scheduler = scheduler
+
+    def map(self, func, items):
+        import dask.bag as db
+
+        items = list(items)
+        if not items:
+            return
+        bag = db.from_sequence(items, npartitions=len(items)).map(func)
+        kwargs = {}
+        if self.scheduler is not None:
+            kwargs['scheduler'] = self.scheduler
+        for result in bag.compute(**kwargs):
+            yield result
+
+
+class AutoBackend(Backend):
+    """
+    Default backend: maps over a single item in the calling thread, and over
+    more than one on a process pool, started on first use. Small runs don't
+    pay for starting worker processes, and a backend used for several maps
+    starts its pool at most once.
+    """
+
+    name = 'auto'
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._serial = SerialBackend()
+        self._process = None
+        self._current = self._serial
+
+    def map(self, func, items):
+        items = iter(items)
+        head = list(islice(items, 2))
+        if len(head) > 1:
+            if self._process is None:
+                self._process = ProcessBackend(self.workers)
+            self._current = self._process
+        else:
+            self._current = self._serial
+        results = self._current.map(func, chain(head, items))
+        try:
+            for result in results:
+                yield result
+        finally:
+            results.close()
+
+    def submit(self, func, *args):
+        """Submit to the backend chosen by the last map"""
+        return self._current.submit(func, *args)
+
+    def close(self):
+        if self._process is not None:
+            self._process.close()
+            self._process = None
+
+
+BACKENDS = dict((cls.name, cls) for cls in [SerialBackend, ThreadBackend,
+                                             ProcessBackend, DaskBackend,
+                                             AutoBackend])
+
+
+def get_backend(backend='auto', workers=None):
+    """
+    Return a Backend instance. `backend` is one of 'auto', 'serial',
+    'thread', 'process' or 'dask', or a Backend instance, which is returned
+    as is.
+    """
+    if isinstance(backend, Backend):
+        return backend
+    try:
+        backend_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Unknown backend {!r}, expected one of {}'.format(
+            backend, ', '.join(sorted(BACKENDS))))
+    return backend_class(workers)
+
+
+def apply_indexed(func, item):
+    """Apply `func` to the value of an (index, value) pair, keeping the index"""
+    index, value = item
+    return index, func(value)
+
+
+def reduce_node(binop, values):
+    """
+    Reduce the children of a tree_reduce node left to right, and return
+    (value, seconds taken)
+    """
+    start = clock()
+    value = reduce(binop, values)
+    return value, clock() - start
+
+
+def tree_reduce(binop, items, fan_in=8, submit=None, on_merge=None):
+    """
+    Reduce `items` with `binop` over a balanced tree with `fan_in` children
+    per node, children reduced left to right in index order.
+
+    `items` are (index, value) pairs, with indexes 0 to n - 1, in any order,
+    e.g. from Backend.map over apply_indexed. The shape of the tree only
+    depends on n and `fan_in`, so the result does not depend on the order
+    items arrive in, or on where nodes are reduced. Nodes are reduced as
+    soon as all their children have arrived, so reducing a backend's
+    results overlaps with the work still running. Returns None for no
+    items.
+
+    With `submit` (e.g. Backend.submit), complete nodes are reduced on the
+    backend's workers, in parallel with each other and with the remaining
+    items; only the incomplete last node of each level, which includes the
+    root, is reduced in the calling thread once all items have arrived.
+    Without it, every node is reduced in the calling thread.
+
+    Parameters
+    ----------
+    binop: callable
+        binop(accum, value), returning the combined value. May update and
+        return `accum`. Must be picklable for the process backend.
+    items: iterable of (int, object)
+    fan_in: int, default 8
+        Number of children per node, at least 2
+    submit: callable, default None
+        submit(func, *args), returning a concurrent.futures.Future
+    on_merge: callable, default None
+        Called with the seconds taken by each node's reduction
+    """
+    if fan_in < 2:
+        raise ValueError('fan_in must be at least 2, got {}'.format(fan_in))
+
+    levels = []
+    pending = {}
+    # Cleared once all items are in, to reduce the last nodes here
+    offload = [submit]
+
+    def merged(level, index, result):
+        value, seconds = result
+        if on_merge is not None:
+            on_merge(seconds)
+        add(level, index, value)
+
+    def add(level, index, value):
+        while True:
+            if level == len(levels):
+                levels.append({})
+            nodes = levels[level]
+            nodes[index] = value
+            first = index - index % fan_in
+            children = range(first, first + fan_in)
+            if not all(i in nodes for i in children):
+                return
+            values = [nodes.pop(i) for i in children]
+            level, index = level + 1, first // fan_in
+            if offload[0] is not None:
+                pending[offload[0](reduce_node, binop, values)] = (level,
+                                                                   index)
+                return
+            value, seconds = reduce_node(binop, values)
+            if on_merge is not None:
+                on_merge(seconds)
+
+    def collect(wait):
+        if wait:
+            done = futures.wait(pending,
+                                return_when=futures.FIRST_COMPLETED).done
+        else:
+            done = [future for future in pending if future.done()]
+        for future in done:
+            level, index = pending.pop(future)
+            merged(level, index, future.result())
+
+    count = 0
+    try:
+        for index, value in items:
+            add(0, index, value)
+            count += 1
+            if pending:
+                collect(wait=False)
+        while pending:
+            collect(wait=True)
+    finally:
+        for future in pending:
+            future.cancel()
+    if not count:
+        return None
+
+    # Reduce the incomplete last node of each level, left to right
+    offload[0] = None
+    level, size = 0, count
+    while size > 1:
+        nodes = levels[level]
+        if nodes:
+            first = min(nodes)
+            values = [nodes.pop(i) for i in sorted(nodes)]
+            if len(values) == 1:
+                add(level + 1, first // fan_in, values[0])
+            else:
+                merged(level + 1, first // fan_in,
+                       reduce_node(binop, values))
+        level, size = level + 1, -(-size // fan_in)
+    return levels[level].pop(0)
+
+
+def prefix_reduce(binop, items, check=None, every=1):
+    """
+    Reduce (index, value) items with `binop` strictly in index order,
+    holding back items that arrive early. If `check` is given, it is called
+    as check(accum, count) after every `every` items are reduced, and
+    reduction stops early if it returns True.
+
+    Since only a prefix of the items is ever reduced, the result of an
+    early stop doesn't depend on the order items arrived in.
+
+    Returns
+    -------
+    (result, number of items reduced)
+    """
+    held = {}
+    accum = None
+    count = 0
+    for index, value in items:
+        held[index] = value
+        while count in held:
+            value = held.pop(count)
+            accum = value if accum is None else binop(accum, value)
+            count += 1
+            if (check is not None and count % every == 0
+                    and check(accum, count)):
+                return accum, count
+    return accum, count
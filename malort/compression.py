@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Compression
+-------
+
+Compressed input: codec detection, streaming decompression, and splitting
+multi-member files (BGZF gzip, multi-frame or seekable zstd) into ranges
+that can be read in parallel
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import bz2
+import gzip
+import io
+import mmap
+from os.path import splitext
+import struct
+import threading
+import zlib
+
+try:
+    from queue import Empty, Full, Queue
+except ImportError:
+    from Queue import Empty, Full, Queue
+
+from malort.remote import is_remote
+
+
+GZIP, BZ2, XZ, ZSTD = 'gzip', 'bz2', 'xz', 'zstd'
+EXTENSIONS = {'.gz': GZIP, '.gzip': GZIP, '.bz2': BZ2, '.xz': XZ,
+              '.zst': ZSTD, '.zstd': ZSTD}
+MAGIC = [(b'\x1f\x8b', GZIP), (b'BZh', BZ2), (b'\xfd7zXZ\x00', XZ),
+         (b'\x28\xb5\x2f\xfd', ZSTD)]
+
+# Compressed bytes fed to a decompressor at a time
+CHUNKSIZE = 256 << 10
+
+ZSTD_MAGIC = 0xFD2FB528
+ZSTD_SKIPPABLE = 0x184D2A50
+
+
+def strip_codec_extension(filepath):
+    """'data.json.gz' -> 'data.json'; other paths are returned as is"""
+    base, ext = splitext(filepath)
+    return base if ext.lower() in EXTENSIONS else filepath
+
+
+def detect_codec(filepath):
+    """
+    Return the codec of a file, 'gzip', 'bz2', 'xz' or 'zstd', from its
+    extension or else its magic bytes, or None if it isn't compressed
+    """
+    codec = EXTENSIONS.get(splitext(filepath)[1].lower())
+    if codec is not None:
+        return codec
+    if is_remote(filepath):
+        head = filepath.read_range(0, 6)
+    else:
+        with open(filepath, 'rb') as fread:
+            head = fread.read(6)
+    for magic, codec in MAGIC:
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('Reading zstd files requires the zstandard '
+                          'package: pip install malort[zstd]')
+    return zstandard
+
+
+def decompressor(codec):
+    """
+    Return a decompressor object for one member (gzip member, bz2 or xz
+    stream, zstd frame) of `codec`, with decompress(), eof and unused_data
+    """
+    if codec == GZIP:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if codec == BZ2:
+        return bz2.BZ2Decompressor()
+    if codec == XZ:
+        import lzma
+        return lzma.LZMADecompressor()
+    if codec == ZSTD:
+        return _zstandard().ZstdDecompressor().decompressobj()
+    raise ValueError('Unknown codec {!r}'.format(codec))
+
+
+def open_file(filepath, codec=None):
+    """
+    Open a file or malort.remote.RemoteObject for binary reads,
+    decompressing it if `codec` (or the codec detected from the file, if
+    None) says it is compressed
+    """
+    codec = codec or detect_codec(filepath)
+    if is_remote(filepath):
+        return _open_remote(filepath, codec)
+    if codec is None:
+        return open(filepath, 'rb')
+    if codec == GZIP:
+        return gzip.open(filepath, 'rb')
+    if codec == BZ2:
+        return bz2.BZ2File(filepath, 'rb')
+    if codec == XZ:
+        import lzma
+        return lzma.open(filepath, 'rb')
+    fread = open(filepath, 'rb')
+    reader = _zstandard().ZstdDecompressor().stream_reader(
+        fread, read_across_frames=True, closefd=True)
+    return io.BufferedReader(reader)
+
+
+def open_raw(filepath):
+    """Open a local file or a malort.remote.RemoteObject for binary reads,
+    without decompressing it"""
+    if is_remote(filepath):
+        return filepath.open()
+    return open(filepath, 'rb')
+
+
+def _open_remote(obj, codec):
+    fread = io.BufferedReader(obj.open(), CHUNKSIZE)
+    if codec is None:
+        return fread
+    if codec == GZIP:
+        return gzip.GzipFile(fileobj=fread, mode='rb')
+    if codec == BZ2:
+        return bz2.BZ2File(fread, 'rb')
+    if codec == XZ:
+        import lzma
+        return lzma.open(fread, 'rb')
+    return io.BufferedReader(_zstandard().ZstdDecompressor().stream_reader(
+        fread, read_across_frames=True, closefd=True))
+
+
+def iter_members(fileobj, codec, chunksize=CHUNKSIZE):
+    """
+    Decompress `fileobj` from its current position, yielding
+    (member_start, data), where member_start is the file offset of the
+    member (see decompressor) that `data` came from. Each member gets a
+    fresh decompressor, so concatenated members are all read.
+    """
+    position = member = fileobj.tell()
+    decomp = decompressor(codec)
+    fed = False
+    while True:
+        chunk = fileobj.read(chunksize)
+        if not chunk:
+            break
+        position += len(chunk)
+        while chunk:
+            fed = True
+            data = decomp.decompress(chunk)
+            if data:
+                yield member, data
+            if not decomp.eof:
+                break
+            chunk = decomp.unused_data
+            member = position - len(chunk)
+            decomp = decompressor(codec)
+            fed = False
+    if fed and not decomp.eof:
+        raise EOFError('Compressed file ended before the end-of-stream '
+                       'marker was reached')
+
+
+def gzip_member_size(buf, pos):
+    """
+    Size of the gzip member at `pos` from its BGZF header (an extra field
+    with a 'BC' subfield holding the member size), or None if it has none
+    """
+    if buf[pos:pos + 2] != b'\x1f\x8b' or not ord(buf[pos + 3:pos + 4]) & 4:
+        return None
+    xlen, = struct.unpack('<H', buf[pos + 10:pos + 12])
+    field = pos + 12
+    while field + 4 <= pos + 12 + xlen:
+        sid, slen = buf[field:field + 2], struct.unpack(
+            '<H', buf[field + 2:field + 4])[0]
+        if sid == b'BC' and slen == 2:
+            return struct.unpack('<H', buf[field + 4:field + 6])[0] + 1
+        field += 4 + slen
+    return None
+
+
+def zstd_frame_size(buf, pos):
+    """
+    Size of the zstd frame (or skippable frame) at `pos`, found by walking
+    its block headers without decompressing, or None if it isn't one
+    """
+    if len(buf) - pos < 8:
+        return None
+    magic, = struct.unpack('<I', buf[pos:pos + 4])
+    if magic & 0xFFFFFFF0 == ZSTD_SKIPPABLE:
+        return 8 + struct.unpack('<I', buf[pos + 4:pos + 8])[0]
+    if magic != ZSTD_MAGIC:
+        return None
+    descriptor = ord(buf[pos + 4:pos + 5])
+    single_segment = descriptor >> 5 & 1
+    fcs_size = [single_segment, 2, 4, 8][descriptor >> 6]
+    dict_size = [0, 1, 2, 4][descriptor & 3]
+    block = pos + 5 + (not single_segment) + dict_size + fcs_size
+    while True:
+        if block + 3 > len(buf):
+            return None
+        header, = struct.unpack('<I', buf[block:block + 3] + b'\x00')
+        block_type = header >> 1 & 3
+        if block_type == 3:
+            return None
+        block += 3 + (1 if block_type == 1 else header >> 3)
+        if header & 1:
+            break
+    if descriptor >> 2 & 1:
+        block += 4
+    return block - pos if block <= len(buf) else None
+
+
+MEMBER_SIZE = {GZIP: gzip_member_size, ZSTD: zstd_frame_size}
+
+
+def member_offsets(filepath, codec):
+    """
+    Return the file offsets of the members of a compressed file, if they
+    can be found without decompressing it: BGZF gzip blocks or zstd
+    frames in local files. None for other codecs and remote objects, or
+    files with members of unknown size.
+    """
+    member_size = MEMBER_SIZE.get(codec)
+    if member_size is None or is_remote(filepath):
+        return None
+    offsets = []
+    with open(filepath, 'rb') as fread:
+        try:
+            buf = mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError, IOError, mmap.error):
+            return None
+        try:
+            pos = 0
+            while pos < len(buf):
+                size = member_size(buf, pos)
+                if not size:
+                    return None
+                offsets.append(pos)
+                pos += size
+        finally:
+            buf.close()
+    return offsets
+
+
+def member_ranges(filepath, codec, blocksize):
+    """
+    Return (start, stop) ranges of compressed bytes, of about `blocksize`
+    each and aligned to members (see member_offsets), for
+    malort.readers.iter_file_records. [(0, None)] if the file can't be
+    split.
+    """
+    offsets = member_offsets(filepath, codec)
+    if not offsets:
+        return [(0, None)]
+    starts = [0]
+    for offset in offsets:
+        if offset >= starts[-1] + blocksize:
+            starts.append(offset)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def prefetch(iterable, depth=4):
+    """
+    Iterate over `iterable` in a background thread, up to `depth` items
+    ahead of the consumer, so that decompression (zlib, bz2 and lzma
+    release the GIL) overlaps with parsing. Errors are re-raised in the
+    consumer; if the consumer stops early, the producer stops and closes
+    `iterable`.
+    """
+    queue = Queue(depth)
+    done = threading.Event()
+    end = object()
+
+    def put(item):
+        while not done.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except BaseException as e:
+            put((end, e))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        done.set()
+        # Make room for a producer blocked on a full queue, so it can see
+        # that we're done
+        try:
+            while True:
+                queue.get_nowait()
+        except Empty:
+            pass
+        thread.join()
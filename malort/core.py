@@ -11,52 +11,462 @@ from __future__ import absolute_import, print_function, division
 from collections import defaultdict
 from functools import partial
 import json
-import os
-from os.path import isfile, join, splitext
 import random
 import re
 import time
 
-import dask.bag as db
-
-from malort.stats import recur_dict, combine_stats, dict_generator
+from malort.accumulators import PathStats, StatsOptions
+from malort.backends import (apply_indexed, get_backend, prefix_reduce,
+                             tree_reduce)
+from malort.decoders import get_decoder
+from malort.manifest import update_state
+from malort.metrics import Metrics, clock, measure_partition
+from malort.readers import BLOCKSIZE, plan_partitions
+from malort.snapshots import read_snapshot, write_snapshot
+from malort.sources import get_source
+from malort.sampling import (Sampling, merge_reservoirs, partition_reservoir,
+                             sample_file_list, sample_notes)
+from malort.stats import (recur_dict, catch_json_error, combine_stats,
+                          dict_generator, export_stats,
+                          hashed_partition_stats, partition_stats,
+                          ShapeCache)
 from malort.type_mappers import TypeMappers
 
 
-def analyze(path, parse_timestamps=True, **kwargs):
+def analyze(path, delimiter='\n', parse_timestamps=True, shape_cache_size=256,
+            blocksize=BLOCKSIZE, backend='auto', workers=None,
+            merge_fan_in=8, state_dir=None, hash_files=False, sampling=None,
+            converge_every=None, converge_checks=3, distinct_precision=None,
+            top_k=10, sample_size=3, batch_size=1024, decoder='auto',
+            stream_arrays=False, recursive=False, include=None, exclude=None,
+            max_depth=None, min_size=None, max_size=None,
+            modified_after=None, modified_before=None, partition_filter=None,
+            metrics=None, **kwargs):
     """
     Analyze a given directory of either .json or flat text files
     with delimited JSON to get relevant key statistics.
 
     Parameters
     ----------
-    path: string
-        Path to directory
+    path: string or source
+        Path to directory, or a source from malort.sources: S3Source for
+        an S3-compatible bucket, or HTTPSource for a list of URLs. Remote
+        objects are read with concurrent range requests in each worker,
+        overlapped with parsing.
+    delimiter: string, default '\\n'
+        Delimiter for text files with delimited JSON
     parse_timestamps: boolean, default True
         If True, will attempt to regex match ISO8601 formatted parse_timestamps
+    shape_cache_size: int, default 256
+        Number of distinct record shapes (key layouts) to cache flattened
+        field plans for. Records with a cached shape skip the recursive
+        walk. Set to 0 to disable.
+    blocksize: int, default 64 MB
+        Target bytes per partition. Delimited files larger than this are
+        split into byte ranges that are analyzed in parallel; smaller files
+        are grouped together. .json files are never split.
+    backend: string or malort.backends.Backend, default 'auto'
+        How partitions are run: 'serial', 'thread', 'process' (one worker
+        process per CPU), or 'dask' (requires dask). 'auto' runs a single
+        partition in this process, and more than one like 'process'. A
+        Backend instance is used as is, and left open.
+    workers: int, default None
+        Number of workers for the thread and process backends; defaults to
+        the number of CPUs
+    merge_fan_in: int, default 8
+        Number of partition results merged at each node of the reduction
+        tree. Complete nodes are merged on the backend's workers, in
+        parallel with the partitions still running; what is left once all
+        partitions are in (the last, incomplete node of each level) is
+        merged in this process.
+        Results are merged in partition order, so stats don't depend on
+        which partitions finish first or where they were merged.
+    state_dir: string, default None
+        Analyze incrementally, keeping a manifest of analyzed files and
+        their stats in this directory. Later runs with the same state_dir
+        only parse new files; if an analyzed file is modified or deleted,
+        the batch of files it was analyzed with (at most 1000 files and
+        1 GB) is recomputed. See malort.manifest.update_state.
+    hash_files: boolean, default False
+        With state_dir, record content hashes, so files whose mtime changed
+        but whose contents didn't are not recomputed. New files are hashed
+        as they are parsed, except for those read in ranges.
+    sampling: malort.sampling.Sampling, default None
+        Analyze a sample: a record budget, a fraction of the files, or the
+        first records of each file, with a seed. The options and seed are
+        recorded in `result.sampling` so the run can be repeated.
+    converge_every: int, default None
+        Stop early once the schema converges: every `converge_every`
+        partitions, check the Redshift types of the stats so far, and stop
+        reading after `converge_checks` consecutive checks with no new
+        paths and no type or width changes. Partitions are read in file
+        name order. `result.convergence` records when and why the run
+        stopped. Partition results are merged in order rather than with
+        merge_fan_in.
+    converge_checks: int, default 3
+        Number of consecutive unchanged checks needed to stop
+    distinct_precision: int, default None
+        Estimate the number of distinct values of each str, int and float
+        field with a HyperLogLog of 2 ** distinct_precision registers
+        (4 to 18; 12 uses 4 KB per field and type, with about 1.6% error),
+        reported as approx_distinct. Off by default.
+    top_k: int, default 10
+        Track the most frequent values of each str field with this many
+        Space-Saving counters, reported as top_k: [value, count, error]
+        lists, where the true count is between count - error and count.
+        0 to disable.
+    sample_size: int, default 3
+        Size of the uniform random sample of each str field's values
+    batch_size: int, default 1024
+        Records decoded into per-field columns before they are added to the
+        stats (see malort.stats.batch_stats), which roughly halves the time
+        spent on stats. The stats are the same as with 0, which adds one
+        record at a time, up to float rounding in the unrounded state.
+    decoder: string, default 'auto'
+        JSON decoder: 'json' for the standard library, or 'orjson',
+        'simdjson' or 'ujson'. 'auto' uses the first of those installed,
+        or 'json' if kwargs are given. Results are the same with every
+        decoder; see malort.decoders.get_decoder.
+    stream_arrays: boolean, default False
+        Analyze each element of a .json file's top-level array as a record,
+        rather than the whole document. Files are scanned incrementally, so
+        memory use doesn't grow with the file size, and files larger than
+        blocksize are split at element boundaries for the backend, after a
+        scan to find them (see malort.readers.array_ranges).
+    recursive: boolean, default False
+        Also analyze the files in subdirectories. The tree is listed as it
+        is analyzed, so a large tree starts processing before the listing
+        finishes (except with state_dir, sampling or converge_every, which
+        need the whole list).
+    include, exclude: glob string, compiled regex, or list, default None
+        Only analyze files matching include, and skip files and
+        directories matching exclude. Globs with a '/' match the path
+        relative to `path`, others the file or directory name.
+    max_depth: int, default None
+        With recursive, the deepest subdirectory level to walk
+    min_size, max_size: int, default None
+        Only analyze files of at least / at most this many bytes
+    modified_after, modified_before: number or datetime, default None
+        Only analyze files modified at or after / at or before these epoch
+        seconds or datetimes
+    partition_filter: dict, default None
+        Prune partition directories named key=value, e.g.
+        {'day': ('2026-10-01', '2026-10-07')} for an inclusive range,
+        {'hour': ['00', '12']}, or {'region': 'eu'}. Directories whose
+        value doesn't match are never walked. See malort.sources.
+    metrics: malort.metrics.Metrics, default None
+        Collects the run's timings, as `result.metrics`. Pass one to log
+        them, or to be called as each partition and the run finish.
     kwargs:
         passed into json.loads. Here you can specify encoding, etc.
     """
 
+    start_time = time.time()
+    get_decoder(decoder, **kwargs)  # Fail early on a bad decoder option
+    if metrics is None:
+        metrics = Metrics()
+    elif metrics.elapsed is not None:
+        raise ValueError('metrics was already used for a run')
+    sampling = sampling or Sampling()
+    source = get_source(path)
+    file_list = metrics.timed_iter('list', source.list_files(
+        recursive=recursive, include=include, exclude=exclude,
+        max_depth=max_depth, min_size=min_size, max_size=max_size,
+        modified_after=modified_after, modified_before=modified_before,
+        partition_filter=partition_filter))
+    if (state_dir is not None or converge_every is not None
+            or sampling != Sampling()):
+        file_list = list(file_list)
+    options = StatsOptions(distinct_precision, top_k, sample_size)
+    run = partial(analyze_files, delimiter=delimiter,
+                  parse_timestamps=parse_timestamps,
+                  shape_cache_size=shape_cache_size, blocksize=blocksize,
+                  backend=backend, workers=workers, merge_fan_in=merge_fan_in,
+                  head=sampling.head, options=options, batch_size=batch_size,
+                  decoder=decoder, stream_arrays=stream_arrays,
+                  metrics=metrics, **kwargs)
+    sampled = convergence = None
+    if converge_every is not None and (state_dir is not None
+                                       or sampling.records is not None):
+        raise ValueError('converge_every cannot be used with state_dir or '
+                         'a record budget')
+    if sampling != Sampling():
+        if state_dir is not None:
+            raise ValueError('Sampling cannot be used with state_dir')
+        if sampling.seed is None:
+            sampling = sampling._replace(seed=random.randrange(2 ** 32))
+        sampled = dict(sampling._asdict(), files_total=len(file_list))
+        if sampling.files is not None:
+            file_list = sample_file_list(file_list, sampling.files,
+                                         sampling.seed)
+        sampled['files_sampled'] = len(file_list)
+
+    if sampling.records is not None:
+        stats, sampled['records_seen'] = reservoir_stats(
+            file_list, sampling.records, sampling.seed, delimiter=delimiter,
+            parse_timestamps=parse_timestamps,
+            shape_cache_size=shape_cache_size, blocksize=blocksize,
+            backend=backend, workers=workers, head=sampling.head,
+            options=options, decoder=decoder, stream_arrays=stream_arrays,
+            metrics=metrics, **kwargs)
+    elif converge_every is not None:
+        stats, convergence = converged_stats(
+            file_list, converge_every, converge_checks, delimiter=delimiter,
+            parse_timestamps=parse_timestamps,
+            shape_cache_size=shape_cache_size, blocksize=blocksize,
+            backend=backend, workers=workers, head=sampling.head,
+            options=options, batch_size=batch_size, decoder=decoder,
+            stream_arrays=stream_arrays, metrics=metrics, **kwargs)
+    elif state_dir is None:
+        stats = run(file_list)
+    else:
+        state_options = {'delimiter': delimiter,
+                         'parse_timestamps': parse_timestamps,
+                         'stats_options': dict(
+                             (k, v) for k, v in options._asdict().items()
+                             if k != 'salt'),
+                         'stream_arrays': stream_arrays,
+                         'json_kwargs': repr(sorted(kwargs.items()))}
+        # One backend for all the batches analyzed
+        runner = get_backend(backend, workers)
+        try:
+            stats = update_state(state_dir, source.root, file_list,
+                                 partial(run, backend=runner), state_options,
+                                 hash_files)
+        finally:
+            if runner is not backend:
+                runner.close()
+    count = stats.get("total_records", 0)
+
+    elapsed = metrics.elapsed = time.time() - start_time
+    message = ('Malort run finished: {} JSON blobs analyzed in {} seconds.'
+               .format(count, elapsed))
+    if metrics.logger is None:
+        print(message)
+    else:
+        metrics.logger.info(message)
+        metrics.logger.info('Malort metrics: %s', metrics.summary())
+    result = MalortResult.from_state(stats, elapsed, sampled, convergence,
+                                     metrics=metrics)
+    if metrics.on_finish is not None:
+        metrics.on_finish(result)
+    return result
+
+
+def map_partitions(func, partitions, reducer, backend='auto',
+                   workers=None):
+    """
+    Run `func` over `partitions` on a backend, and return
+    reducer(results). Work still pending when the reducer returns is
+    cancelled.
+    """
+    runner = get_backend(backend, workers)
+    results = runner.map(func, partitions)
+    try:
+        return reducer(results)
+    finally:
+        if hasattr(results, 'close'):
+            results.close()
+        if runner is not backend:
+            runner.close()
+
+
+def analyze_files(file_list, delimiter='\n', parse_timestamps=True,
+                  shape_cache_size=256, blocksize=BLOCKSIZE, backend='auto',
+                  workers=None, merge_fan_in=8, head=None,
+                  options=None, batch_size=1024, decoder='auto',
+                  stream_arrays=False, metrics=None, hashes=None,
+                  **kwargs):
+    """
+    Return the raw stats dict, with total_records, for a list (or
+    iterable) of files. See analyze for the parameters; `head` is
+    analyze's sampling.head. With a malort.metrics.Metrics, partition and
+    merge timings are added to it. With a `hashes` dict, the SHA-1 digests
+    of the files read whole are added to it as they are parsed, keyed by
+    str(filepath) (see malort.readers.iter_partition_records).
+    """
+    partitions = plan_partitions(file_list, blocksize, split=head is None,
+                                 stream_arrays=stream_arrays)
+    func = partial(partition_stats if hashes is None
+                   else hashed_partition_stats, delimiter=delimiter,
+                   parse_timestamps=parse_timestamps,
+                   shape_cache_size=shape_cache_size, head=head,
+                   options=options, batch_size=batch_size, decoder=decoder,
+                   stream_arrays=stream_arrays, **kwargs)
+    runner = get_backend(backend, workers)
+    on_merge = None if metrics is None else partial(metrics.add_phase,
+                                                    'merge')
+    reducer = partial(tree_reduce, combine_stats, fan_in=merge_fan_in,
+                      submit=runner.submit, on_merge=on_merge)
+    if hashes is not None:
+        reducer = collect_hashes(reducer, hashes)
+    if metrics is None:
+        mapper = partial(apply_indexed, func)
+    else:
+        mapper = partial(measure_partition, func)
+        reducer = metrics.reducer(reducer)
+    try:
+        stats = map_partitions(mapper, enumerate(partitions), reducer,
+                               runner)
+    finally:
+        if runner is not backend:
+            runner.close()
+    return stats or {}
+
+
+def collect_hashes(reduce_func, hashes):
+    """
+    Wrap reduce_func(results) to take (index, (stats, digests)) results
+    from hashed_partition_stats, adding the digests to `hashes`
+    """
+    def reduce_hashed(results):
+        def split():
+            for index, (stats, digests) in results:
+                hashes.update(digests)
+                yield index, stats
+        return reduce_func(split())
+    return reduce_hashed
+
+
+def converged_stats(file_list, every, checks=3, delimiter='\n',
+                    parse_timestamps=True, shape_cache_size=256,
+                    blocksize=BLOCKSIZE, backend='auto', workers=None,
+                    head=None, options=None, batch_size=1024, decoder='auto',
+                    stream_arrays=False, metrics=None, **kwargs):
+    """
+    Return (stats, convergence) for a list of files, stopping early once
+    the inferred schema stops changing.
+
+    Partition results are merged in partition order, and after every
+    `every` partitions the Redshift types of the stats so far are compared
+    with the previous check. After `checks` consecutive checks with the same
+    paths and types (including widths, e.g. varchar(12)), no more
+    partitions are started and pending ones are cancelled. The stats only
+    cover the partitions merged up to that point, so they don't depend on
+    which partitions happened to finish first.
+
+    `convergence` describes when and why the run stopped: 'converged',
+    'reason', 'partitions_read', 'partitions_total', 'checks' and
+    'elapsed' (seconds from the start of the run to the stop).
+    """
+    if every < 1 or checks < 1:
+        raise ValueError('converge_every and converge_checks must be at '
+                         'least 1')
+    start_time = time.time()
+    partitions = list(plan_partitions(file_list, blocksize,
+                                      split=head is None,
+                                      stream_arrays=stream_arrays))
+    func = partial(partition_stats, delimiter=delimiter,
+                   parse_timestamps=parse_timestamps,
+                   shape_cache_size=shape_cache_size, head=head,
+                   options=options, batch_size=batch_size, decoder=decoder,
+                   stream_arrays=stream_arrays, **kwargs)
+    progress = {'types': None, 'unchanged': 0, 'checks': 0}
+
+    def check(stats, count):
+        result = MalortResult.from_state(stats)
+        types = result.get_redshift_types()
+        progress['checks'] += 1
+        if types == progress['types']:
+            progress['unchanged'] += 1
+        else:
+            progress['types'], progress['unchanged'] = types, 0
+        return progress['unchanged'] >= checks
+
+    if metrics is None:
+        mapper = partial(apply_indexed, func)
+        reducer = partial(prefix_reduce, combine_stats, check=check,
+                          every=every)
+    else:
+        mapper = partial(measure_partition, func)
+        reducer = metrics.reducer(partial(
+            prefix_reduce, metrics.timed('merge', combine_stats),
+            check=check, every=every))
+    stats, count = map_partitions(mapper, enumerate(partitions), reducer,
+                                  backend, workers)
+
+    converged = count < len(partitions)
+    if converged:
+        reason = ('types unchanged for {} consecutive checks every {} '
+                  'partitions'.format(checks, every))
+    else:
+        reason = 'all partitions read'
+    convergence = {'converged': converged, 'reason': reason,
+                   'partitions_read': count,
+                   'partitions_total': len(partitions),
+                   'checks': progress['checks'],
+                   'elapsed': time.time() - start_time}
+    return stats or {}, convergence
+
+
+def reservoir_stats(file_list, size, seed, delimiter='\n',
+                    parse_timestamps=True, shape_cache_size=256,
+                    blocksize=BLOCKSIZE, backend='auto', workers=None,
+                    head=None, options=None, decoder='auto',
+                    stream_arrays=False, metrics=None, **kwargs):
+    """
+    Return (stats, records_seen) for a uniform sample of `size` records from
+    a list of files. Partitions are reservoir sampled in parallel (see
+    malort.sampling.partition_reservoir), and only the records in the
+    merged sample are parsed. With a malort.metrics.Metrics, the sampling
+    time is added to its 'sample' phase, and the decoding and stats of the
+    sample to 'decode' and 'stats'.
+    """
+    partitions = list(plan_partitions(file_list, blocksize,
+                                      split=head is None,
+                                      stream_arrays=stream_arrays))
+    func = partial(partition_reservoir, size=size, seed=seed,
+                   delimiter=delimiter, head=head,
+                   stream_arrays=stream_arrays)
+    start = clock()
+    seen, sample = map_partitions(func, partitions,
+                                  partial(merge_reservoirs, size=size),
+                                  backend, workers)
+    sampled = clock()
+
     stats = {}
+    shape_cache = ShapeCache(shape_cache_size) if shape_cache_size else None
+    loads = get_decoder(decoder, **kwargs)
+    decoded = [catch_json_error(record, filepath, loads)
+               for _, filepath, record in sample]
+    parsed = clock()
+    for value in decoded:
+        recur_dict(stats, value, parse_timestamps=parse_timestamps,
+                   shape_cache=shape_cache, options=options)
+    if metrics is not None:
+        metrics.add_phase('sample', sampled - start, seen)
+        metrics.add_phase('decode', parsed - sampled, len(sample))
+        metrics.add_phase('stats', clock() - parsed, len(sample))
+    return stats, seen
+
+
+def merge(results, merge_fan_in=8):
+    """
+    Merge the stats of several Malort runs, as if all their inputs had been
+    analyzed together. Merging uses the same semantics as combine_stats.
 
+    Parameters
+    ----------
+    results: iterable of MalortResult or snapshot paths
+        Results, or paths to snapshots written by MalortResult.to_snapshot
+    merge_fan_in: int, default 8
+        Number of results merged at each node of the reduction tree
+
+    Returns
+    -------
+    MalortResult
+    """
     start_time = time.time()
-    file_list = [os.path.join(path, f) for f in os.listdir(path)]
-    bag = db.from_filenames(file_list).map(json.loads)
-    recur_partial = partial(recur_dict, parse_timestamps=parse_timestamps)
-    stats = bag.fold(recur_partial, combine_stats, initial={}).compute()
-    count = stats["total_records"]
-    del stats["total_records"]
-
-    elapsed = time.time() - start_time
-    print('Malort run finished: {} JSON blobs analyzed in {} seconds.'
-          .format(count, elapsed))
-    return MalortResult(stats, count, elapsed)
+    states = (read_snapshot(r) if not isinstance(r, MalortResult)
+              else r.get_state() for r in results)
+    stats = tree_reduce(combine_stats, enumerate(states), merge_fan_in)
+    return MalortResult.from_state(stats or {}, time.time() - start_time)
 
 
 class MalortResult(TypeMappers):
 
-    def __init__(self, stats, blob_count, execution_time=None):
+    def __init__(self, stats, blob_count, execution_time=None, state=None,
+                 sampling=None, convergence=None, window=None, metrics=None):
         """
         Wrapper for malort stats that can generate type maps and
         DataFrames
@@ -69,10 +479,71 @@ class MalortResult(TypeMappers):
             Number of JSON blobs read into result
         execution_time: float, default None
             Execution time in seconds
+        state: dict, default None
+            Raw stats dict of PathStats accumulators that `stats` was
+            exported from, used for snapshots and merging
+        sampling: dict, default None
+            Sampling options and seed, if the result was computed from a
+            sample
+        convergence: dict, default None
+            When and why the run stopped, if it was run with converge_every
+        window: dict, default None
+            Start and end times of the window, for windowed stream stats
+        metrics: malort.metrics.Metrics, default None
+            Timings and throughput of the run that produced the result
         """
         self.stats = stats
         self.count = blob_count
         self.execution_time = execution_time
+        self.state = state
+        self.sampling = sampling
+        self.convergence = convergence
+        self.window = window
+        self.metrics = metrics
+        self.sample_notes = None
+        if sampling is not None:
+            self.sample_notes = sample_notes(stats, blob_count)
+
+    @property
+    def sampled(self):
+        """True if the result was computed from a sample of the data"""
+        return self.sampling is not None
+
+    @classmethod
+    def from_state(cls, state, execution_time=None, sampling=None,
+                   convergence=None, window=None, metrics=None):
+        """Build a result from a raw stats dict, with total_records"""
+        state = dict(state)
+        count = state.pop('total_records', 0)
+        return cls(export_stats(state), count, execution_time, state,
+                   sampling, convergence, window, metrics)
+
+    @classmethod
+    def from_snapshot(cls, filepath):
+        """Load a result from a snapshot written by to_snapshot"""
+        return cls.from_state(read_snapshot(filepath))
+
+    def get_state(self):
+        """
+        Return a copy of the raw stats dict with total_records. Results
+        built from plain stats dicts are converted, with means as rounded
+        in `stats`.
+        """
+        if self.state is not None:
+            state = dict((k, v.copy()) for k, v in self.state.items())
+        else:
+            state = dict((k, PathStats.from_dict(v))
+                         for k, v in self.stats.items())
+        state['total_records'] = self.count
+        return state
+
+    def to_snapshot(self, filepath):
+        """
+        Write the raw, mergeable state of this result to `filepath` as a
+        versioned, gzipped JSON snapshot. Snapshots can be loaded with
+        MalortResult.from_snapshot, or combined with malort.merge.
+        """
+        write_snapshot(self.get_state(), filepath)
 
     def get_conflicting_types(self):
         """Return only the stats where there are multiple types detected"""
@@ -96,8 +567,10 @@ class MalortResult(TypeMappers):
         """
         import pandas as pd
 
-        df_cols = ['key', 'base_key', 'count', 'type', 'mean', 'max', 'min',
-                   'max_precision', 'max_scale', 'fixed_length', 'sample']
+        df_cols = ['key', 'base_key', 'count', 'type', 'mean', 'stddev',
+                   'max', 'min', 'p50', 'p95', 'p99', 'p99.9',
+                   'approx_distinct', 'max_precision', 'max_scale',
+                   'fixed_length', 'sample', 'top_k']
 
         if include_db_types:
             db_type_getters = [('redshift_types', self.get_redshift_types)]
@@ -125,7 +598,7 @@ class MalortResult(TypeMappers):
 
         df = pd.DataFrame.from_dict(dictable, 'index')
 
-        return df.reindex_axis(df_cols, axis=1)
+        return df.reindex(columns=df_cols)
 
     def gen_redshift_jsonpaths(self, filepath=None):
         """Generate Redshift jsonpath file for results
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Decoders
+-------
+
+JSON decoders for records: the standard library's json, or a faster parser
+(orjson, pysimdjson or ujson) when one is installed
+
+"""
+from __future__ import absolute_import, print_function, division
+
+from functools import partial
+import json
+import re
+
+from malort.accumulators import JSONFloat
+
+
+# Third-party decoders in order of preference for 'auto': (name, module)
+FAST_DECODERS = [('orjson', 'orjson'), ('simdjson', 'simdjson'),
+                 ('ujson', 'ujson')]
+
+# Number shapes, starting from a digit, that a third-party decoder may
+# parse differently from json_loads. Other floats have at most 15
+# significant digits, so their repr reproduces their JSON text, and so
+# their precision and scale.
+SIXTEEN_DIGITS = '|'.join(r'(?<=\d{%d}\.)\d{%d}' % (k, 16 - k)
+                          for k in range(1, 16))
+INEXACT_NUMBER = r'\d(?:' + '|'.join([
+    r'\d{18}',                     # may not fit in 64 bits
+    r'[eE][-+]?\d+(?![\w.-])',     # exponents, e.g. 1e5
+    r'\.(?:\d+0(?!\d)'             # trailing zeros, e.g. 1.10
+    r'|0000'                       # under 1e-4, where repr uses exponents
+    r'|\d*[eE]'                    # e.g. 1.5e5
+    r'|' + SIXTEEN_DIGITS + ')',
+]) + ')'
+_inexact_text = re.compile(INEXACT_NUMBER)
+_inexact_bytes = re.compile(INEXACT_NUMBER.encode('ascii'))
+
+
+def json_loads(blob, **kwargs):
+    """
+    json.loads, parsing floats as JSONFloat so that precision and scale come
+    from the original JSON text. Pass `parse_float` to override.
+    """
+    if 'parse_float' not in kwargs:
+        kwargs['parse_float'] = JSONFloat
+    return json.loads(blob, **kwargs)
+
+
+def has_inexact_numbers(blob):
+    """
+    Return True if `blob` (bytes or text) may hold a number that a
+    third-party decoder could parse differently from json_loads: a float
+    whose repr doesn't reproduce its JSON text, e.g. 1.10 or 1e5, so that
+    its precision and scale would change, or an integer of 19 or more
+    digits. Number-like text inside strings can only cause false positives.
+    """
+    if isinstance(blob, bytes):
+        return _inexact_bytes.search(blob) is not None
+    return _inexact_text.search(blob) is not None
+
+
+def _import(module):
+    try:
+        return __import__(module)
+    except ImportError:
+        return None
+
+
+def available_decoders():
+    """Names of the decoders that can be used here, fastest first"""
+    return [name for name, module in FAST_DECODERS
+            if _import(module) is not None] + ['json']
+
+
+def fast_loads(parse, blob):
+    """
+    Parse `blob` with a third-party `parse` function, falling back to
+    json_loads for records with inexact numbers (see has_inexact_numbers) or
+    that `parse` rejects. Results, and errors for invalid JSON, are the
+    same as json_loads'.
+    """
+    if has_inexact_numbers(blob):
+        return json_loads(blob)
+    try:
+        return parse(blob)
+    except (ValueError, OverflowError):
+        # e.g. NaN, lone surrogates, or invalid JSON, for which json_loads
+        # gives the error message
+        return json_loads(blob)
+
+
+def get_decoder(name='auto', **kwargs):
+    """
+    Return a function that parses one JSON record, from bytes or text.
+
+    Parameters
+    ----------
+    name: string, default 'auto'
+        'json' for the standard library, 'orjson', 'simdjson' or 'ujson', or
+        'auto' for the first of those installed, falling back to 'json'.
+        All give the same results; see fast_loads.
+    kwargs:
+        passed into json.loads. Only the standard library decoder takes
+        them, so 'auto' uses it when any are given.
+    """
+    if name == 'auto':
+        name = 'json' if kwargs else available_decoders()[0]
+    if name == 'json':
+        return partial(json_loads, **kwargs)
+    modules = dict(FAST_DECODERS)
+    if name not in modules:
+        raise ValueError('Unknown JSON decoder {!r}, expected one of {}'
+                         .format(name, ['auto', 'json'] + sorted(modules)))
+    if kwargs:
+        raise ValueError('json.loads arguments {} require the json decoder'
+                         .format(sorted(kwargs)))
+    module = _import(modules[name])
+    if module is None:
+        raise ValueError('JSON decoder {!r} is not installed'.format(name))
+    return partial(fast_loads, module.loads)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Manifest
+-------
+
+Incremental analysis: a manifest of the files already analyzed, kept with
+one stats snapshot per batch of files and one of their combined stats, so
+that later runs only parse new or changed files
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import hashlib
+import json
+import os
+from os.path import exists, join
+
+from malort.backends import tree_reduce
+from malort.compression import open_raw
+from malort.remote import is_remote
+from malort.snapshots import read_snapshot, write_snapshot
+from malort.sources import relative_name
+from malort.stats import combine_stats
+
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Default maximum files and bytes per batch: a modified or deleted file
+# means its whole batch is analyzed again
+BATCH_FILES = 1000
+BATCH_BYTES = 1 << 30
+
+replace = getattr(os, 'replace', os.rename)
+
+
+def file_hash(filepath, bufsize=1 << 20):
+    """SHA-1 hex digest of a file's (or remote object's) contents"""
+    digest = hashlib.sha1()
+    with open_raw(filepath) as fread:
+        for chunk in iter(lambda: fread.read(bufsize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(filepath):
+    """
+    Return the {'size', 'mtime'} signature of a file, or of a remote
+    object from its listing
+    """
+    if is_remote(filepath):
+        return {'size': filepath.size, 'mtime': filepath.mtime}
+    stat = os.stat(filepath)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def empty_manifest(options):
+    return {'version': MANIFEST_VERSION, 'options': options, 'next_batch': 0,
+            'batches': {}}
+
+
+def load_manifest(state_dir, options):
+    """
+    Load the manifest in `state_dir`, or return an empty manifest for
+    `options` if there is none
+    """
+    path = join(state_dir, MANIFEST_NAME)
+    if not exists(path):
+        return empty_manifest(options)
+    with open(path) as fread:
+        manifest = json.load(fread)
+    if manifest.get('version', 0) > MANIFEST_VERSION:
+        raise ValueError('Manifest {} has version {}, this version of Malort '
+                         'reads up to {}'.format(path, manifest['version'],
+                                                 MANIFEST_VERSION))
+    return manifest
+
+
+def save_manifest(state_dir, manifest):
+    """Write the manifest atomically, so a crash leaves the old one intact"""
+    path = join(state_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fwrite:
+        json.dump(manifest, fwrite, indent=1, sort_keys=True)
+    replace(tmp_path, path)
+
+
+def is_unchanged(filepath, recorded, hash_files=False):
+    """
+    True if the file still matches its `recorded` signature. With
+    `hash_files`, a file whose size matches but whose mtime changed is
+    compared by content hash, so touching a file doesn't invalidate it; the
+    recorded mtime is then updated in place.
+    """
+    signature = file_signature(filepath)
+    if signature['size'] != recorded['size']:
+        return False
+    if signature['mtime'] == recorded['mtime']:
+        return True
+    if hash_files and recorded.get('hash') == file_hash(filepath):
+        recorded['mtime'] = signature['mtime']
+        return True
+    return False
+
+
+def batch_size(batch):
+    """(files, bytes) of a manifest batch"""
+    files = batch['files']
+    return len(files), sum(f['size'] for f in files.values())
+
+
+def split_batches(names, signatures, batch_files, batch_bytes):
+    """
+    Split sorted file names into consecutive runs of at most `batch_files`
+    files and (unless a single file is larger) `batch_bytes` bytes
+    """
+    batch, size = [], 0
+    for name in names:
+        if batch and (len(batch) >= batch_files
+                      or size + signatures[name]['size'] > batch_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append(name)
+        size += signatures[name]['size']
+    if batch:
+        yield batch
+
+
+def update_state(state_dir, root, file_list, analyze_files, options,
+                 hash_files=False, batch_files=None, batch_bytes=None):
+    """
+    Bring the stats stored in `state_dir` up to date with `file_list`, and
+    return the combined stats dict for all files.
+
+    Files are analyzed in batches of at most `batch_files` files and
+    `batch_bytes` bytes, each stored as a snapshot and listed in the
+    manifest with the size, mtime (and optional content hash) of its
+    files. On each run:
+
+    * Files not in any batch are analyzed in new batches.
+    * If any file in a batch was modified or deleted, that batch is
+      dropped, and its remaining files are analyzed again with the new
+      files. Stats can't be subtracted, so this is the fallback for any
+      change to files already analyzed; the batch size caps how much is
+      re-read.
+    * Consecutive batches that fit in one batch together (e.g. the small
+      batches of frequent runs) are compacted by merging their snapshots,
+      without parsing their files again.
+    * If the analysis `options` changed, all batches are dropped.
+
+    The combined stats of all batches are kept in a snapshot too, so a run
+    that only adds files reads that and the new batches' stats, rather than
+    every batch snapshot. All batches are only read again after a batch is
+    dropped.
+
+    Parameters
+    ----------
+    state_dir: string
+        Directory for the manifest and snapshots; created if needed
+    root: string
+        Directory (or source root, see malort.sources) being analyzed; the
+        manifest keys files relative to it
+    file_list: list of strings
+        Paths of the files to analyze
+    analyze_files: callable
+        analyze_files(file_list) returning a stats dict with total_records.
+        With hash_files, it is called with a `hashes` dict too, to add the
+        SHA-1 digests of the files it read whole to (see
+        malort.core.analyze_files); other files are hashed separately.
+    options: dict
+        JSON serializable analysis options
+    hash_files: boolean, default False
+        Record content hashes, and use them for files whose mtime changed
+    batch_files: int, default None
+        Maximum files per batch; BATCH_FILES if None
+    batch_bytes: int, default None
+        Maximum bytes per batch; BATCH_BYTES if None
+    """
+    batch_files = batch_files or BATCH_FILES
+    batch_bytes = batch_bytes or BATCH_BYTES
+    if not exists(state_dir):
+        os.makedirs(state_dir)
+    manifest = load_manifest(state_dir, options)
+    current = dict((relative_name(f, root), f) for f in file_list)
+
+    same_options = manifest['options'] == options
+    manifest['options'] = options
+
+    kept, dropped, done = {}, [], set()
+    for batch_id, batch in sorted(manifest['batches'].items()):
+        files = batch['files']
+        if same_options and all(name in current and
+               is_unchanged(current[name], recorded, hash_files)
+               for name, recorded in files.items()):
+            kept[batch_id] = batch
+            done.update(files)
+        else:
+            dropped.append(batch['snapshot'])
+
+    def new_batch_id():
+        batch_id = '{:06d}'.format(manifest['next_batch'])
+        manifest['next_batch'] += 1
+        return batch_id
+
+    combined = manifest.get('combined')
+    if combined is not None:
+        dropped.append(combined['snapshot'])
+        if not same_options or not all(b in kept
+                                       for b in combined['batches']):
+            combined = None
+    if combined is not None:
+        total = read_snapshot(join(state_dir, combined['snapshot']))
+    else:
+        total = tree_reduce(combine_stats, enumerate(
+            read_snapshot(join(state_dir, kept[b]['snapshot']))
+            for b in sorted(kept)))
+    changed = combined is None
+
+    pending = sorted(name for name in current if name not in done)
+    signatures = dict((name, file_signature(current[name]))
+                      for name in pending)
+    for names in split_batches(pending, signatures, batch_files,
+                               batch_bytes):
+        batch_id = new_batch_id()
+        snapshot = 'batch-{}.json.gz'.format(batch_id)
+        batch = [current[n] for n in names]
+        if hash_files:
+            # Hashed as they are parsed, to read each file only once
+            hashes = {}
+            stats = analyze_files(batch, hashes=hashes)
+            for name, filepath in zip(names, batch):
+                digest = hashes.get(str(filepath))
+                signatures[name]['hash'] = digest or file_hash(filepath)
+        else:
+            stats = analyze_files(batch)
+        write_snapshot(stats, join(state_dir, snapshot))
+        kept[batch_id] = {'snapshot': snapshot,
+                          'files': dict((n, signatures[n]) for n in names)}
+        total = combine_stats(total, stats) if total is not None else stats
+        changed = True
+
+    # Compact runs of consecutive batches that fit in one batch
+    groups, group, group_size = [], [], (0, 0)
+    for batch_id in sorted(kept):
+        files, size = batch_size(kept[batch_id])
+        if group and (group_size[0] + files > batch_files
+                      or group_size[1] + size > batch_bytes):
+            groups.append(group)
+            group, group_size = [], (0, 0)
+        group.append(batch_id)
+        group_size = (group_size[0] + files, group_size[1] + size)
+    groups.append(group)
+    for group in groups:
+        if len(group) < 2:
+            continue
+        batches = [kept.pop(b) for b in group]
+        batch_id = new_batch_id()
+        snapshot = 'batch-{}.json.gz'.format(batch_id)
+        write_snapshot(tree_reduce(combine_stats, enumerate(
+            read_snapshot(join(state_dir, b['snapshot'])) for b in batches)),
+            join(state_dir, snapshot))
+        files = {}
+        for batch in batches:
+            files.update(batch['files'])
+            dropped.append(batch['snapshot'])
+        kept[batch_id] = {'snapshot': snapshot, 'files': files}
+        changed = True
+
+    total = total or {}
+    if not changed:
+        dropped.remove(combined['snapshot'])
+    elif kept:
+        combined = {'snapshot': 'combined-{}.json.gz'.format(
+            new_batch_id()), 'batches': sorted(kept)}
+        write_snapshot(total, join(state_dir, combined['snapshot']))
+    else:
+        combined = None
+    manifest['combined'] = combined
+    manifest['batches'] = kept
+    save_manifest(state_dir, manifest)
+    for snapshot in dropped:
+        if exists(join(state_dir, snapshot)):
+            os.remove(join(state_dir, snapshot))
+    return total
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Metrics
+-------
+
+Timing and throughput of a run: seconds, bytes and records for each
+phase (listing, reading, JSON decoding, stats updates and merging), for
+each partition and for each file
+
+"""
+from __future__ import absolute_import, print_function, division
+
+from collections import OrderedDict
+import heapq
+import json
+import os
+import time
+
+clock = getattr(time, 'perf_counter', time.time)
+
+PHASES = ['list', 'read', 'decode', 'stats', 'sample', 'merge']
+
+
+class PartitionMetrics(object):
+    """
+    Metrics for one partition, collected by malort.stats.partition_stats
+    in the worker: seconds spent reading and splitting records, decoding
+    them, and updating the stats, with the records and bytes read from
+    each file. A batch's seconds are attributed to its files in proportion
+    to their bytes in the batch.
+    """
+
+    def __init__(self, index=None):
+        self.index = index
+        self.seconds = 0.0
+        self.phases = OrderedDict((p, 0.0) for p in ['read', 'decode',
+                                                     'stats'])
+        self.records = 0
+        self.bytes = 0
+        # filepath -> [records, bytes, seconds]
+        self.files = OrderedDict()
+
+    def add_batch(self, batch, read, decode, stats):
+        """
+        Add a batch of (filepath, record) pairs that took `read`, `decode`
+        and `stats` seconds
+        """
+        self.phases['read'] += read
+        self.phases['decode'] += decode
+        self.phases['stats'] += stats
+        sizes = OrderedDict()
+        for filepath, record in batch:
+            size = sizes.setdefault(filepath, [0, 0])
+            size[0] += 1
+            size[1] += len(record)
+        batch_bytes = sum(b for _, b in sizes.values())
+        seconds = read + decode + stats
+        for filepath, (records, size) in sizes.items():
+            share = (size / batch_bytes if batch_bytes
+                     else records / len(batch))
+            entry = self.files.setdefault(str(filepath), [0, 0, 0.0])
+            entry[0] += records
+            entry[1] += size
+            entry[2] += seconds * share
+            self.records += records
+            self.bytes += size
+
+    def to_dict(self):
+        return {'index': self.index, 'seconds': self.seconds,
+                'records': self.records, 'bytes': self.bytes,
+                'phases': dict(self.phases), 'pid': os.getpid(),
+                'files': dict((f, {'records': r, 'bytes': b, 'seconds': s})
+                              for f, (r, b, s) in self.files.items())}
+
+
+def measure_partition(func, item):
+    """
+    Like malort.backends.apply_indexed for partition_stats, but with
+    metrics: return (index, (stats, PartitionMetrics.to_dict()))
+    """
+    index, partition = item
+    metrics = PartitionMetrics(index)
+    start = clock()
+    stats = func(partition, metrics=metrics)
+    metrics.seconds = clock() - start
+    return index, (stats, metrics.to_dict())
+
+
+class Metrics(object):
+    """
+    Instrumentation for an analyze run, as `result.metrics`.
+
+    Phase seconds for read, decode and stats are summed over partitions,
+    so with parallel workers they can add up to more than `elapsed`. The
+    list phase is the time spent listing files, which overlaps with the
+    analysis of the files already listed, and merge is the time spent
+    merging partition stats, summed over the workers and the main
+    process.
+
+    Pass one to analyze as `metrics` to set the hooks below; each run
+    needs a new Metrics.
+
+    Parameters
+    ----------
+    on_partition: callable, default None
+        Called with each partition's metrics dict (see
+        PartitionMetrics.to_dict) as its result arrives in the main
+        process
+    on_finish: callable, default None
+        Called with the MalortResult when the run finishes, e.g. to export
+        result.metrics
+    logger: logging.Logger, default None
+        Log the 'Malort run finished' message and a throughput summary
+        with logger.info, rather than printing the message
+    """
+
+    def __init__(self, on_partition=None, on_finish=None, logger=None):
+        self.on_partition = on_partition
+        self.on_finish = on_finish
+        self.logger = logger
+        self.elapsed = None
+        self.files_listed = 0
+        self.phases = OrderedDict()
+        self.partitions = []
+        self.files = {}
+
+    def add_phase(self, phase, seconds, records=None, bytes=None):
+        """Add `seconds` (and optionally records and bytes) to a phase"""
+        entry = self.phases.setdefault(phase, {'seconds': 0.0})
+        entry['seconds'] += seconds
+        for key, value in [('records', records), ('bytes', bytes)]:
+            if value is not None:
+                entry[key] = entry.get(key, 0) + value
+
+    def timed_iter(self, phase, iterable):
+        """Yield from `iterable`, adding the time spent in it to `phase`"""
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_phase(phase, clock() - start)
+                return
+            self.add_phase(phase, clock() - start)
+            self.files_listed += 1
+            yield item
+
+    def timed(self, phase, func):
+        """Wrap `func` to add the time spent in each call to `phase`"""
+        def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_phase(phase, clock() - start)
+        return timed_func
+
+    def add_partition(self, partition):
+        """Record a partition's metrics dict from measure_partition"""
+        self.partitions.append(partition)
+        for phase, seconds in partition['phases'].items():
+            self.add_phase(phase, seconds, partition['records'],
+                           partition['bytes'] if phase == 'read' else None)
+        for filepath, entry in partition['files'].items():
+            total = self.files.setdefault(filepath, {'records': 0,
+                                                     'bytes': 0,
+                                                     'seconds': 0.0})
+            for key in total:
+                total[key] += entry[key]
+        if self.on_partition is not None:
+            self.on_partition(partition)
+
+    def collect(self, results):
+        """
+        Record the metrics of (index, (stats, metrics)) results from
+        measure_partition, and yield (index, stats)
+        """
+        for index, (stats, partition) in results:
+            self.add_partition(partition)
+            yield index, stats
+
+    def reducer(self, reduce_func):
+        """Wrap reduce_func(results) to take measure_partition results"""
+        def reduce_measured(results):
+            return reduce_func(self.collect(results))
+        return reduce_measured
+
+    @property
+    def records(self):
+        """Records read, or seen while sampling a record budget"""
+        phase = self.phases.get('read') or self.phases.get('sample', {})
+        return phase.get('records', 0)
+
+    @property
+    def bytes(self):
+        return self.phases.get('read', {}).get('bytes', 0)
+
+    @property
+    def records_per_second(self):
+        return self.records / self.elapsed if self.elapsed else None
+
+    @property
+    def mb_per_second(self):
+        if not self.elapsed:
+            return None
+        return self.bytes / (1 << 20) / self.elapsed
+
+    def slowest_files(self, n=10):
+        """The `n` files that took longest, as dicts with their path"""
+        slowest = heapq.nlargest(n, self.files.items(),
+                                 key=lambda f: (f[1]['seconds'], f[0]))
+        return [dict(entry, path=path) for path, entry in slowest]
+
+    def summary(self):
+        """One line summary of the throughput"""
+        if not self.elapsed:
+            return 'no timings'
+        phases = ', '.join('{} {:.2f}s'.format(p, self.phases[p]['seconds'])
+                           for p in PHASES if p in self.phases)
+        return ('{} records, {:.1f} MB in {:.2f}s: {:.0f} records/s, '
+                '{:.1f} MB/s ({})'.format(self.records,
+                                          self.bytes / (1 << 20),
+                                          self.elapsed,
+                                          self.records_per_second,
+                                          self.mb_per_second, phases))
+
+    def to_dict(self):
+        """The metrics as a JSON serializable dict"""
+        return {'elapsed': self.elapsed,
+                'files_listed': self.files_listed,
+                'records': self.records, 'bytes': self.bytes,
+                'records_per_second': self.records_per_second,
+                'mb_per_second': self.mb_per_second,
+                'phases': dict(self.phases),
+                'slowest_files': self.slowest_files(),
+                'partitions': sorted(self.partitions,
+                                     key=lambda p: p['index'])}
+
+    def to_json(self, filepath=None):
+        """
+        Return the metrics as a JSON string, or write them to `filepath`
+        if given
+        """
+        if filepath is None:
+            return json.dumps(self.to_dict(), sort_keys=True)
+        with open(filepath, 'w') as fwrite:
+            json.dump(self.to_dict(), fwrite, indent=1, sort_keys=True)
@@ -0,0 +1,658 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Readers
+-------
+
+Functions to split files of delimited JSON, and JSON documents holding
+top-level arrays, into records. Files may be compressed (see
+malort.compression), or remote objects (see malort.remote).
+
+"""
+from __future__ import absolute_import, print_function, division
+
+from bisect import bisect_right
+import hashlib
+from itertools import islice
+import json
+import mmap
+from os.path import getsize, splitext
+import re
+import shutil
+import tempfile
+
+from malort.compression import (detect_codec, iter_members, member_ranges,
+                                open_file, open_raw, prefetch,
+                                strip_codec_extension)
+from malort.remote import is_remote
+
+
+BUFSIZE = 1 << 20
+BLOCKSIZE = 64 << 20
+
+ARRAY_START = re.compile(br'(?:\xef\xbb\xbf)?\s*\[')
+# Tokens that matter for finding the end of an array element: strings
+# (which may hold brackets and commas), openers, closers and commas
+ARRAY_TOKEN = re.compile(br'("[^"\\]*(?:\\.[^"\\]*)*")|([\[{])|([\]}])|(,)')
+STRING, OPEN, CLOSE, COMMA = 1, 2, 3, 4
+WHITESPACE = re.compile(u'[ \t\n\r]*')
+ELEMENT_END = re.compile(u'[ \t\n\r]*([,\\]])')
+raw_decode = json.JSONDecoder().raw_decode
+
+
+def to_bytes(delimiter):
+    """Encode a str delimiter as UTF-8 bytes"""
+    if isinstance(delimiter, bytes):
+        return delimiter
+    return delimiter.encode('utf-8')
+
+
+def align_start(buf, start, delimiter=b'\n'):
+    """
+    Return the offset of the first record in `buf` that starts at or after
+    `start`, or len(buf) if there is none. See split_buffer.
+    """
+    if start <= 0:
+        return 0
+    step = len(delimiter)
+    idx = buf.find(delimiter, max(0, start - step))
+    return len(buf) if idx < 0 else idx + step
+
+
+def split_buffer(buf, delimiter=b'\n', start=0, stop=None, bufsize=BUFSIZE):
+    """
+    Yield `delimiter` separated records from a bytes-like buffer that
+    supports find and slicing, such as bytes or an mmap. The buffer is split
+    in `bufsize` windows; records that don't fit in a window are located
+    with find and copied out once. An empty record after a final delimiter
+    is not yielded.
+
+    With `start` and `stop`, only the records whose first byte falls in
+    [start, stop) are yielded: a record straddling `start` belongs to the
+    previous range, and the last record is read past `stop` to its end. So
+    adjacent ranges yield every record exactly once, as long as the
+    delimiter can't overlap itself (e.g. '||').
+    """
+    find = buf.find
+    step = len(delimiter)
+    size = len(buf)
+    stop = size if stop is None else min(stop, size)
+    pos = align_start(buf, start, delimiter)
+
+    while pos < stop:
+        window = buf[pos:pos + bufsize]
+        end = pos + len(window)
+        lines = window.split(delimiter)
+        if end < size:
+            if len(lines) == 1:
+                idx = find(delimiter, pos)
+                if idx < 0:
+                    yield buf[pos:size]
+                    return
+                yield buf[pos:idx]
+                pos = idx + step
+                continue
+            # The last line may be incomplete, so rescan it in the next window
+            lines.pop()
+
+        for line in lines:
+            if pos >= stop:
+                return
+            yield line
+            pos += len(line) + step
+
+
+def split_stream(fileobj, delimiter=b'\n', bufsize=BUFSIZE):
+    """
+    Yield `delimiter` separated records from a file object, reading
+    `bufsize` chunks. Works with str or bytes, as long as the delimiter type
+    matches the file. Records larger than `bufsize` are collected in pieces
+    and joined once, so this stays linear in the file size. Like str.split,
+    always yields the text after the last delimiter, even if empty.
+    """
+    empty = delimiter[:0]
+    keep = len(delimiter) - 1
+    pieces = []
+    buf = empty
+    while True:
+        chunk = fileobj.read(bufsize)
+        if not chunk:
+            break
+        buf = buf + chunk if buf else chunk
+        lines = buf.split(delimiter)
+        if len(lines) == 1:
+            # Hold back enough to match a delimiter split across reads
+            if len(buf) > keep:
+                pieces.append(buf[:len(buf) - keep])
+                buf = buf[len(buf) - keep:]
+            continue
+
+        if pieces:
+            pieces.append(lines[0])
+            lines[0] = empty.join(pieces)
+            pieces = []
+        buf = lines.pop()
+        for line in lines:
+            yield line
+
+    pieces.append(buf)
+    yield empty.join(pieces)
+
+
+class HashingReader(object):
+    """
+    File-like wrapper that adds the bytes read from `fileobj` to `digest`,
+    a hashlib hash, so a file can be hashed in the same pass that parses
+    it
+    """
+
+    def __init__(self, fileobj, digest):
+        self.fileobj = fileobj
+        self.digest = digest
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+    def tell(self):
+        return self.fileobj.tell()
+
+
+class MemberStream(object):
+    """
+    File-like object for split_stream over the (member_start, data) pairs
+    of malort.compression.iter_members. Tracks where each member's data
+    starts in the decompressed stream, and `boundary`, where the first
+    member at or after the file offset `stop` starts.
+    """
+
+    def __init__(self, members, stop=None):
+        self.members = members
+        self.stop = stop
+        self.boundary = None
+        self.offset = 0
+        self.starts = []
+        self.member_starts = []
+
+    def read(self, size=-1):
+        item = next(self.members, None)
+        if item is None:
+            return b''
+        member, data = item
+        if not self.member_starts or member != self.member_starts[-1]:
+            if (self.boundary is None and self.stop is not None
+                    and member >= self.stop):
+                self.boundary = self.offset
+            self.starts.append(self.offset)
+            self.member_starts.append(member)
+        self.offset += len(data)
+        return data
+
+    def key(self, offset):
+        """
+        Position of the decompressed `offset`, as the file offset of its
+        member shifted left 32 bits plus its offset in the member's data,
+        so it doesn't depend on where the stream started
+        """
+        i = bisect_right(self.starts, offset) - 1
+        return (self.member_starts[i] << 32) + offset - self.starts[i]
+
+
+def iter_compressed_records(filepath, codec, delimiter=b'\n', start=0,
+                            stop=None, digest=None):
+    """
+    Yield (key, record) for the `delimiter` separated records of a
+    compressed file, decompressed in a background thread. See MemberStream
+    for the keys.
+
+    `start` and `stop` are member aligned ranges from
+    malort.compression.member_ranges. A range's records start with the
+    first one that begins after a delimiter in its own data, and end with
+    the one terminated by the first delimiter in the next range's data, so
+    adjacent ranges yield every record exactly once (for delimiters that
+    can't overlap themselves, see split_buffer).
+
+    With a hashlib `digest`, the compressed bytes read are added to it.
+    """
+    step = len(delimiter)
+    with open_raw(filepath) as fread:
+        fread.seek(start)
+        if digest is not None:
+            fread = HashingReader(fread, digest)
+        members = prefetch(iter_members(fread, codec))
+        stream = MemberStream(members, stop)
+        offset = 0
+        try:
+            for index, record in enumerate(split_stream(stream, delimiter)):
+                end = offset + len(record)
+                if index or not start:
+                    yield stream.key(offset), record
+                if stream.boundary is not None and end >= stream.boundary:
+                    return
+                offset = end + step
+        finally:
+            members.close()
+
+
+def iter_remote_records(obj, delimiter=b'\n', start=0, stop=None,
+                        digest=None):
+    """
+    Yield (offset, record) for the `delimiter` separated records of an
+    uncompressed malort.remote.RemoteObject that start in [start, stop),
+    with the same range rules as split_buffer. The object is read from
+    just before `start` with a RemoteReader, which keeps range requests in
+    flight while the records are parsed. With a hashlib `digest`, the
+    bytes read are added to it.
+    """
+    step = len(delimiter)
+    offset = max(0, start - step)
+    previous = None
+    with obj.open(offset, stop) as fread:
+        if digest is not None:
+            fread = HashingReader(fread, digest)
+        records = split_stream(fread, delimiter)
+        if start > 0:
+            # The end of the record straddling `start`
+            offset += len(next(records)) + step
+        for record in records:
+            if previous is not None:
+                yield previous
+            if stop is not None and offset >= stop:
+                return
+            previous = offset, record
+            offset += len(record) + step
+    if previous is not None and previous[1]:
+        # Like split_buffer, no empty record after a final delimiter
+        yield previous
+
+
+def iter_file_records(filepath, delimiter=b'\n', start=0, stop=None,
+                      digest=None):
+    """
+    Yield `delimiter` separated records from a file as bytes, without
+    decoding the file. Regular files are memory-mapped and split with
+    split_buffer; anything that can't be mapped is read in chunks.
+    Compressed files are decompressed as a stream, see
+    iter_compressed_records, and remote objects are read with range
+    requests, see iter_remote_records.
+
+    Parameters
+    ----------
+    filepath: string
+    delimiter: bytes or string, default b'\\n'
+        String delimiters are encoded as UTF-8
+    start: int, default 0
+    stop: int, default None
+        Only yield records that start in this byte range. See split_buffer.
+    digest: hashlib hash, default None
+        For a whole file (start 0, stop None), add its raw bytes to this
+        once all records are read, for the same digest as reading the file
+        again (see malort.manifest.file_hash)
+    """
+    delimiter = to_bytes(delimiter)
+    if start or stop is not None:
+        digest = None
+    codec = detect_codec(filepath)
+    if codec is not None:
+        for _, record in iter_compressed_records(filepath, codec, delimiter,
+                                                 start, stop, digest):
+            yield record
+        return
+    if is_remote(filepath):
+        for _, record in iter_remote_records(filepath, delimiter, start,
+                                             stop, digest):
+            yield record
+        return
+    with open(filepath, 'rb') as fread:
+        try:
+            mapped = mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return
+        except (OSError, IOError, mmap.error):
+            if start or stop is not None:
+                raise
+            if digest is not None:
+                fread = HashingReader(fread, digest)
+            for record in split_stream(fread, delimiter):
+                yield record
+            return
+        try:
+            for record in split_buffer(mapped, delimiter, start, stop):
+                yield record
+            if digest is not None:
+                digest.update(mapped)
+        finally:
+            mapped.close()
+
+
+def iter_record_offsets(filepath, delimiter=b'\n', start=0, stop=None):
+    """
+    Like iter_file_records, but yield (offset, record), where offset is the
+    position of the record in the file. For compressed files, it is the
+    key from iter_compressed_records.
+    """
+    delimiter = to_bytes(delimiter)
+    codec = detect_codec(filepath)
+    if codec is not None:
+        for item in iter_compressed_records(filepath, codec, delimiter, start,
+                                            stop):
+            yield item
+        return
+    if is_remote(filepath):
+        for item in iter_remote_records(filepath, delimiter, start, stop):
+            yield item
+        return
+    offset = 0
+    if start > 0:
+        with open(filepath, 'rb') as fread:
+            mapped = mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = align_start(mapped, start, delimiter)
+            finally:
+                mapped.close()
+    step = len(delimiter)
+    for record in iter_file_records(filepath, delimiter, start, stop):
+        yield offset, record
+        offset += len(record) + step
+
+
+def array_start(buf):
+    """
+    If the JSON document in `buf` is a top-level array, return the offset
+    just past its opening bracket, else None
+    """
+    match = ARRAY_START.match(buf)
+    return match.end() if match else None
+
+
+def scan_element(buf, start):
+    """
+    Return (end, token) for the array element at `start` in `buf`, where
+    `end` is the offset of the comma (token COMMA) or bracket (CLOSE) after
+    it, or (len(buf), None) if the array isn't closed. Only strings and
+    brackets are tracked, so this works on elements of any size, valid or
+    not, without copying them.
+    """
+    depth = 0
+    for match in ARRAY_TOKEN.finditer(buf, start):
+        token = match.lastindex
+        if token == STRING:
+            continue
+        elif token == OPEN:
+            depth += 1
+        elif depth:
+            if token == CLOSE:
+                depth -= 1
+        else:
+            return match.start(), token
+    return len(buf), None
+
+
+def scan_window(text, i):
+    """
+    Return (end, closer, next) for the array element at text[i:]: the end
+    of its value, the ',' or ']' after it, and the index after that. None
+    if it doesn't end within `text`, or doesn't scan as JSON.
+    """
+    i = WHITESPACE.match(text, i).end()
+    if text[i:i + 1] == u']':
+        return i, u']', i + 1
+    try:
+        end = raw_decode(text, i)[1]
+    except ValueError:
+        return None
+    match = ELEMENT_END.match(text, end)
+    if match is None:
+        return None
+    return end, match.group(1), match.end()
+
+
+def array_spans(buf, start=0, stop=None, bufsize=BUFSIZE):
+    """
+    Yield (start, stop) offsets of the elements of the top-level JSON array
+    in a bytes-like buffer, such as an mmap, without parsing it as a whole.
+    A span starts just past the bracket or comma before the element, so it
+    may include whitespace; an empty array yields one blank span, and if
+    the array isn't closed, the rest of `buf` is the last span.
+
+    `buf` is scanned in `bufsize` windows decoded as Latin-1, so that each
+    character is one byte and json's C scanner finds where each element
+    ends. Elements that don't fit in a window, or don't scan, are found
+    with scan_element, so errors are left to the JSON decoder. The
+    document is assumed to be ASCII-compatible, e.g. UTF-8.
+
+    With `start`, the scan starts at an element boundary from a previous
+    scan (see array_ranges), and with `stop`, only the elements that start
+    before `stop` are yielded.
+    """
+    if not start:
+        start = array_start(buf)
+        if start is None:
+            raise ValueError('JSON document is not an array')
+    pos = base = start
+    text = buf[base:base + bufsize].decode('latin-1')
+    while stop is None or pos < stop:
+        element = scan_window(text, pos - base)
+        if element is None and pos != base:
+            # Retry with the element at the start of a fresh window
+            base = pos
+            text = buf[base:base + bufsize].decode('latin-1')
+            element = scan_window(text, 0)
+        if element is None:
+            end, token = scan_element(buf, pos)
+            yield pos, end
+            if token != COMMA:
+                return
+            pos = base = end + 1
+            text = buf[base:base + bufsize].decode('latin-1')
+            continue
+        end, closer, after = element
+        yield pos, base + end
+        if closer == u']':
+            return
+        pos = base + after
+
+
+def array_ranges(filepath, blocksize=BLOCKSIZE):
+    """
+    Return (start, stop) byte ranges of a JSON document of about
+    `blocksize` bytes each, aligned to the elements of its top-level array,
+    for iter_array_records. Finding the element boundaries takes one scan
+    of the file. A document that is not an array is one range, (0, None).
+    """
+    ranges = []
+    with open(filepath, 'rb') as fread:
+        mapped = mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if array_start(mapped) is not None:
+                previous, boundary = 0, blocksize
+                for start, _ in array_spans(mapped):
+                    if start >= boundary:
+                        ranges.append((previous, start))
+                        previous = start
+                        boundary = start + blocksize
+        finally:
+            mapped.close()
+    if not ranges:
+        return [(0, None)]
+    return ranges + [(ranges[-1][1], None)]
+
+
+def iter_array_records(filepath, start=0, stop=None):
+    """
+    Yield the elements of a JSON document's top-level array as bytes, or
+    the whole document if it is not an array. The file is memory-mapped,
+    so memory use is bounded by the largest element, not the file size.
+    `start` and `stop` are a range from array_ranges.
+    """
+    for _, record in iter_array_offsets(filepath, start, stop):
+        yield record
+
+
+def iter_array_offsets(filepath, start=0, stop=None):
+    """
+    Like iter_array_records, but yield (offset, record), where offset is the
+    position of the record in the file. Compressed documents and remote
+    objects are first copied to a temporary file, and aren't split into
+    ranges.
+    """
+    codec = detect_codec(filepath)
+    if codec is None and not is_remote(filepath):
+        with open(filepath, 'rb') as fread:
+            for item in _iter_array_file(fread, start, stop):
+                yield item
+        return
+    with open_file(filepath, codec) as fread, \
+            tempfile.TemporaryFile() as temp:
+        shutil.copyfileobj(fread, temp, BUFSIZE)
+        temp.flush()
+        for item in _iter_array_file(temp, start, stop):
+            yield item
+
+
+def _iter_array_file(fread, start, stop):
+    """iter_array_offsets for an open binary file"""
+    try:
+        mapped = mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty file
+        return
+    except (OSError, IOError, mmap.error):
+        if start or stop is not None:
+            raise
+        fread.seek(0)
+        mapped = fread.read()
+    try:
+        if not start and array_start(mapped) is None:
+            yield 0, mapped[:]
+            return
+        for first, last in array_spans(mapped, start, stop):
+            yield first, mapped[first:last]
+    finally:
+        if hasattr(mapped, 'close'):
+            mapped.close()
+
+
+def file_size(filepath):
+    """Size in bytes of a file or malort.remote.RemoteObject"""
+    return filepath.size if is_remote(filepath) else getsize(filepath)
+
+
+def is_json_document(filepath):
+    """
+    .json files (or compressed .json files, e.g. .json.gz) hold a single
+    JSON document; others hold delimited JSON
+    """
+    return splitext(strip_codec_extension(filepath))[1] == '.json'
+
+
+def plan_partitions(filepaths, blocksize=BLOCKSIZE, split=True,
+                    stream_arrays=False):
+    """
+    Group files into partitions of roughly `blocksize` bytes for parallel
+    reads. Each partition is a list of (filepath, start, stop) byte ranges,
+    where (0, None) is the whole file:
+
+    * Delimited files larger than `blocksize` are split into `blocksize`
+      ranges, one partition each. Readers align each range to record
+      boundaries (see split_buffer).
+    * With `stream_arrays`, .json documents larger than `blocksize` are
+      split into ranges aligned to the elements of their top-level array,
+      one partition each (see array_ranges).
+    * Compressed delimited files larger than `blocksize` are split into
+      ranges of whole members, if their members can be found without
+      decompressing (see malort.compression.member_ranges).
+    * Smaller files, and other .json documents and compressed files, are
+      read whole, and coalesced into shared partitions until they add up
+      to `blocksize`.
+
+    Remote objects (see malort.remote) are planned from the sizes in their
+    listing; only uncompressed delimited ones are split.
+
+    Parameters
+    ----------
+    filepaths: iterable of strings
+    blocksize: int, default 64 MB
+    split: boolean, default True
+        If False, files are always read whole
+    stream_arrays: boolean, default False
+        See iter_partition_records
+    """
+    batch, batch_size = [], 0
+    for filepath in filepaths:
+        size = file_size(filepath)
+        if split and size > blocksize:
+            codec = detect_codec(filepath)
+            if codec is not None:
+                ranges = []
+                if not is_json_document(filepath):
+                    ranges = member_ranges(filepath, codec, blocksize)
+                if len(ranges) > 1:
+                    for start, stop in ranges:
+                        yield [(filepath, start, stop)]
+                    continue
+            elif not is_json_document(filepath):
+                for start in range(0, size, blocksize):
+                    yield [(filepath, start, start + blocksize)]
+                continue
+            elif stream_arrays and not is_remote(filepath):
+                for start, stop in array_ranges(filepath, blocksize):
+                    yield [(filepath, start, stop)]
+                continue
+
+        batch.append((filepath, 0, None))
+        batch_size += size
+        if batch_size >= blocksize:
+            yield batch
+            batch, batch_size = [], 0
+
+    if batch:
+        yield batch
+
+
+def iter_partition_records(partition, delimiter=b'\n', head=None,
+                           stream_arrays=False, digests=None):
+    """
+    Yield (filepath, record) for every record in a partition from
+    plan_partitions. .json files yield their whole contents as one record,
+    or with `stream_arrays`, each element of their top-level array (see
+    iter_array_records); blank records are skipped. With `head`, at most
+    the first `head` records of each range are yielded.
+
+    With a `digests` dict, the SHA-1 hex digest of each delimited file or
+    uncompressed .json document read whole is added to it, keyed by
+    str(filepath), once its records are read. Files read in ranges or
+    streamed as arrays aren't hashed.
+    """
+    delimiter = to_bytes(delimiter)
+    for filepath, start, stop in partition:
+        whole = head is None and start == 0 and stop is None
+        digest = hashlib.sha1() if digests is not None and whole else None
+        if stream_arrays and is_json_document(filepath):
+            records = (r for r in iter_array_records(filepath, start, stop)
+                       if not is_blank(r))
+            for record in islice(records, head):
+                yield filepath, record
+            continue
+        if is_json_document(filepath):
+            if head != 0:
+                with open_file(filepath) as fread:
+                    data = fread.read()
+                if digest is not None and detect_codec(filepath) is None:
+                    digest.update(data)
+                    digests[str(filepath)] = digest.hexdigest()
+                yield filepath, data
+            continue
+        records = (r for r in iter_file_records(filepath, delimiter, start,
+                                                stop, digest)
+                   if not is_blank(r))
+        for record in islice(records, head):
+            yield filepath, record
+        if digest is not None:
+            digests[str(filepath)] = digest.hexdigest()
+
+
+def is_blank(record):
+    """True for empty or whitespace-only records"""
+    return not record or record.isspace()
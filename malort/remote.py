@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Remote
+-------
+
+Reading objects over HTTP(S), including S3-compatible object stores, with
+the standard library: pooled keep-alive connections, AWS Signature V4
+signing, and readers that keep several range requests in flight ahead of
+the consumer, so downloads overlap with parsing
+
+"""
+from __future__ import absolute_import, print_function, division
+
+from collections import deque
+import datetime
+import hashlib
+import hmac
+import io
+import os
+import threading
+import time
+
+try:
+    import http.client as httplib
+    from urllib.parse import parse_qsl, quote, urlsplit
+    from email.utils import mktime_tz, parsedate_tz
+except ImportError:
+    import httplib
+    from urllib import quote
+    from urlparse import parse_qsl, urlsplit
+    from email.utils import mktime_tz, parsedate_tz
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Bytes per range request
+CHUNKSIZE = 8 << 20
+# Bytes per range request past the end of a reader's range, where only the
+# rest of the last record is needed
+TAIL_CHUNKSIZE = 64 << 10
+# Threads for range requests, shared by all readers in a process
+MAX_THREADS = 32
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+_pools = {}
+_executors = {}
+_lock = threading.Lock()
+
+
+def _reset_lock():
+    # A thread may have held the lock when a worker process was forked
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_lock)
+
+
+class ConnectionPool(object):
+    """Idle keep-alive connections to one host, reused across requests"""
+
+    def __init__(self, scheme, netloc, timeout=60, maxsize=16):
+        self.connection_class = (httplib.HTTPSConnection if scheme == 'https'
+                                 else httplib.HTTPConnection)
+        self.netloc = netloc
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """Return an idle connection, or a new one"""
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.connection_class(self.netloc, timeout=self.timeout)
+
+    def put(self, conn):
+        """Return a connection whose response has been read in full"""
+        with self.lock:
+            if len(self.idle) < self.maxsize:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+
+def get_pool(scheme, netloc, timeout=60):
+    """
+    The ConnectionPool for a host in this process. Pools are per process,
+    so workers forked with open connections don't share sockets.
+    """
+    key = (os.getpid(), scheme, netloc, timeout)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(scheme, netloc, timeout)
+    return pool
+
+
+def executor():
+    """The thread pool for range requests in this process"""
+    pid = os.getpid()
+    with _lock:
+        pool = _executors.get(pid)
+        if pool is None:
+            pool = _executors[pid] = ThreadPoolExecutor(MAX_THREADS)
+    return pool
+
+
+def utc_now():
+    """The current time as an aware UTC datetime (naive on Python 2)"""
+    if hasattr(datetime, 'timezone'):
+        return datetime.datetime.now(datetime.timezone.utc)
+    return datetime.datetime.utcnow()
+
+
+def uri_encode(value, safe='-_.~'):
+    """Percent-encode a string as UTF-8, as AWS canonical requests do"""
+    return quote(value.encode('utf-8') if not isinstance(value, bytes)
+                 else value, safe=safe)
+
+
+def sign_v4(method, url, headers, access_key, secret_key, region='us-east-1',
+            service='s3', session_token=None, now=None):
+    """
+    Return `headers` with the host, x-amz-* and Authorization headers of
+    an AWS Signature Version 4 signed request without a body. `url` must
+    already be percent-encoded.
+    """
+    now = now or utc_now()
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    datestamp = amz_date[:8]
+    parts = urlsplit(url)
+    headers = dict(headers or {})
+    headers.update({'host': parts.netloc, 'x-amz-date': amz_date,
+                    'x-amz-content-sha256': EMPTY_SHA256})
+    if session_token:
+        headers['x-amz-security-token'] = session_token
+    canonical_headers = sorted((k.lower(), ' '.join(str(v).split()))
+                               for k, v in headers.items())
+    signed_headers = ';'.join(k for k, _ in canonical_headers)
+    query = '&'.join(sorted(
+        '{}={}'.format(uri_encode(k), uri_encode(v))
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)))
+    canonical_request = '\n'.join(
+        [method, parts.path or '/', query]
+        + ['{}:{}'.format(k, v) for k, v in canonical_headers]
+        + ['', signed_headers, EMPTY_SHA256])
+    scope = '/'.join([datestamp, region, service, 'aws4_request'])
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', amz_date, scope,
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+    key = ('AWS4' + secret_key).encode('utf-8')
+    for part in [datestamp, region, service, 'aws4_request']:
+        key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode('utf-8'),
+                         hashlib.sha256).hexdigest()
+    headers['Authorization'] = (
+        'AWS4-HMAC-SHA256 Credential={}/{}, SignedHeaders={}, Signature={}'
+        .format(access_key, scope, signed_headers, signature))
+    return headers
+
+
+class HTTPClient(object):
+    """
+    Options and requests for reading remote objects. Clients hold no
+    connections themselves (see get_pool), so they can be pickled into
+    worker processes.
+
+    Parameters
+    ----------
+    concurrency: int, default 4
+        Range requests each reader keeps in flight
+    chunksize: int, default 8 MB
+        Bytes per range request
+    timeout: float, default 60
+        Socket timeout in seconds
+    retries: int, default 3
+        Retries for connection errors and 500, 502, 503 and 504 responses,
+        with exponential backoff
+    headers: dict, default None
+        Extra headers for every request
+    access_key, secret_key: string, default None
+        Sign requests with AWS Signature V4 (see sign_v4); unsigned if None
+    region: string, default 'us-east-1'
+    session_token: string, default None
+    """
+
+    def __init__(self, concurrency=4, chunksize=CHUNKSIZE, timeout=60,
+                 retries=3, headers=None, access_key=None, secret_key=None,
+                 region='us-east-1', session_token=None):
+        if concurrency < 1 or chunksize < 1:
+            raise ValueError('concurrency and chunksize must be at least 1')
+        self.concurrency = concurrency
+        self.chunksize = chunksize
+        self.timeout = timeout
+        self.retries = retries
+        self.headers = dict(headers or {})
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.session_token = session_token
+
+    def request(self, method, url, headers=None):
+        """
+        Make a request, and return (status, headers, body), with the
+        response header names lower-cased. Raises IOError for 4xx and 5xx
+        responses other than 416 (range not satisfiable).
+        """
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        all_headers = dict(self.headers)
+        all_headers.update(headers or {})
+        pool = get_pool(parts.scheme, parts.netloc, self.timeout)
+        for attempt in range(self.retries + 1):
+            if self.access_key is not None:
+                signed = sign_v4(method, url, all_headers, self.access_key,
+                                 self.secret_key, self.region,
+                                 session_token=self.session_token)
+            else:
+                signed = all_headers
+            conn = pool.get()
+            try:
+                conn.request(method, path, headers=signed)
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, OSError, IOError):
+                conn.close()
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+            if response.will_close:
+                conn.close()
+            else:
+                pool.put(conn)
+            status = response.status
+            if status in RETRY_STATUSES and attempt < self.retries:
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+            if status >= 400 and status != 416:
+                raise IOError('HTTP {} {} for {} {}: {}'.format(
+                    status, response.reason, method, url, body[:200]))
+            return (status, dict((k.lower(), v) for k, v
+                                 in response.getheaders()), body)
+
+    def head(self, url):
+        """Return (size, mtime, etag) for an object"""
+        _, headers, _ = self.request('HEAD', url)
+        modified = headers.get('last-modified')
+        mtime = mktime_tz(parsedate_tz(modified)) if modified else None
+        return (int(headers['content-length']), mtime,
+                headers.get('etag', '').strip('"') or None)
+
+    def get_range(self, url, start, stop):
+        """Return bytes [start, stop) of an object"""
+        if stop <= start:
+            return b''
+        status, _, body = self.request(
+            'GET', url, {'Range': 'bytes={}-{}'.format(start, stop - 1)})
+        if status == 416:
+            return b''
+        if status != 206:
+            # The server ignored the range and sent the whole object
+            body = body[start:stop]
+        return body
+
+
+class RemoteObject(str):
+    """
+    A remote object's URL, with its size, mtime and etag from the listing,
+    its `name` relative to the source it was listed from, and the
+    HTTPClient to read it with. A str, so it works as a file path for
+    sorting, extensions and messages. Use RemoteObject.from_url for an
+    object whose size isn't known from a listing.
+    """
+
+    def __new__(cls, url, size, mtime=None, etag=None, name=None,
+                client=None):
+        obj = str.__new__(cls, url)
+        obj.client = client or HTTPClient()
+        obj.size = size
+        obj.mtime = mtime
+        obj.etag = etag
+        obj.name = name if name is not None else urlsplit(url).path[1:]
+        return obj
+
+    @classmethod
+    def from_url(cls, url, name=None, client=None):
+        """
+        Return the RemoteObject for `url`, with its size, mtime and etag
+        from a HEAD request. Raises IOError if the object doesn't exist.
+        """
+        client = client or HTTPClient()
+        size, mtime, etag = client.head(url)
+        return cls(url, size, mtime, etag, name, client)
+
+    def __reduce__(self):
+        return (RemoteObject, (str(self), self.size, self.mtime, self.etag,
+                               self.name, self.client))
+
+    def read_range(self, start, stop):
+        """Return bytes [start, stop) of the object"""
+        return self.client.get_range(self, start, min(stop, self.size))
+
+    def open(self, start=0, stop=None):
+        """Return a RemoteReader from `start`; see RemoteReader"""
+        return RemoteReader(self, start, stop)
+
+
+def is_remote(filepath):
+    return isinstance(filepath, RemoteObject)
+
+
+class RemoteReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a RemoteObject. Reads are served
+    from range requests of the client's chunksize, with up to concurrency
+    of them in flight ahead of the read position. With `stop`, requests
+    past `stop` are made one small chunk at a time, for readers that only
+    need the end of the record straddling it.
+    """
+
+    def __init__(self, obj, start=0, stop=None):
+        self.obj = obj
+        self.stop = stop
+        self._seek(start)
+
+    def _seek(self, offset):
+        self.pending = deque()
+        self.next_start = offset
+        self.buffer = b''
+        self.buffer_start = offset
+        self.buffer_pos = 0
+
+    def _schedule(self):
+        client = self.obj.client
+        while (len(self.pending) < client.concurrency
+               and self.next_start < self.obj.size):
+            chunksize = client.chunksize
+            if self.stop is not None and self.next_start >= self.stop:
+                if self.pending:
+                    break
+                chunksize = TAIL_CHUNKSIZE
+            end = min(self.next_start + chunksize, self.obj.size)
+            self.pending.append(executor().submit(self.obj.read_range,
+                                                  self.next_start, end))
+            self.next_start = end
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        if self.buffer_pos >= len(self.buffer):
+            self._schedule()
+            if not self.pending:
+                return 0
+            self.buffer_start += len(self.buffer)
+            self.buffer = self.pending.popleft().result()
+            self.buffer_pos = 0
+            self._schedule()
+        size = min(len(b), len(self.buffer) - self.buffer_pos)
+        b[:size] = self.buffer[self.buffer_pos:self.buffer_pos + size]
+        self.buffer_pos += size
+        return size
+
+    def tell(self):
+        return self.buffer_start + self.buffer_pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence == io.SEEK_END:
+            offset += self.obj.size
+        if offset != self.tell():
+            self._cancel()
+            self._seek(offset)
+        return offset
+
+    def _cancel(self):
+        for future in self.pending:
+            future.cancel()
+
+    def close(self):
+        if not self.closed:
+            self._cancel()
+            self.pending = deque()
+        super(RemoteReader, self).close()
+
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Sampling
+-------
+
+Reproducible file and record sampling, and confidence notes for stats
+computed from a sample
+
+"""
+from __future__ import absolute_import, print_function, division
+
+from collections import namedtuple
+import hashlib
+import heapq
+from itertools import islice
+import math
+import random
+
+from malort.readers import (file_size, is_blank, is_json_document,
+                            iter_array_offsets, iter_partition_records,
+                            iter_record_offsets)
+from malort.sketches import mix64
+
+
+class Sampling(namedtuple('Sampling', ['records', 'files', 'head', 'seed'])):
+    """
+    Sampling options for analyze.
+
+    records: int, default None
+        Record budget: analyze a uniform random sample of this many
+        records, chosen by reservoir sampling across all files. Every file
+        is still read, but only sampled records are parsed.
+    files: float, default None
+        Only read this fraction of the files, stratified by file size
+    head: int, default None
+        Only read the first `head` records of each file
+    seed: int, default None
+        Seed for the records and files samples. If None, a random seed is
+        used; it is recorded in `result.sampling` so the run can be
+        repeated.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, records=None, files=None, head=None, seed=None):
+        return super(Sampling, cls).__new__(cls, records, files, head, seed)
+
+
+def sample_file_list(file_list, fraction, seed=0):
+    """
+    Return a sample of about `fraction` of `file_list`, stratified by file
+    size: files are sorted by size and cut into equal groups, and one file
+    is picked at random from each group. Always keeps at least one file.
+
+    Parameters
+    ----------
+    file_list: list of strings
+    fraction: float
+        Between 0 and 1
+    seed: int, default 0
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError('Sampled fraction must be in (0, 1], got {}'
+                         .format(fraction))
+    rand = random.Random(seed)
+    by_size = sorted(file_list, key=lambda f: (file_size(f), f))
+    strata = max(1, int(round(fraction * len(by_size))))
+    picked = []
+    for i in range(min(strata, len(by_size))):
+        group = by_size[i * len(by_size) // strata:
+                        (i + 1) * len(by_size) // strata]
+        picked.append(rand.choice(group))
+    return sorted(picked)
+
+
+def file_key(seed, filepath):
+    """64 bit key for a file's record priorities under `seed`"""
+    digest = hashlib.sha1('{}:{}'.format(seed, filepath).encode('utf-8'))
+    return int(digest.hexdigest()[:16], 16)
+
+
+def partition_reservoir(partition, size, seed=0, delimiter='\n', head=None,
+                        stream_arrays=False):
+    """
+    Reservoir sample a partition for a record budget of `size`: every record
+    gets a pseudo-random priority from `seed`, its file and its byte offset,
+    and the `size` records with the lowest priorities are kept. The lowest
+    priorities across all partitions (merge_reservoirs) are then a uniform
+    sample of all records, which only depends on the seed and the files, not
+    on how they were partitioned. With `stream_arrays`, the elements of
+    .json documents' top-level arrays are the records (see
+    malort.readers.iter_partition_records).
+
+    Returns
+    -------
+    (records_seen, [(priority, filepath, record), ...])
+    """
+    reservoir = []
+    seen = 0
+    for filepath, start, stop in partition:
+        key = file_key(seed, filepath)
+        if stream_arrays and is_json_document(filepath):
+            records = ((offset, record) for offset, record
+                       in iter_array_offsets(filepath, start, stop)
+                       if not is_blank(record))
+            records = islice(records, head)
+        elif is_json_document(filepath):
+            records = iter_partition_records([(filepath, start, stop)],
+                                             delimiter, head)
+            records = ((0, record) for _, record in records)
+        else:
+            records = ((offset, record) for offset, record
+                       in iter_record_offsets(filepath, delimiter, start, stop)
+                       if not is_blank(record))
+            records = islice(records, head)
+        for offset, record in records:
+            seen += 1
+            priority = -mix64(key ^ offset)
+            if len(reservoir) < size:
+                heapq.heappush(reservoir, (priority, filepath, record))
+            elif priority > reservoir[0][0]:
+                heapq.heapreplace(reservoir, (priority, filepath, record))
+    return seen, sorted((-p, f, r) for p, f, r in reservoir)
+
+
+def merge_reservoirs(reservoirs, size):
+    """
+    Merge partition_reservoir results into (records_seen, sample), where
+    sample is the `size` lowest priority records, in priority order
+    """
+    seen = 0
+    records = []
+    for partition_seen, partition_records in reservoirs:
+        seen += partition_seen
+        records = heapq.nsmallest(size, records + partition_records)
+    return seen, records
+
+
+def wilson_interval(successes, n, z=1.96):
+    """
+    Wilson score interval for a binomial proportion, by default at 95%
+    confidence. Returns (low, high); (0, 1) if n is 0.
+    """
+    if not n:
+        return 0.0, 1.0
+    p = successes / n
+    denom = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denom
+    margin = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denom
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def sample_notes(stats, sampled_records):
+    """
+    Return a note per path of a sampled stats dict: how many values were
+    seen in how many sampled records, and a 95% interval for the share of
+    all records that have the key. Keys inside lists can be seen more than
+    once per record; their share is capped at 100%.
+
+    Parameters
+    ----------
+    stats: dict
+        Exported stats dict, as in MalortResult.stats
+    sampled_records: int
+    """
+    notes = {}
+    for path, path_stats in stats.items():
+        seen = sum(type_stats['count'] for name, type_stats
+                   in path_stats.items() if name != 'base_key')
+        low, high = wilson_interval(min(seen, sampled_records),
+                                    sampled_records)
+        notes[path] = ('key seen in {} of {} sampled records (95% interval '
+                       'for all records: {:.1f}% - {:.1f}%)'.format(
+                           seen, sampled_records, low * 100, high * 100))
+    return notes
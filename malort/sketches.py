@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Sketches
+-------
+
+Small, mergeable summaries of value distributions and distinct counts, with
+memory bounded independent of the number of values seen
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import base64
+from collections import Counter
+import hashlib
+import math
+from operator import itemgetter
+import struct
+
+
+QUANTILES = [('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('p99.9', 0.999)]
+
+MASK64 = (1 << 64) - 1
+
+
+def mix64(x):
+    """splitmix64 finalizer: a fast, well mixed 64 bit integer hash"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class KLLSketch(object):
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Values go into a stack of compactors; compactor h holds values that
+    each stand for 2 ** h of the values seen. When the sketch is full, the
+    lowest full compactor is sorted and every other value is promoted to the
+    next level, halving its size. Capacities shrink by 2/3 per level down
+    the stack (to at least min_capacity), so the sketch holds at most about
+    3 * k values plus min_capacity per level, and the rank error shrinks
+    roughly as 1 / k. Until the first compaction, quantiles are exact.
+
+    Which half of a compactor is promoted alternates with the number of
+    values seen, rather than being random, so that building and merging
+    sketches is deterministic.
+
+    Parameters
+    ----------
+    k: int, default 128
+        Capacity of the top compactor, trading accuracy for memory
+    """
+
+    __slots__ = ('k', 'n', 'levels', '_size', '_max_size', '_capacities')
+
+    # Smallest compactor capacity. Lower levels would otherwise shrink to a
+    # couple of values, and compact on nearly every update.
+    min_capacity = 8
+
+    def __init__(self, k=128):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self._capacities = []
+        self._resize()
+
+    def _compress(self):
+        levels = self.levels
+        for h in range(len(levels)):
+            items = levels[h]
+            if len(items) < self._capacities[h]:
+                continue
+            if h + 1 == len(levels):
+                levels.append([])
+            items.sort()
+            # Odd one out stays at this level
+            keep = [items[0]] if len(items) % 2 else []
+            start = len(keep) + ((self.n >> h) & 1)
+            levels[h + 1].extend(items[start::2])
+            levels[h] = keep
+            self._resize()
+            if self._size < self._max_size:
+                break
+
+    def _resize(self):
+        depth = len(self.levels)
+        if len(self._capacities) != depth:
+            self._capacities = [
+                max(self.min_capacity,
+                    int(math.ceil(self.k * (2 / 3) ** (depth - h - 1))))
+                for h in range(depth)]
+            self._max_size = sum(self._capacities)
+        self._size = sum(len(level) for level in self.levels)
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self.n += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def update_many(self, values):
+        """
+        Add a sequence of values; the sketch ends up the same as after
+        updating with each in turn
+        """
+        start = 0
+        while start < len(values):
+            stop = start + max(1, self._max_size - self._size)
+            chunk = values[start:stop]
+            self.levels[0].extend(chunk)
+            self.n += len(chunk)
+            self._size += len(chunk)
+            if self._size >= self._max_size:
+                self._compress()
+            start = stop
+
+    def merge(self, other):
+        """Merge another sketch into this one in place"""
+        if not other.n:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in zip(self.levels, other.levels):
+            level.extend(items)
+        self.n += other.n
+        self._resize()
+        while self._size >= self._max_size:
+            size = self._size
+            self._compress()
+            if self._size == size:
+                break
+        return self
+
+    def copy(self):
+        new = KLLSketch(self.k)
+        return new.merge(self)
+
+    def quantiles(self, fractions):
+        """Return the approximate value at each of `fractions` (0 to 1)"""
+        weighted = sorted((value, 1 << h) for h, level
+                          in enumerate(self.levels) for value in level)
+        if not weighted:
+            return [None for _ in fractions]
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for fraction in fractions:
+            target = fraction * total
+            cumulative = 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    break
+            results.append(value)
+        return results
+
+    def to_state(self):
+        return {'k': self.k, 'n': self.n,
+                'levels': [list(level) for level in self.levels]}
+
+    @classmethod
+    def from_state(cls, state):
+        new = cls(state['k'])
+        new.n = state['n']
+        new.levels = [list(level) for level in state['levels']]
+        new._resize()
+        return new
+
+
+_unpack_u64 = struct.Struct('>Q').unpack
+
+try:
+    from hashlib import blake2b
+
+    def stable_hash(data):
+        """64 bit hash of bytes, the same in every process and run"""
+        return _unpack_u64(blake2b(data, digest_size=8).digest())[0]
+except ImportError:  # Python < 3.6
+    def stable_hash(data):
+        """64 bit hash of bytes, the same in every process and run"""
+        return _unpack_u64(hashlib.md5(data).digest()[:8])[0]
+
+
+class HyperLogLog(object):
+    """
+    HyperLogLog distinct count estimator (Flajolet et al., 2007), with the
+    small range correction. Uses 2 ** precision one byte registers; the
+    standard error is about 1.04 / sqrt(2 ** precision), e.g. 1.6% at
+    precision 12 (4 KB).
+
+    Values are hashed with stable_hash, so sketches built in different
+    processes or runs can be merged.
+
+    Parameters
+    ----------
+    precision: int, default 12
+        Between 4 and 18
+    """
+
+    __slots__ = ('precision', 'registers', '_shift', '_mask')
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 18:
+            raise ValueError('HyperLogLog precision must be between 4 and '
+                             '18, got {}'.format(precision))
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._shift = 64 - precision
+        self._mask = (1 << self._shift) - 1
+
+    def add(self, data):
+        """Add a value, as bytes"""
+        hashed = stable_hash(data)
+        rank = self._shift - (hashed & self._mask).bit_length() + 1
+        index = hashed >> self._shift
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Merge another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLogs with precision {} '
+                             'and {}'.format(self.precision, other.precision))
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def copy(self):
+        new = HyperLogLog(self.precision)
+        new.registers = bytearray(self.registers)
+        return new
+
+    def estimate(self):
+        """Estimated number of distinct values added"""
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m,
+                                                      0.7213 / (1 + 1.079 / m))
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_state(self):
+        return {'precision': self.precision,
+                'registers': base64.b64encode(bytes(self.registers))
+                                   .decode('ascii')}
+
+    @classmethod
+    def from_state(cls, state):
+        new = cls(state['precision'])
+        new.registers = bytearray(base64.b64decode(state['registers']))
+        return new
+
+
+class SpaceSaving(object):
+    """
+    Space-Saving heavy hitters (Metwally, Agrawal & El Abbadi, 2005): at
+    most `k` counters. A value without a counter takes over the smallest
+    one, inheriting its count as the error, so for every tracked value
+    count - error <= true count <= count. Any value seen more than n / k
+    times is tracked.
+
+    Merging follows Agarwal et al. (2012): a value missing from a full
+    summary is counted with that summary's smallest count, as error, and
+    the k largest counters are kept.
+
+    Parameters
+    ----------
+    k: int, default 10
+    """
+
+    __slots__ = ('k', 'n', 'counters')
+
+    def __init__(self, k=10):
+        self.k = k
+        self.n = 0
+        self.counters = {}
+
+    def update(self, value):
+        self.n += 1
+        counters = self.counters
+        counter = counters.get(value)
+        if counter is not None:
+            counter[0] += 1
+        elif len(counters) < self.k:
+            counters[value] = [1, 0]
+        else:
+            victim = min(counters, key=lambda v: (counters[v][0], v))
+            count = counters.pop(victim)[0]
+            counters[value] = [count + 1, count]
+
+    def update_many(self, values):
+        """
+        Add a sequence of values; the summary ends up the same as after
+        updating with each in turn
+        """
+        counts = Counter(values)
+        counters = self.counters
+        new = sum(1 for value in counts if value not in counters)
+        if len(counters) + new > self.k:
+            for value in values:
+                self.update(value)
+            return
+        # Nothing would be evicted, so counting is exact
+        for value, count in counts.items():
+            counter = counters.get(value)
+            if counter is None:
+                counters[value] = [count, 0]
+            else:
+                counter[0] += count
+        self.n += len(values)
+
+    def _floor(self):
+        """Count a value missing from this summary may have had"""
+        if len(self.counters) < self.k:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other):
+        """Merge another summary into this one in place"""
+        floors = self._floor(), other._floor()
+        merged = {}
+        for value in set(self.counters) | set(other.counters):
+            count = error = 0
+            for summary, floor in zip([self, other], floors):
+                counter = summary.counters.get(value, (floor, floor))
+                count += counter[0]
+                error += counter[1]
+            merged[value] = [count, error]
+        self.counters = dict((value, merged[value]) for value in sorted(
+            merged, key=lambda v: (-merged[v][0], v))[:self.k])
+        self.n += other.n
+        return self
+
+    def copy(self):
+        new = SpaceSaving(self.k)
+        new.n = self.n
+        new.counters = dict((v, list(c)) for v, c in self.counters.items())
+        return new
+
+    def top(self):
+        """[value, count, error] lists, by descending count"""
+        return [[value, count, error] for value, (count, error) in sorted(
+            self.counters.items(), key=lambda item: (-item[1][0], item[0]))]
+
+    def to_state(self):
+        return {'k': self.k, 'n': self.n, 'counters': self.top()}
+
+    @classmethod
+    def from_state(cls, state):
+        new = cls(state['k'])
+        new.n = state['n']
+        new.counters = dict((value, [count, error])
+                            for value, count, error in state['counters'])
+        return new
+
+
+class ReservoirSample(object):
+    """
+    Uniform random sample of `size` values from a stream, that merges into
+    a uniform sample of the combined streams.
+
+    Each value gets a pseudo-random priority in (0, 1), and the `size`
+    lowest are kept (a bottom-k sample), so merging keeps the lowest of
+    both. Once the sample is full, the number of values to skip before the
+    next one that beats the largest kept priority is drawn directly, so
+    most values cost one comparison.
+
+    Priorities come from mix64 of a key (taken from the salt and the first
+    value) and the value's position, so samples are reproducible for the
+    same input and partitioning. Streams that will be merged need distinct
+    salts: streams with the same key draw the same priorities, so their
+    samples would overlap rather than mix.
+
+    Parameters
+    ----------
+    size: int, default 3
+    salt: int, default None
+        Identifies the stream, e.g. a hash of the partition's first file
+        and offset
+    """
+
+    __slots__ = ('size', 'n', 'items', 'salt', '_key', '_next')
+
+    def __init__(self, size=3, salt=None):
+        self.size = size
+        self.n = 0
+        self.items = []
+        self.salt = salt
+        self._key = None
+        self._next = 0
+
+    @property
+    def values(self):
+        return [value for _, value in self.items]
+
+    def _uniform(self, i):
+        return (mix64((self._key or 0) ^ i) + 0.5) / (MASK64 + 1)
+
+    def _schedule(self, start):
+        """Set the position of the next value to enter the sample"""
+        items = self.items
+        if len(items) < self.size:
+            self._next = start
+        elif items[-1][0] >= 1:
+            self._next = start
+        else:
+            self._next = start + int(math.log(self._uniform(2 * start + 1))
+                                     / math.log1p(-items[-1][0]))
+
+    def update(self, value):
+        position = self.n
+        self.n += 1
+        if position == self._next and self.size:
+            self._insert(position, value)
+
+    def update_many(self, values):
+        """Add a sequence of values, only touching those that are sampled"""
+        start = self.n
+        self.n += len(values)
+        while self.size and self._next < self.n:
+            self._insert(self._next, values[self._next - start])
+
+    def _insert(self, position, value):
+        if self._key is None:
+            self._key = stable_hash(repr(value).encode('utf-8',
+                                                       'surrogatepass'))
+            if self.salt is not None:
+                self._key ^= mix64(self.salt & MASK64)
+        items = self.items
+        priority = self._uniform(2 * position)
+        if len(items) >= self.size:
+            # Given that it beat the largest priority, uniform below it
+            priority *= items[-1][0]
+            items.pop()
+        # Ordered by priority alone: values may not be comparable, and
+        # must not decide which of two equal priorities is kept
+        index = len(items)
+        while index and items[index - 1][0] > priority:
+            index -= 1
+        items.insert(index, (priority, value))
+        self._schedule(position + 1)
+
+    def merge(self, other):
+        """Merge another sample into this one in place"""
+        self.items = sorted(self.items + other.items,
+                            key=itemgetter(0))[:self.size]
+        self.n += other.n
+        if self._key is None:
+            self._key = other._key
+        self._schedule(self.n)
+        return self
+
+    def copy(self):
+        new = ReservoirSample(self.size, self.salt)
+        return new.merge(self)
+
+    def to_state(self):
+        return {'size': self.size, 'n': self.n, 'key': self._key,
+                'salt': self.salt, 'next': self._next,
+                'items': [list(item) for item in self.items]}
+
+    @classmethod
+    def from_state(cls, state):
+        new = cls(state['size'], state.get('salt'))
+        new.n = state['n']
+        new._key = state['key']
+        new.items = [tuple(item) for item in state['items']]
+        new._next = state['next']
+        return new
+
+    @classmethod
+    def from_values(cls, values, n, size=3):
+        """
+        Rebuild a sample from its values alone, e.g. from an exported stats
+        dict, with priorities spread as expected for `n` values seen
+        """
+        new = cls(size)
+        new.n = n
+        new.items = [((i + 1) / (n + 1), value)
+                     for i, value in enumerate(values[:size])]
+        new._schedule(n)
+        return new
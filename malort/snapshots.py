@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Snapshots
+-------
+
+Read and write the raw, mergeable state of a Malort run, so that stats
+computed on different machines can be combined later
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import gzip
+import json
+
+from malort.accumulators import PathStats
+
+
+SNAPSHOT_FORMAT = 'malort-snapshot'
+SNAPSHOT_VERSION = 1
+
+
+def stats_to_state(stats):
+    """
+    Return the JSON serializable state of a stats dict of PathStats (or
+    plain stats dicts), including total_records
+    """
+    state = {'total_records': stats.get('total_records', 0), 'paths': {}}
+    for path, path_stats in stats.items():
+        if path != 'total_records':
+            state['paths'][path] = PathStats.coerce(path_stats).to_state()
+    return state
+
+
+def state_to_stats(state):
+    """Rebuild a stats dict of PathStats from stats_to_state"""
+    stats = dict((path, PathStats.from_state(path_state))
+                 for path, path_state in state['paths'].items())
+    stats['total_records'] = state['total_records']
+    return stats
+
+
+def write_snapshot(stats, filepath):
+    """
+    Write a stats dict to `filepath` as gzipped JSON, with a format name and
+    version header
+
+    Parameters
+    ----------
+    stats: dict
+        Stats dict of PathStats, as built by recur_dict
+    filepath: string
+    """
+    snapshot = {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION}
+    snapshot.update(stats_to_state(stats))
+    blob = json.dumps(snapshot, separators=(',', ':'), sort_keys=True)
+    with gzip.open(filepath, 'wb') as fwrite:
+        fwrite.write(blob.encode('utf-8'))
+
+
+def read_snapshot(filepath):
+    """
+    Read a snapshot written by write_snapshot, and return its stats dict
+
+    Raises
+    ------
+    ValueError
+        If the file isn't a Malort snapshot, or was written by a newer
+        version of Malort
+    """
+    try:
+        with gzip.open(filepath, 'rb') as fread:
+            snapshot = json.loads(fread.read().decode('utf-8'))
+    except (IOError, OSError, ValueError) as e:
+        raise ValueError('Error reading snapshot {}: {}'.format(filepath, e))
+
+    if not isinstance(snapshot, dict) or \
+            snapshot.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError('{} is not a Malort snapshot'.format(filepath))
+    if snapshot.get('version', 0) > SNAPSHOT_VERSION:
+        raise ValueError('Snapshot {} has version {}, this version of Malort '
+                         'reads up to {}'.format(filepath, snapshot['version'],
+                                                 SNAPSHOT_VERSION))
+    return state_to_stats(snapshot)
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Sources
+-------
+
+Finding the files to analyze: directory listings built on os.scandir,
+optionally recursive, with glob/regex include and exclude patterns, size
+and mtime filters, and pruning of partition-style directories
+(key=value, e.g. day=2026-10-01). Sources list files from a local
+directory (LocalSource), an S3-compatible bucket (S3Source), or HTTP(S)
+URLs (HTTPSource), with the same options.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import calendar
+from collections import OrderedDict, namedtuple
+import datetime
+from fnmatch import fnmatch
+import os
+from os.path import isdir, isfile, join, relpath
+import time
+from xml.etree import ElementTree
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+from malort.remote import (HTTPClient, RemoteObject, executor, is_remote,
+                           uri_encode)
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+
+class _ListdirEntry(object):
+    """The parts of os.DirEntry used here, for Pythons without scandir"""
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = join(directory, name)
+
+    def is_dir(self, follow_symlinks=True):
+        return isdir(self.path) and (follow_symlinks
+                                     or not os.path.islink(self.path))
+
+    def is_file(self):
+        return isfile(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def _entries(directory):
+    """Directory entries sorted by name"""
+    if scandir is None:
+        entries = [_ListdirEntry(directory, n) for n in os.listdir(directory)]
+    else:
+        it = scandir(directory)
+        try:
+            entries = list(it)
+        finally:
+            if hasattr(it, 'close'):
+                it.close()
+    entries.sort(key=lambda e: e.name)
+    return entries
+
+
+def split_partition(name):
+    """'day=2026-10-01' -> ('day', '2026-10-01'); None for other names"""
+    key, sep, value = name.partition('=')
+    return (key, value) if sep and key else None
+
+
+def path_partitions(filepath, root):
+    """
+    Return an OrderedDict of the partition values in the directories
+    between `root` and `filepath`: 'root/year=2026/day=01/a.json' ->
+    {'year': '2026', 'day': '01'}
+    """
+    parts = relpath(filepath, root).split(os.sep)[:-1]
+    return OrderedDict(p for p in map(split_partition, parts) if p)
+
+
+def partition_matches(condition, value):
+    """
+    Test a partition value against a partition_filter condition: a string
+    (equal), a list or set (member), a (low, high) tuple (inclusive range,
+    compared as strings, either end None for open), or a callable
+    """
+    if callable(condition):
+        return bool(condition(value))
+    if isinstance(condition, tuple):
+        low, high = condition
+        return ((low is None or value >= low)
+                and (high is None or value <= high))
+    if isinstance(condition, (list, set, frozenset)):
+        return value in condition
+    return value == condition
+
+
+STRING_TYPES = (str, type(u''))
+
+
+def _patterns(patterns):
+    """A list of patterns from one pattern, a list of them, or None"""
+    if patterns is None:
+        return []
+    if isinstance(patterns, STRING_TYPES) or hasattr(patterns, 'search'):
+        return [patterns]
+    return list(patterns)
+
+
+def path_matches(patterns, rel):
+    """
+    True if the '/'-separated relative path `rel` matches any of
+    `patterns`: compiled regexes are searched for in `rel`; globs with a
+    '/' are matched against `rel`, and others against its last part
+    """
+    name = rel.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        if hasattr(pattern, 'search'):
+            if pattern.search(rel):
+                return True
+        elif fnmatch(rel if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def to_epoch(value):
+    """Epoch seconds for a number, or a datetime (naive ones are UTC)"""
+    if value is None or not isinstance(value, datetime.datetime):
+        return value
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def list_files(path, recursive=False, include=None, exclude=None,
+               max_depth=None, min_size=None, max_size=None,
+               modified_after=None, modified_before=None,
+               partition_filter=None):
+    """
+    Generate the paths of the files in directory `path`, in sorted order.
+    The listing is streamed: each directory is read as the walk reaches
+    it, so files can be analyzed while the rest of the tree is listed.
+
+    Parameters
+    ----------
+    path: string
+        Directory path
+    recursive: boolean, default False
+        Also list the files in subdirectories. Symlinks to directories are
+        not followed.
+    include: glob string, compiled regex, or list of them, default None
+        Only list files whose path relative to `path` (with '/'
+        separators) matches one of these; see path_matches
+    exclude: glob string, compiled regex, or list of them, default None
+        Skip files and directories matching one of these. Excluded
+        directories are not walked.
+    max_depth: int, default None
+        With `recursive`, the deepest subdirectory level to walk; 0 is
+        `path` only
+    min_size, max_size: int, default None
+        Only list files with at least / at most this many bytes
+    modified_after, modified_before: number or datetime, default None
+        Only list files whose mtime (epoch seconds) is at or after / at or
+        before these
+    partition_filter: dict, default None
+        Conditions on partition directories named key=value (see
+        partition_matches), e.g. {'day': ('2026-10-01', '2026-10-07')}.
+        Partition directories with a key in the filter whose value doesn't
+        match are not walked. Use path_partitions to get a file's
+        partition values.
+    """
+    return walk_entries(_entries, path, recursive, include, exclude,
+                        max_depth, min_size, max_size, modified_after,
+                        modified_before, partition_filter)
+
+
+def walk_entries(entries, root, recursive=False, include=None, exclude=None,
+                 max_depth=None, min_size=None, max_size=None,
+                 modified_after=None, modified_before=None,
+                 partition_filter=None):
+    """
+    list_files over any tree: `entries(directory)` returns the sorted
+    entries of a directory, with the name, path, is_dir(), is_file() and
+    stat() of os.DirEntry, and directories are walked from `root`
+    """
+    include, exclude = _patterns(include), _patterns(exclude)
+    partition_filter = partition_filter or {}
+    modified_after = to_epoch(modified_after)
+    modified_before = to_epoch(modified_before)
+    need_stat = (min_size, max_size, modified_after,
+                 modified_before) != (None, None, None, None)
+    if not recursive:
+        max_depth = 0
+
+    def keep_file(entry, rel):
+        if include and not path_matches(include, rel):
+            return False
+        if need_stat:
+            stat = entry.stat()
+            if ((min_size is not None and stat.st_size < min_size)
+                    or (max_size is not None and stat.st_size > max_size)
+                    or (modified_after is not None
+                        and stat.st_mtime < modified_after)
+                    or (modified_before is not None
+                        and stat.st_mtime > modified_before)):
+                return False
+        return True
+
+    def keep_dir(name):
+        partition = split_partition(name)
+        if partition is None or partition[0] not in partition_filter:
+            return True
+        return partition_matches(partition_filter[partition[0]],
+                                 partition[1])
+
+    def walk(directory, prefix, depth):
+        for entry in entries(directory):
+            rel = prefix + entry.name
+            if exclude and path_matches(exclude, rel):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if ((max_depth is None or depth < max_depth)
+                        and keep_dir(entry.name)):
+                    for filepath in walk(entry.path, rel + '/', depth + 1):
+                        yield filepath
+            elif entry.is_file() and keep_file(entry, rel):
+                yield entry.path
+
+    return walk(root, '', 0)
+
+
+class LocalSource(object):
+    """Files in a local directory"""
+
+    def __init__(self, path):
+        self.root = path
+
+    def list_files(self, **options):
+        """Generate file paths; see list_files for the options"""
+        return list_files(self.root, **options)
+
+
+ObjectStat = namedtuple('ObjectStat', ['st_size', 'st_mtime'])
+
+
+class _ObjectEntry(object):
+    """
+    A remote prefix, or an object (a RemoteObject, or a future of one), as
+    a directory entry for walk_entries
+    """
+
+    def __init__(self, name, path, obj=None):
+        self.name = name
+        self._path = path
+        self._obj = obj
+
+    @property
+    def path(self):
+        if self._obj is None:
+            return self._path
+        if not isinstance(self._obj, RemoteObject):
+            self._obj = self._obj.result()
+        return self._obj
+
+    def is_dir(self, follow_symlinks=True):
+        return self._obj is None
+
+    def is_file(self):
+        return self._obj is not None
+
+    def stat(self):
+        return ObjectStat(self.path.size, self.path.mtime)
+
+
+def parse_iso_time(value):
+    """Epoch seconds for an S3 listing's '2026-10-01T12:00:00.000Z'"""
+    seconds = calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+    fraction = value[19:].rstrip('Z')
+    return seconds + (float(fraction) if fraction.startswith('.') else 0)
+
+
+def _children(element, tag):
+    return [e for e in element if e.tag.rsplit('}', 1)[-1] == tag]
+
+
+def _text(element, tag):
+    found = _children(element, tag)
+    return (found[0].text or '') if found else None
+
+
+class S3Source(object):
+    """
+    Objects in an S3-compatible bucket (AWS S3, MinIO, Ceph, ...), listed
+    with ListObjectsV2 and read with ranged GETs. Keys under `prefix` are
+    walked like directories split on '/', so partition_filter and exclude
+    prune prefixes without listing them.
+
+    Parameters
+    ----------
+    endpoint: string
+        e.g. 'https://s3.us-east-1.amazonaws.com' or 'http://localhost:9000'.
+        Buckets are addressed path-style, endpoint/bucket/key.
+    bucket: string
+    prefix: string, default ''
+        Only list keys under this prefix, treated as a directory
+    options:
+        HTTPClient options: concurrency (range requests in flight per
+        object), chunksize, timeout, retries, headers, access_key,
+        secret_key, region, session_token; see malort.remote.HTTPClient
+    """
+
+    def __init__(self, endpoint, bucket, prefix='', **options):
+        self.endpoint = endpoint.rstrip('/')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = HTTPClient(**options)
+        self.root = self.url(self.prefix)
+
+    def url(self, key):
+        """The URL of an object"""
+        return '{}/{}/{}'.format(self.endpoint, uri_encode(self.bucket),
+                                 uri_encode(key, safe='-_.~/'))
+
+    def list_prefix(self, prefix, delimiter='/'):
+        """
+        Yield (key, size, mtime, etag) for the keys, and (prefix, None,
+        None, None) for the common prefixes, under `prefix`, following
+        continuation tokens
+        """
+        query = [('list-type', '2'), ('prefix', prefix)]
+        if delimiter:
+            query.append(('delimiter', delimiter))
+        token = None
+        while True:
+            page = query + ([('continuation-token', token)] if token else [])
+            url = '{}/{}?{}'.format(
+                self.endpoint, uri_encode(self.bucket),
+                '&'.join('{}={}'.format(uri_encode(k), uri_encode(v))
+                         for k, v in page))
+            _, _, body = self.client.request('GET', url)
+            root = ElementTree.fromstring(body)
+            for item in _children(root, 'Contents'):
+                yield (_text(item, 'Key'), int(_text(item, 'Size')),
+                       parse_iso_time(_text(item, 'LastModified')),
+                       (_text(item, 'ETag') or '').strip('"') or None)
+            for item in _children(root, 'CommonPrefixes'):
+                yield _text(item, 'Prefix'), None, None, None
+            token = _text(root, 'NextContinuationToken')
+            if _text(root, 'IsTruncated') != 'true' or not token:
+                return
+
+    def _entries(self, prefix):
+        entries = []
+        for key, size, mtime, etag in self.list_prefix(prefix):
+            name = key[len(prefix):].rstrip('/')
+            if not name:
+                # The prefix itself, or a directory marker object
+                continue
+            if size is None:
+                entries.append(_ObjectEntry(name, key))
+            else:
+                obj = RemoteObject(self.url(key), size, mtime, etag,
+                                   key[len(self.prefix):], self.client)
+                entries.append(_ObjectEntry(name, key, obj))
+        entries.sort(key=lambda e: e.name)
+        return entries
+
+    def list_files(self, **options):
+        """
+        Generate RemoteObjects for the keys under the prefix; see
+        list_files for the options
+        """
+        return walk_entries(self._entries, self.prefix, **options)
+
+
+class HTTPSource(object):
+    """
+    Objects at a list of HTTP(S) URLs, read with ranged GETs. The URL
+    paths are walked as a tree, so the include, exclude and size and
+    mtime options of list_files apply to them; every URL is listed,
+    whatever its depth. Each object's size comes from a HEAD request,
+    made concurrently for the files in a directory as the walk reaches it.
+
+    Parameters
+    ----------
+    urls: list of strings
+    options:
+        HTTPClient options, see S3Source
+    """
+
+    def __init__(self, urls, **options):
+        self.client = HTTPClient(**options)
+        self.root = ''
+        self.tree = {}
+        for url in set(urls):
+            parts = urlsplit(url).path.lstrip('/').split('/')
+            directory = ''
+            for part in parts[:-1]:
+                self.tree.setdefault(directory, set()).add((part, ''))
+                directory += part + '/'
+            self.tree.setdefault(directory, set()).add((parts[-1], url))
+
+    def _entries(self, directory):
+        entries = []
+        for name, url in sorted(self.tree.get(directory, ())):
+            if not url:
+                entries.append(_ObjectEntry(name, directory + name + '/'))
+            else:
+                obj = executor().submit(RemoteObject.from_url, url,
+                                        directory + name, self.client)
+                entries.append(_ObjectEntry(name, url, obj))
+        return entries
+
+    def list_files(self, recursive=None, max_depth=None, **options):
+        """
+        Generate RemoteObjects for the URLs; see list_files for the
+        options. recursive and max_depth are ignored: an explicit list of
+        URLs has nothing to walk, so every URL is listed.
+        """
+        return walk_entries(self._entries, '', True, **options)
+
+
+def get_source(path):
+    """A source for analyze: a LocalSource for a directory path, or `path`
+    itself if it is already a source"""
+    if hasattr(path, 'list_files'):
+        return path
+    return LocalSource(path)
+
+
+def relative_name(filepath, root):
+    """A listed file's path relative to its source's root, '/'-separated"""
+    if is_remote(filepath):
+        return filepath.name
+    return relpath(filepath, root).replace(os.sep, '/')
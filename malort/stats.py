@@ -8,40 +8,44 @@ Functions to generate Malort stats
 """
 from __future__ import absolute_import, print_function, division
 
-import decimal
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
 import json
-import os
-from os.path import isfile, join, splitext
-import random
-import re
+import threading
+
+from malort.accumulators import (JSONFloat, PathStats, StatsOptions,
+                                 accumulator_class, combine_means,
+                                 get_new_mean)
+from malort.compression import open_file
+from malort.decoders import get_decoder, json_loads
+from malort.metrics import clock
+from malort.readers import (is_blank, is_json_document, iter_array_records,
+                            iter_file_records, iter_partition_records,
+                            split_stream)
+from malort.sketches import QUANTILES, stable_hash
+from malort.sources import get_source
+from malort.timestamps import ISO8601, is_timestamp
 
 
-ISO8601 = re.compile(r"""^([\+-]?\d{4}(?!\d{2}\b))((-?)((0[1-9]|1[0-2])(\3([12]
-                      \d|0[1-9]|3[01]))?|W([0-4]\d|5[0-2])(-?[1-7])?|(00[1-9]
-                      |0[1-9]\d|[12]\d{2}|3([0-5]\d|6[1-6])))([T\s]((([01]\d|
-                      2[0-3])((:?)[0-5]\d)?|24\:?00)([\.,]\d+(?!:))?)?(\17[0-5]
-                      \d([\.,]\d+)?)?([zZ]|([\+-])([01]\d|2[0-3]):?([0-5]\d)?)
-                      ?)?)?$""", re.VERBOSE)
+def delimited(file, delimiter='\n', bufsize=4096):
+    """
+    Yield `delimiter` separated records from a text or binary file object.
+    See malort.readers.split_stream.
+    """
+    return split_stream(file, delimiter, bufsize)
 
 
-def delimited(file, delimiter='\n', bufsize=4096):
-    buf = ''
-    while True:
-        newbuf = file.read(bufsize)
-        if not newbuf:
-            yield buf
-            return
-        buf += newbuf
-        lines = buf.split(delimiter)
-        for line in lines[:-1]:
-            yield line
-        buf = lines[-1]
-
-
-def catch_json_error(blob, filepath, **kwargs):
-    """Wrapper to provide better error message for JSON reads"""
+def catch_json_error(blob, filepath, loads=None, **kwargs):
+    """
+    Wrapper to provide better error message for JSON reads. `loads` is a
+    decoder from malort.decoders.get_decoder; by default json_loads with
+    `kwargs`.
+    """
+    if loads is None:
+        loads = partial(json_loads, **kwargs)
     try:
-        parsed = json.loads(blob, **kwargs)
+        parsed = loads(blob)
     except ValueError as e:
         raise ValueError("JSON error reading {}: {}!".format(filepath,
                                                              e.args[0]))
@@ -49,10 +53,14 @@ def catch_json_error(blob, filepath, **kwargs):
     return parsed
 
 
-def dict_generator(path, delimiter='\n', **kwargs):
+def dict_generator(path, delimiter='\n', decoder='auto', stream_arrays=False,
+                   recursive=False, include=None, exclude=None,
+                   max_depth=None, partition_filter=None, **kwargs):
     """
     Given a directory path, return a generator that will return a dict for each
-    .json file and `delimiter` separated blob in a text file.
+    .json file and `delimiter` separated blob in a text file. Files may be
+    compressed (gzip, bz2, xz or zstd, see malort.compression); .json.gz
+    etc. are .json files.
 
     Ex: In directory 'files' you have the following
     foo.json: '{"foo": 1}'
@@ -63,45 +71,83 @@ def dict_generator(path, delimiter='\n', **kwargs):
 
     Parameters
     ----------
-    path: string
-        Directory path
-    delimiter: string, default None
-        Delimiter for text files with delimited JSON
+    path: string or source
+        Directory path, or a source from malort.sources
+    delimiter: string, default '\\n'
+        Delimiter for text files with delimited JSON. Files are split as
+        bytes, and each record is handed to the decoder undecoded.
+    decoder: string, default 'auto'
+        JSON decoder; see malort.decoders.get_decoder
+    stream_arrays: boolean, default False
+        Generate a dict for each element of a .json file's top-level array,
+        reading the file incrementally (see malort.readers.array_spans)
+    recursive, include, exclude, max_depth, partition_filter:
+        Which files to read; see malort.sources.list_files
+    kwargs: passed into json.loads
+    """
+    loads = get_decoder(decoder, **kwargs)
+    files = get_source(path).list_files(
+        recursive=recursive, include=include, exclude=exclude,
+        max_depth=max_depth, partition_filter=partition_filter)
+    for filepath in files:
+        if not is_json_document(filepath):
+            for row in iter_file_records(filepath, delimiter):
+                if not is_blank(row):
+                    yield catch_json_error(row, filepath, loads)
+
+        elif stream_arrays:
+            for row in iter_array_records(filepath):
+                if not is_blank(row):
+                    yield catch_json_error(row, filepath, loads)
+
+        else:
+            with open_file(filepath) as fread:
+                yield catch_json_error(fread.read(), filepath, loads)
+
+
+def value_accumulator(value, parse_timestamps=True, path_stats=None):
+    """
+    Return the accumulator class for a value, based on its type. Strings that
+    match ISO8601 are classified as datetimes if `parse_timestamps` is True.
+    `path_stats` lets the timestamp check reuse the layout last seen at the
+    value's path.
     """
-    for f in os.listdir(path):
-        filepath = join(path, f)
-        if isfile(filepath):
-            with open(filepath, 'r') as fread:
-                blobs = delimited(fread, delimiter)
-                if splitext(f)[1] != '.json':
-                    for row in blobs:
-                        if row != '':
-                            yield catch_json_error(row, filepath, **kwargs)
+    value_type = type(value).__name__
 
-                else:
-                    yield catch_json_error(fread.read(), filepath, **kwargs)
+    # Python 2.7
+    if value_type == 'unicode':
+        value_type = 'str'
 
+    # Datetimes
+    if (value_type == 'str' and parse_timestamps
+            and is_timestamp(value, path_stats)):
+        value_type = 'datetime'
 
-def get_new_mean(value, current_mean, count):
-    """Given a value, current mean, and count, return new mean"""
-    summed = current_mean * count
-    return (summed + value)/(count + 1)
+    return accumulator_class(value_type)
 
 
-def combine_means(means, counts):
-    """Combine ordered iter of means and counts"""
-    numer = sum([mean * count for mean, count in zip(means, counts)
-                 if mean is not None and count is not None])
-    denom = sum([c for c in counts if c is not None])
-    return round(numer / denom, 3)
+def export_stats(stats):
+    """
+    Convert a stats dict holding PathStats accumulators into the plain
+    nested dict format found in `MalortResult.stats`
+    """
+    exported = {}
+    for field_name, field_stats in stats.items():
+        if isinstance(field_stats, PathStats):
+            field_stats = field_stats.to_dict()
+        exported[field_name] = field_stats
+    return exported
 
 
 def combine_stats(accum, value):
     """
-    Combine two sets of stats into one. Used for final dask rollup of
+    Combine two sets of stats into one. Used for final rollup of
     multiple partitions of stats dicts into one unified stats dict. Best
     thought of as a reduction over multiple stats object.
 
+    Entries may be PathStats accumulators or plain stats dicts; accumulators
+    are merged in place, dict entries in `accum` stay dicts.
+
     Parameters
     ----------
     accum: dict
@@ -118,72 +164,30 @@ def combine_stats(accum, value):
 
         # Update total count
         if field_name == "total_records":
-            accum["total_records"] = accum["total_records"] + type_stats
+            accum["total_records"] = accum.get("total_records", 0) + type_stats
             continue
 
-        # Combine accum stats from different branches
-        if accum.get(field_name):
-            for value_type, val_stats in type_stats.items():
-                accum_entry = accum[field_name].get(value_type)
-                if not accum_entry:
-                    # If accum doesn't already have an entry, but the
-                    # value does, continue
-                    accum[field_name][value_type] = val_stats
-                    continue
-
-                # base_key is not a statistic to be updated
-                if value_type == "base_key":
-                    continue
-
-                if accum_entry:
-                    max_ = (accum_entry.get("max"), val_stats.get("max"))
-                    min_ = (accum_entry.get("min"), val_stats.get("min"))
-                    count = (accum_entry.get("count"), val_stats.get("count"))
-                    mean = (accum_entry.get("mean"), val_stats.get("mean"))
-
-                    if any(max_):
-                        accum_entry["max"] = max(max_)
-                    if any(min_):
-                        accum_entry["min"] = min(min_)
-                    if any(count):
-                        accum_entry["count"] = sum([c for c in count
-                                                    if c is not None])
-                    if any(mean):
-                        accum_entry["mean"] = combine_means(mean, count)
-
-                    # Type specific entries
-                    if value_type  == "float":
-
-                        fixed_length = (accum_entry.get("fixed_length"),
-                                        val_stats.get("fixed_length"))
-
-                        # Decimals not fixed length if prec/scale do not match
-                        a_prec, a_scale = (accum_entry.get("max_precision"),
-                                           accum_entry.get("max_scale"))
-                        v_prec, v_scale = (val_stats.get("max_precision"),
-                                           val_stats.get("max_scale"))
-                        prec_scale_eq = (a_prec == v_prec, a_scale == v_scale)
-
-                        if not all(fixed_length) or not all(prec_scale_eq):
-                            accum_entry["fixed_length"] = False
-
-                        max_prec = (accum_entry.get("max_precision"),
-                                    val_stats.get("max_precision"))
-                        accum_entry["max_precision"] = max(max_prec)
-
-                        max_scale = (accum_entry.get("max_scale"),
-                                     val_stats.get("max_scale"))
-                        accum_entry["max_scale"] = max(max_scale)
-
-                    elif value_type == "str":
-                        samples = accum_entry.get("sample", []) +\
-                                  val_stats.get("sample", [])
-                        accum_entry["sample"] = random.sample(
-                            samples, min(len(samples), 3))
+        accum_entry = accum.get(field_name)
+        if accum_entry is None:
+            if isinstance(type_stats, PathStats):
+                type_stats = type_stats.copy()
+            accum[field_name] = type_stats
+        elif isinstance(accum_entry, PathStats):
+            accum_entry.merge(PathStats.coerce(type_stats))
+        else:
+            merged = PathStats.from_dict(accum_entry)
+            merged.merge(PathStats.coerce(type_stats))
+            accum[field_name] = merged.to_dict()
 
     return accum
 
 
+# Stats exported from sketches, which don't survive a round-trip through an
+# exported dict
+SKETCH_KEYS = frozenset([name for name, _ in QUANTILES]
+                        + ['top_k', 'approx_distinct'])
+
+
 def updated_entry_stats(value, current_stats, parse_timestamps=True):
     """
     Given a value and a dict of current statistics, return a dict of new
@@ -197,77 +201,167 @@ def updated_entry_stats(value, current_stats, parse_timestamps=True):
     update_entry_stats(10, current_stats)
     {'count': 2, 'max': 10, 'min': 5, 'mean': 7.5}
 
+    `recur_dict` updates PathStats accumulators in place instead; this is
+    the equivalent for a single value against plain stats dicts. Plain
+    dicts can't hold the sketches, so quantiles, top_k and approx_distinct
+    are never returned; the keys returned depend only on the type.
+
     Parameters
     ----------
     value: str, int, float, boolean
     current_stats: Dict, see Example
     """
-    value_type = type(value).__name__
+    acc_cls = value_accumulator(value, parse_timestamps)
+    acc = acc_cls.from_dict(current_stats.get(acc_cls.name, {}))
+    acc.update(value)
+    return acc_cls.name, dict((k, v) for k, v in acc.to_dict().items()
+                              if k not in SKETCH_KEYS)
 
-    # Python 2.7
-    if value_type == 'unicode':
-        value_type = 'str'
 
-    # Datetimes
-    if value_type == 'str' and parse_timestamps and ISO8601.match(value):
-        value_type = 'datetime'
+SCALAR_TYPES = frozenset([str, int, float, JSONFloat, bool, type(None)])
+TEXT_TYPES = frozenset([str, type(u'')])
+
 
-    new_stats = {}
-    stats = current_stats.get(value_type, {})
-    if value_type == 'str':
-        val = len(value)
-    else:
-        val = value
-    count = stats.get('count', 0)
-    if value_type in ['str', 'int', 'float']:
-        max_, min_, mean = (stats.get('max', val),
-                            stats.get('min', val),
-                            stats.get('mean', 0))
-
-        new_stats['mean'] = round(get_new_mean(val, mean, count), 3)
-        new_stats['max'] = val if max_ < val else max_
-        new_stats['min'] = val if min_ > val else min_
-
-        if value_type == 'str':
-            sample = stats.get('sample', [])
-            if len(sample) == 3:
-                if random.randint(0, 1):
-                    sample.pop(0)
-                    sample.append(value)
+def record_shape(value):
+    """
+    Return a hashable fingerprint of the nesting structure of a dict or list:
+    its keys in order, and which values are themselves dicts or lists. Lists
+    are only fingerprinted up to their first scalar, as that is where
+    recur_dict stops walking them.
+    """
+    if isinstance(value, dict):
+        keys = tuple(value)
+        if SCALAR_TYPES.issuperset(map(type, value.values())):
+            return keys
+        return (keys, tuple([record_shape(v) if isinstance(v, (dict, list))
+                             else None for v in value.values()]))
+    shape = [list]
+    for v in value:
+        if isinstance(v, (dict, list)):
+            shape.append(record_shape(v))
+        else:
+            shape.append(None)
+            break
+    return tuple(shape)
+
+
+def flatten_plan(value, parent='', accessor=()):
+    """
+    Return the flattened list of (path, base_key, accessor, dump) fields that
+    recur_dict would update for `value`, in the same order. `accessor` is the
+    sequence of keys/indices leading to the field, and `dump` is True for
+    lists of values, which are stored as their JSON string.
+    """
+    plan = []
+    if isinstance(value, dict):
+        for k, v in value.items():
+            parent_path = '.'.join([parent, k]) if parent != '' else k
+            if isinstance(v, (list, dict)):
+                plan.extend(flatten_plan(v, parent_path, accessor + (k,)))
             else:
-                sample.append(value)
-            new_stats['sample'] = sample
-
-        elif value_type == 'float':
-            dec_tup = decimal.Decimal(str(value)).as_tuple()
-            vprec, vscale = len(dec_tup.digits), abs(dec_tup.exponent)
-            mxprec = stats.get('max_precision', vprec)
-            mxscale = stats.get('max_scale', vscale)
-            if mxprec != vprec or mxscale != vscale:
-                new_stats['fixed_length'] = False
+                plan.append((parent_path, k, accessor + (k,), False))
+
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            if isinstance(v, (list, dict)):
+                plan.extend(flatten_plan(v, parent, accessor + (i,)))
             else:
-                new_stats['fixed_length'] = True
-            new_stats['max_precision'] = vprec if mxprec < vprec else mxprec
-            new_stats['max_scale'] = vscale if mxscale < vscale else mxscale
+                plan.append((parent, parent.split(".")[-1], accessor, True))
+                break
 
-    new_stats['count'] = count + 1
+    return plan
 
-    return value_type, new_stats
 
+class ShapeCache(object):
+    """
+    Bounded LRU cache of flattened field plans, keyed by record shape. Lets
+    recur_dict skip the recursive walk and dotted-path building for records
+    whose structure it has already seen.
+
+    Parameters
+    ----------
+    maxsize: int, default 256
+        Maximum number of shapes to keep; the least recently used shape is
+        evicted first.
+    """
 
-def recur_dict(stats, value, parent=None, **kwargs):
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._plans)
+
+    def __getstate__(self):
+        return {'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+
+    def get_plan(self, value):
+        """Return the (path, base_key, accessor, dump) plan for `value`"""
+        return self._get_entry(value)[0]
+
+    def get_bound_plan(self, stats, value, options=None):
+        """
+        Return the plan for `value` as (accessor, PathStats, dump) entries,
+        with each field's PathStats taken from (or added to) `stats`, and
+        new PathStats created with StatsOptions `options`. If `stats`
+        doesn't keep a new PathStats (see malort.streaming.BoundedStats),
+        the plan is bound again for the next record, so it is offered to
+        `stats` once per record as without the cache.
+        """
+        entry = self._get_entry(value)
+        plan, bound_stats, bound = entry
+        if bound_stats is not stats:
+            bound = []
+            kept = True
+            for path, base_key, accessor, dump in plan:
+                path_stats = stats.get(path)
+                if path_stats is None:
+                    path_stats = stats[path] = PathStats(base_key, options)
+                    kept = kept and path in stats
+                bound.append((accessor, path_stats, dump))
+            if kept:
+                entry[1:] = [stats, bound]
+        return bound
+
+    def _get_entry(self, value):
+        shape = record_shape(value)
+        with self._lock:
+            entry = self._plans.pop(shape, None)
+            if entry is None:
+                entry = [flatten_plan(value), None, None]
+                if len(self._plans) >= self.maxsize:
+                    self._plans.popitem(last=False)
+            self._plans[shape] = entry
+        return entry
+
+
+def recur_dict(stats, value, parent=None, shape_cache=None,
+               options=None, **kwargs):
     """
     Recurse through a dict `value` and update `stats` for each field.
     Can handle nested dicts, lists of dicts, and lists of values (must be
     JSON parsable)
 
+    Each field in `stats` is a PathStats accumulator, updated in place; use
+    `export_stats` to get the plain stats dict.
+
     Parameters
     ----------
     value: dict
     stats: dict
     parent: string, default None
         Parent key to get key nesting depth.
-    kwargs: Options for update_entry_stats
+    shape_cache: ShapeCache, default None
+        If provided, top-level dicts are updated from the cached field plan
+        for their shape rather than walked recursively.
+    options: StatsOptions, default None
+        Sketch options for new paths: distinct counts, top values and sample
+        size. See malort.accumulators.StatsOptions.
+    kwargs: Options for value_accumulator
     """
     parent = parent or ''
 
@@ -275,31 +369,216 @@ def recur_dict(stats, value, parent=None, **kwargs):
         total_records = stats.get("total_records")
         stats["total_records"] = (total_records + 1) if total_records else 1
 
+        if shape_cache is not None and isinstance(value, dict):
+            parse_timestamps = kwargs.get('parse_timestamps', True)
+            for accessor, path_stats, dump in shape_cache.get_bound_plan(
+                    stats, value, options):
+                if len(accessor) == 1:
+                    field = value[accessor[0]]
+                else:
+                    field = value
+                    for k in accessor:
+                        field = field[k]
+                if dump:
+                    field = json.dumps(field)
+                path_stats.update(
+                    value_accumulator(field, parse_timestamps, path_stats),
+                    field)
+            return stats
+
     def update_stats(current_val, nested_path, base_key):
         "Updater function"
-        if nested_path not in stats:
-            stats[nested_path] = {}
-        current_stats = stats.get(nested_path)
-        value_type, new_stats = updated_entry_stats(current_val, current_stats,
-                                                    **kwargs)
-        current_stats[value_type] = new_stats
-        current_stats['base_key'] = base_key
+        path_stats = stats.get(nested_path)
+        if path_stats is None:
+            path_stats = stats[nested_path] = PathStats(base_key, options)
+        path_stats.update(
+            value_accumulator(current_val, path_stats=path_stats, **kwargs),
+            current_val)
 
     if isinstance(value, dict):
         for k, v in value.items():
             parent_path = '.'.join([parent, k]) if parent != '' else k
             if isinstance(v, (list, dict)):
-                recur_dict(stats, v, parent_path)
+                recur_dict(stats, v, parent_path,
+                           options=options, **kwargs)
             else:
                 update_stats(v, parent_path, k)
 
     elif isinstance(value, list):
         for v in value:
             if isinstance(v, (list, dict)):
-                recur_dict(stats, v, parent)
+                recur_dict(stats, v, parent,
+                           options=options, **kwargs)
             else:
                 base_key = parent.split(".")[-1]
                 update_stats(json.dumps(value), parent, base_key)
                 return stats
 
     return stats
+
+
+def batch_stats(stats, records, parse_timestamps=True, shape_cache=None,
+                options=None):
+    """
+    Update `stats` with a batch of records, with the same result as calling
+    recur_dict on each. Values are first gathered into one column per path
+    and type, and each column is then added to its accumulator with a
+    single update_many call, which computes min/max/sum/m2 over the whole
+    column (vectorized with NumPy, if installed) and adds it to the sketches
+    in bulk, instead of paying for a full accumulator update per value.
+
+    Parameters
+    ----------
+    stats: dict
+    records: list of dicts
+    parse_timestamps: boolean, default True
+    shape_cache: ShapeCache, default None
+        If provided, field plans for dict records come from the cache
+    options: StatsOptions, default None
+        See recur_dict
+    """
+    if not records:
+        return stats
+    # id(plan) -> (plan, [(accessor, path_stats, dump, typed columns)]);
+    # holding the plan keeps its id from being reused
+    bound_plans = {}
+    # path -> {accumulator class: [values]}, and the same in insertion order
+    column_index = {}
+    columns = []
+
+    def bind(plan):
+        entries = []
+        for path, base_key, accessor, dump in plan:
+            path_stats = stats.get(path)
+            if path_stats is None:
+                path_stats = stats[path] = PathStats(base_key, options)
+            typed = column_index.get(path)
+            if typed is None:
+                typed = column_index[path] = {}
+                columns.append((path_stats, typed))
+            entries.append((len(accessor) == 1, accessor, path_stats, dump,
+                            typed))
+        return entries
+
+    # Accumulator class by value type, for types whose class doesn't depend
+    # on the value (strings may be timestamps)
+    classes = {}
+    str_cls = accumulator_class('str')
+    datetime_cls = accumulator_class('datetime')
+
+    for record in records:
+        if shape_cache is not None and isinstance(record, dict):
+            plan = shape_cache.get_plan(record)
+            bound = bound_plans.get(id(plan))
+            if bound is None:
+                bound = bound_plans[id(plan)] = (plan, bind(plan))
+            entries = bound[1]
+        else:
+            entries = bind(flatten_plan(record))
+        for single, accessor, path_stats, dump, typed in entries:
+            if single:
+                field = record[accessor[0]]
+            else:
+                field = record
+                for k in accessor:
+                    field = field[k]
+            if dump:
+                field = json.dumps(field)
+            field_type = type(field)
+            acc_cls = classes.get(field_type)
+            if acc_cls is None:
+                if parse_timestamps and field_type in TEXT_TYPES:
+                    acc_cls = (datetime_cls if is_timestamp(field, path_stats)
+                               else str_cls)
+                else:
+                    acc_cls = classes[field_type] = value_accumulator(
+                        field, parse_timestamps)
+            column = typed.get(acc_cls)
+            if column is None:
+                typed[acc_cls] = [field]
+            else:
+                column.append(field)
+
+    for path_stats, typed in columns:
+        for acc_cls, values in typed.items():
+            path_stats.update_many(acc_cls, values)
+    stats['total_records'] = stats.get('total_records', 0) + len(records)
+    return stats
+
+
+def partition_stats(partition, delimiter='\n', parse_timestamps=True,
+                    shape_cache_size=256, head=None, options=None,
+                    batch_size=1024, decoder='auto', stream_arrays=False,
+                    metrics=None, digests=None, **kwargs):
+    """
+    Return the stats dict for one partition from
+    malort.readers.plan_partitions. Each partition gets its own stats dict
+    and ShapeCache, so partitions can be analyzed in parallel and the
+    results rolled up with combine_stats.
+
+    Parameters
+    ----------
+    partition: list of (filepath, start, stop) tuples
+    delimiter: string, default '\\n'
+    parse_timestamps: boolean, default True
+    shape_cache_size: int, default 256
+        Set to 0 to disable the shape cache
+    head: int, default None
+        Only analyze the first `head` records of each file
+    options: StatsOptions, default None
+        See recur_dict
+    batch_size: int, default 1024
+        Records per batch_stats call. 0 or None to update the stats one
+        record at a time with recur_dict.
+    decoder: string, default 'auto'
+        JSON decoder; see malort.decoders.get_decoder
+    stream_arrays: boolean, default False
+        See malort.readers.iter_partition_records
+    metrics: malort.metrics.PartitionMetrics, default None
+        Add the time spent reading, decoding and updating the stats, and
+        the records and bytes read, to this
+    digests: dict, default None
+        Add the SHA-1 digests of the files read whole to this; see
+        malort.readers.iter_partition_records
+    kwargs: passed into json.loads
+    """
+    loads = get_decoder(decoder, **kwargs)
+    stats = {}
+    shape_cache = ShapeCache(shape_cache_size) if shape_cache_size else None
+    if partition:
+        # Salt the value samples with the partition's first file and
+        # offset, so the samples of different partitions mix when merged
+        filepath, start, _ = partition[0]
+        salt = stable_hash(repr((str(filepath), start)).encode(
+            'utf-8', 'surrogatepass'))
+        options = (options or StatsOptions())._replace(salt=salt)
+    records = iter_partition_records(partition, delimiter, head,
+                                     stream_arrays, digests)
+    while True:
+        start = clock()
+        raw = list(islice(records, batch_size or 1024))
+        if not raw:
+            return stats
+        read = clock()
+        batch = [catch_json_error(record, filepath, loads)
+                 for filepath, record in raw]
+        decoded = clock()
+        if batch_size:
+            batch_stats(stats, batch, parse_timestamps=parse_timestamps,
+                        shape_cache=shape_cache, options=options)
+        else:
+            for value in batch:
+                recur_dict(stats, value, parse_timestamps=parse_timestamps,
+                           shape_cache=shape_cache, options=options)
+        if metrics is not None:
+            metrics.add_batch(raw, read - start, decoded - read,
+                              clock() - decoded)
+
+
+def hashed_partition_stats(partition, **kwargs):
+    """
+    partition_stats that also returns the SHA-1 digests of the files it
+    read whole: (stats, {str(filepath): hexdigest})
+    """
+    digests = {}
+    return partition_stats(partition, digests=digests, **kwargs), digests
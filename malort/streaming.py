@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Streaming
+-------
+
+Incremental analysis of records as they arrive, for consumers of unbounded
+record sources
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import calendar
+import datetime
+import numbers
+import threading
+import time
+
+from malort.accumulators import StatsOptions
+from malort.core import MalortResult
+from malort.decoders import get_decoder
+from malort.stats import ShapeCache, combine_stats, recur_dict
+
+
+class BoundedStats(dict):
+    """
+    Stats dict that ignores new paths once it holds `max_paths` of them,
+    counting the ignored insertions in `dropped`. recur_dict inserts a new
+    path for each record it is in, with or without a shape cache. Updates
+    to existing paths are unaffected.
+    """
+
+    def __init__(self, max_paths):
+        super(BoundedStats, self).__init__()
+        self.max_paths = max_paths
+        self.dropped = 0
+
+    def __setitem__(self, key, value):
+        if (key in self or key == 'total_records'
+                or len(self) - ('total_records' in self) < self.max_paths):
+            dict.__setitem__(self, key, value)
+        else:
+            self.dropped += 1
+
+
+class StreamAnalyzer(object):
+    """
+    Incrementally build Malort stats from records fed one at a time or in
+    batches, and take snapshots of the stats so far as MalortResults.
+
+    Memory use depends on the number of key paths, not on the number of
+    records: records are not kept, and each path holds fixed-size
+    accumulators. `max_paths` bounds the number of paths for sources whose
+    keys are unbounded (e.g. ids used as keys).
+
+    Records are fed into a delta stats dict. A snapshot swaps in a fresh
+    delta, and merges the old one into the base stats outside the feed lock,
+    so taking a snapshot costs time proportional to the number of paths and
+    only blocks feeding for the swap. It's safe to feed from several
+    threads, and to snapshot from another.
+
+    Parameters
+    ----------
+    parse_timestamps: boolean, default True
+        If True, will attempt to regex match ISO8601 formatted strings
+    shape_cache_size: int, default 256
+        See analyze. Set to 0 to disable.
+    max_paths: int, default None
+        Maximum number of key paths to track. Paths first seen after the
+        limit is reached are ignored, and counted in `dropped_paths`.
+    distinct_precision, top_k, sample_size, decoder:
+        See analyze
+    kwargs:
+        passed into json.loads for records fed as JSON strings or bytes
+    """
+
+    def __init__(self, parse_timestamps=True, shape_cache_size=256,
+                 max_paths=None, distinct_precision=None, top_k=10,
+                 sample_size=3, decoder='auto', **kwargs):
+        self.parse_timestamps = parse_timestamps
+        self.max_paths = max_paths
+        self.options = StatsOptions(distinct_precision, top_k, sample_size)
+        self.json_kwargs = kwargs
+        self._loads = get_decoder(decoder, **kwargs)
+        self._shape_cache = (ShapeCache(shape_cache_size)
+                             if shape_cache_size else None)
+        self._feed_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._base = self._new_stats()
+        self._delta = self._new_stats()
+        self._generation = 0
+        self._delta_options = self.options._replace(salt=0)
+        self._dropped = 0
+        self._start_time = time.time()
+
+    def _new_stats(self):
+        if self.max_paths is None:
+            return {}
+        return BoundedStats(self.max_paths)
+
+    def _swap_delta(self):
+        """
+        Swap in a fresh delta, with its own sample salt so that deltas
+        starting with the same values don't draw the same priorities.
+        Call with the feed lock held.
+        """
+        delta, self._delta = self._delta, self._new_stats()
+        self._generation += 1
+        self._delta_options = self.options._replace(salt=self._generation)
+        return delta
+
+    def _parse(self, record):
+        if isinstance(record, (bytes, str, type(u''))):
+            return self._loads(record)
+        return record
+
+    def feed(self, record):
+        """Add a record: a dict, or a JSON string/bytes"""
+        record = self._parse(record)
+        with self._feed_lock:
+            recur_dict(self._delta, record,
+                       parse_timestamps=self.parse_timestamps,
+                       shape_cache=self._shape_cache,
+                       options=self._delta_options)
+
+    def feed_many(self, records):
+        """Add an iterable of records, taking the feed lock once"""
+        records = [self._parse(r) for r in records]
+        with self._feed_lock:
+            for record in records:
+                recur_dict(self._delta, record,
+                           parse_timestamps=self.parse_timestamps,
+                           shape_cache=self._shape_cache,
+                           options=self._delta_options)
+
+    @property
+    def dropped_paths(self):
+        """
+        Number of new path insertions ignored because of max_paths: once
+        for each record and path ignored by the delta the record was fed
+        into, and once for each path ignored when a delta is merged into
+        the snapshot stats. The count doesn't depend on shape_cache_size.
+        """
+        return self._dropped + getattr(self._delta, 'dropped', 0)
+
+    def snapshot(self):
+        """Return a MalortResult for all records fed since the last reset"""
+        with self._snapshot_lock:
+            with self._feed_lock:
+                delta = self._swap_delta()
+            combine_stats(self._base, delta)
+            self._dropped += (getattr(delta, 'dropped', 0)
+                              + getattr(self._base, 'dropped', 0))
+            if self.max_paths is not None:
+                self._base.dropped = 0
+            state = dict((k, v.copy() if k != 'total_records' else v)
+                         for k, v in self._base.items())
+        return MalortResult.from_state(state, time.time() - self._start_time)
+
+    def reset(self):
+        """Discard all stats"""
+        with self._snapshot_lock:
+            with self._feed_lock:
+                self._base = self._new_stats()
+                self._swap_delta()
+                self._dropped = 0
+                self._start_time = time.time()
+
+
+class WindowedAnalyzer(object):
+    """
+    Malort stats over a moving time window, so that recent schema changes
+    aren't swamped by history.
+
+    Records are assigned to buckets of `step` seconds by their timestamp,
+    and each bucket keeps its own mergeable stats. Buckets that fall out of
+    the window as time moves forward are evicted, so at most window / step
+    buckets are held. snapshot() merges the buckets in the window.
+
+    * Tumbling windows: step == window (the default). Each window is one
+      bucket; use `on_expire` to get each window's stats when it closes.
+    * Sliding windows: window is a multiple of step, e.g. window=3600,
+      step=300 for the last hour, advancing every 5 minutes.
+
+    Parameters
+    ----------
+    window: float
+        Window length in seconds
+    step: float, default None
+        Bucket length in seconds; defaults to `window`
+    time_key: string, default None
+        Top-level record key holding the record's time, as epoch seconds or
+        a datetime (naive datetimes are taken as UTC). If None, records are
+        timed by `clock` when fed, unless feed is given a timestamp.
+    clock: callable, default time.time
+    on_expire: callable, default None
+        Called with a MalortResult for each bucket evicted from the window
+    parse_timestamps: boolean, default True
+    shape_cache_size: int, default 256
+    distinct_precision, top_k, sample_size, decoder:
+        See analyze
+    kwargs:
+        passed into json.loads for records fed as JSON strings or bytes
+    """
+
+    def __init__(self, window, step=None, time_key=None, clock=time.time,
+                 on_expire=None, parse_timestamps=True, shape_cache_size=256,
+                 distinct_precision=None, top_k=10, sample_size=3,
+                 decoder='auto', **kwargs):
+        step = step or window
+        buckets = window / step
+        if step <= 0 or buckets != int(buckets):
+            raise ValueError('window must be a positive multiple of step')
+        self.window = window
+        self.step = step
+        self.n_buckets = int(buckets)
+        self.time_key = time_key
+        self.clock = clock
+        self.on_expire = on_expire
+        self.parse_timestamps = parse_timestamps
+        self.options = StatsOptions(distinct_precision, top_k, sample_size)
+        self.json_kwargs = kwargs
+        self._loads = get_decoder(decoder, **kwargs)
+        self.late_records = 0
+        self._shape_cache = (ShapeCache(shape_cache_size)
+                             if shape_cache_size else None)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._bucket_options = {}
+        self._latest = None
+
+    def _timestamp(self, record, timestamp):
+        if timestamp is None and self.time_key is not None:
+            timestamp = record.get(self.time_key)
+        if timestamp is None:
+            return self.clock()
+        if isinstance(timestamp, datetime.datetime):
+            return calendar.timegm(timestamp.utctimetuple())
+        if isinstance(timestamp, numbers.Number):
+            return timestamp
+        raise ValueError('Record time must be epoch seconds or a datetime, '
+                         'got {!r}'.format(timestamp))
+
+    def _advance(self, bucket):
+        """Move the window end to `bucket`; return the expired buckets"""
+        expired = []
+        if self._latest is None or bucket > self._latest:
+            self._latest = bucket
+            for old in sorted(self._buckets):
+                if old > bucket - self.n_buckets:
+                    break
+                expired.append((old, self._buckets.pop(old)))
+                del self._bucket_options[old]
+        return expired
+
+    def _expire(self, expired):
+        if self.on_expire is not None:
+            for bucket, stats in expired:
+                self.on_expire(self._result(stats, bucket, bucket))
+
+    def _result(self, stats, first, last):
+        window = {'start': first * self.step, 'end': (last + 1) * self.step}
+        return MalortResult.from_state(stats, window=window)
+
+    def feed(self, record, timestamp=None):
+        """
+        Add a record: a dict, or a JSON string/bytes. `timestamp` (epoch
+        seconds or datetime) overrides time_key and the clock. Records older
+        than the window are dropped, and counted in `late_records`.
+        """
+        if isinstance(record, (bytes, str, type(u''))):
+            record = self._loads(record)
+        bucket = int(self._timestamp(record, timestamp) // self.step)
+        with self._lock:
+            expired = self._advance(bucket)
+            if bucket <= self._latest - self.n_buckets:
+                self.late_records += 1
+            else:
+                stats = self._buckets.get(bucket)
+                if stats is None:
+                    stats = self._buckets[bucket] = {}
+                    # Buckets are merged into windows, so their samples
+                    # need distinct salts
+                    self._bucket_options[bucket] = self.options._replace(
+                        salt=bucket)
+                recur_dict(stats, record,
+                           parse_timestamps=self.parse_timestamps,
+                           shape_cache=self._shape_cache,
+                           options=self._bucket_options[bucket])
+        self._expire(expired)
+
+    def feed_many(self, records, timestamp=None):
+        """Add an iterable of records"""
+        for record in records:
+            self.feed(record, timestamp)
+
+    def snapshot(self, now=None):
+        """
+        Return a MalortResult for the current window, with the window's
+        `start` and `end` times in `result.window`. The window ends with
+        the bucket of the latest record, or of `now` (epoch seconds) if
+        given, which also evicts buckets that have expired by then.
+        """
+        with self._lock:
+            expired = []
+            if now is not None:
+                expired = self._advance(int(now // self.step))
+            end = self._latest if self._latest is not None else 0
+            first = end - self.n_buckets + 1
+            stats = {}
+            for bucket in sorted(self._buckets):
+                if first <= bucket <= end:
+                    combine_stats(stats, self._buckets[bucket])
+        self._expire(expired)
+        return self._result(stats, first, end)
+
+
+def analyze_iter(records, snapshot_every=None, snapshot_interval=None,
+                 **kwargs):
+    """
+    Analyze an iterable of records (dicts, or JSON strings/bytes), which may
+    be unbounded, yielding MalortResult snapshots of the stats so far as it
+    goes, and a final snapshot when `records` is exhausted.
+
+    Parameters
+    ----------
+    records: iterable
+    snapshot_every: int, default None
+        Yield a snapshot every `snapshot_every` records
+    snapshot_interval: float, default None
+        Yield a snapshot when at least this many seconds have passed since
+        the last one. Checked as records arrive.
+    kwargs:
+        passed to StreamAnalyzer
+    """
+    analyzer = StreamAnalyzer(**kwargs)
+    last = time.time()
+    for count, record in enumerate(records, 1):
+        analyzer.feed(record)
+        due = snapshot_every is not None and count % snapshot_every == 0
+        if snapshot_interval is not None and \
+                time.time() - last >= snapshot_interval:
+            due = True
+        if due:
+            last = time.time()
+            yield analyzer.snapshot()
+    yield analyzer.snapshot()
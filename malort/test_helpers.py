@@ -5,9 +5,27 @@ Malort Test Helpers
 Test Runner: PyTest
 
 """
+import datetime
 import os
+import socket
+import threading
 import unittest
 
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, unquote, urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import parse_qsl, urlsplit
+
+from xml.sax.saxutils import escape
+
+from malort.remote import sign_v4
+from malort.stats import export_stats
+
 
 TEST_FILES_1 = os.path.normpath(os.path.join(os.path.abspath(__file__),
                                 '..', 'tests', 'test_files'))
@@ -18,10 +36,171 @@ TEST_FILES_3 = os.path.normpath(os.path.join(os.path.abspath(__file__),
 TEST_FILES_4 = os.path.normpath(os.path.join(os.path.abspath(__file__),
                                 '..', 'tests', 'test_files_mult_type'))
 
+
+class ObjectStoreServer(ThreadingMixIn, HTTPServer):
+    """
+    A local stand-in for an S3-compatible object store, serving
+    `objects` ({'bucket/key': bytes}) path-style with keep-alive
+    connections: GET with Range, HEAD, and ListObjectsV2 (prefix,
+    delimiter, max-keys and continuation tokens). With `credentials`
+    ((access_key, secret_key)), requests must carry a valid Signature V4.
+    Counts connections and requests, and can fail the next `fail_next`
+    requests with 503s, or delay every response by `latency` seconds.
+
+    Use as a context manager; `url` is the endpoint.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, objects, credentials=None, max_keys=1000,
+                 latency=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _ObjectStoreHandler)
+        self.objects = objects
+        self.credentials = credentials
+        self.max_keys = max_keys
+        self.latency = latency
+        self.fail_next = 0
+        self.connections = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class _ObjectStoreHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Don't hold back small writes waiting for delayed ACKs
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def authorized(self):
+        auth = self.headers.get('Authorization')
+        if auth is None:
+            return False
+        signed = auth.split('SignedHeaders=')[1].split(',')[0].split(';')
+        headers = dict((k, self.headers[k]) for k in signed
+                       if k not in ('host', 'x-amz-date',
+                                    'x-amz-content-sha256'))
+        now = datetime.datetime.strptime(self.headers['x-amz-date'],
+                                         '%Y%m%dT%H%M%SZ')
+        access_key, secret_key = self.server.credentials
+        expected = sign_v4(self.command,
+                           'http://{}{}'.format(self.headers['Host'],
+                                                self.path),
+                           headers, access_key, secret_key, now=now)
+        return expected['Authorization'] == auth
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path,
+                                    self.headers.get('Range')))
+            failing = server.fail_next > 0
+            server.fail_next -= failing
+        if server.latency:
+            threading.Event().wait(server.latency)
+        if failing:
+            return self.reply(503)
+        if server.credentials and not self.authorized():
+            return self.reply(403, b'<Error>SignatureDoesNotMatch</Error>')
+        parts = urlsplit(self.path)
+        path = unquote(parts.path).lstrip('/')
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        if query.get('list-type') == '2':
+            return self.list_objects(path.rstrip('/'), query)
+        if path not in server.objects:
+            return self.reply(404, b'<Error>NoSuchKey</Error>')
+        data = server.objects[path]
+        headers = {'Last-Modified': 'Thu, 01 Oct 2026 00:00:00 GMT',
+                   'ETag': '"{}"'.format(len(data))}
+        byte_range = self.headers.get('Range')
+        if byte_range is None:
+            return self.reply(200, data, headers)
+        start, stop = byte_range.split('=')[1].split('-')
+        start, stop = int(start), min(int(stop) + 1, len(data))
+        if start >= len(data):
+            return self.reply(416)
+        headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, stop - 1,
+                                                           len(data))
+        self.reply(206, data[start:stop], headers)
+
+    def list_objects(self, bucket, query):
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter')
+        entries = []
+        for path in sorted(self.server.objects):
+            if not path.startswith(bucket + '/'):
+                continue
+            key = path[len(bucket) + 1:]
+            if not key.startswith(prefix):
+                continue
+            rest = key[len(prefix):]
+            if delimiter and delimiter in rest:
+                common = prefix + rest.split(delimiter)[0] + delimiter
+                if not entries or entries[-1] != ('prefix', common):
+                    entries.append(('prefix', common))
+            else:
+                entries.append(('key', key))
+        token = query.get('continuation-token')
+        first = int(token) if token else 0
+        page = entries[first:first + self.server.max_keys]
+        truncated = first + len(page) < len(entries)
+        body = ['<?xml version="1.0" encoding="UTF-8"?>',
+                '<ListBucketResult xmlns='
+                '"http://s3.amazonaws.com/doc/2006-03-01/">',
+                '<IsTruncated>{}</IsTruncated>'.format(
+                    'true' if truncated else 'false')]
+        if truncated:
+            body.append('<NextContinuationToken>{}</NextContinuationToken>'
+                        .format(first + len(page)))
+        for kind, key in page:
+            if kind == 'prefix':
+                body.append('<CommonPrefixes><Prefix>{}</Prefix>'
+                            '</CommonPrefixes>'.format(escape(key)))
+            else:
+                size = len(self.server.objects[bucket + '/' + key])
+                body.append('<Contents><Key>{}</Key><Size>{}</Size>'
+                            '<LastModified>2026-10-01T00:00:00.000Z'
+                            '</LastModified><ETag>"{}"</ETag></Contents>'
+                            .format(escape(key), size, size))
+        body.append('</ListBucketResult>')
+        self.reply(200, ''.join(body).encode('utf-8'),
+                   {'Content-Type': 'application/xml'})
+
 class TestHelpers(unittest.TestCase):
 
     def assert_stats(self, result, expected):
         """Test helper for testing stats results"""
+        result = export_stats(result)
         for key, value in result.items():
             if key == 'total_records':
                 self.assertEqual(expected['total_records'], value)
@@ -29,7 +208,9 @@ class TestHelpers(unittest.TestCase):
             for typek, typev in value.items():
                 if typek == 'str':
                     for k, v in typev.items():
-                        if isinstance(v, list):
+                        if k == 'top_k':
+                            self.assertEqual(expected[key][typek][k], v)
+                        elif isinstance(v, list):
                             self.assertTrue(len(v) <= 3)
                             for item in v:
                                 self.assertIn(item, expected[key][typek][k])
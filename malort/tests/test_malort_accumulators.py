@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Accumulator Tests
+
+Test Runner: PyTest
+
+"""
+import math
+import random
+import unittest
+
+import malort as mt
+from malort.accumulators import (FloatStats, IntStats, JSONFloat, PathStats,
+                                 StatsOptions, StrStats, accumulator_class,
+                                 float_precision_scale)
+
+
+class TestAccumulators(unittest.TestCase):
+
+    def test_int_update_in_place(self):
+        acc = IntStats()
+        for value in [5, 1, 9]:
+            acc.update(value)
+        self.assertDictEqual(acc.to_dict(),
+                             {'count': 3, 'max': 9, 'min': 1, 'mean': 5.0,
+                              'stddev': 3.266,
+                              'p50': 5, 'p95': 9, 'p99': 9, 'p99.9': 9})
+
+    def test_mean_stddev_stable_across_merges(self):
+        rng = random.Random(5)
+        values = [1e9 + rng.random() for _ in range(2000)]
+        values[::7] = [1e16, -1e16] * (len(values[::7]) // 2)
+        mean = math.fsum(values) / len(values)
+        stddev = math.sqrt(math.fsum((v - mean) ** 2 for v in values)
+                           / len(values))
+        whole = FloatStats()
+        merged = FloatStats()
+        for start in range(0, len(values), 13):
+            part = FloatStats()
+            for value in values[start:start + 13]:
+                whole.update(value)
+                part.update(value)
+            merged.merge(part)
+        for acc in (whole, merged):
+            self.assertEqual(acc.mean, mean)
+            self.assertAlmostEqual(acc.stddev / stddev, 1, places=9)
+
+        ints = IntStats()
+        for value in [2 ** 62, 1, -2 ** 62]:
+            ints.update(value)
+        self.assertEqual(ints.total, 1)
+
+    def test_update_many(self):
+        for acc_cls, values in [
+                (IntStats, [3, -1, 2 ** 65, 7]),
+                (FloatStats, [JSONFloat(v) for v in ['1.10', '2.25', '3.5']]),
+                (FloatStats, [JSONFloat(v) for v in ['1.10', '2.25']]),
+                (StrStats, ['a', 'bbb', 'a', 'cc'])]:
+            expected, batched = acc_cls(), acc_cls()
+            for value in values:
+                expected.update(value)
+            batched.update_many(values[:1])
+            batched.update_many(values[1:])
+            self.assertDictEqual(batched.to_dict(), expected.to_dict())
+
+    def test_float_fixed_length_is_sticky(self):
+        acc = FloatStats()
+        for value in [1.5, 10.25, 10.25]:
+            acc.update(value)
+        self.assertFalse(acc.fixed_length)
+        self.assertEqual((acc.max_precision, acc.max_scale), (4, 2))
+
+    def test_float_precision_scale(self):
+        expected = {'2.345': (4, 3), '-2.345': (4, 3), '1.10': (3, 2),
+                    '10.0': (3, 1), '0.0': (1, 1), '0.05': (1, 2),
+                    '-0.050': (2, 3), '1e5': (6, 0), '1.5E-3': (2, 4),
+                    '2.50e+2': (3, 0)}
+        for raw, prec_scale in expected.items():
+            self.assertEqual(float_precision_scale(JSONFloat(raw)),
+                             prec_scale, raw)
+        self.assertEqual(float_precision_scale(2.345), (4, 3))
+        self.assertEqual(float_precision_scale(1e-05), (1, 5))
+        self.assertEqual(float_precision_scale(float('nan')), (0, 0))
+
+    def test_float_token_keeps_trailing_zeros(self):
+        acc = FloatStats()
+        for raw in ['1.10', '2.25']:
+            acc.update(JSONFloat(raw))
+        stats = acc.to_dict()
+        self.assertTrue(stats['fixed_length'])
+        self.assertEqual((stats['max_precision'], stats['max_scale']), (3, 2))
+        self.assertIs(type(stats['max']), float)
+
+    def test_str_sample_bounded(self):
+        acc = StrStats()
+        for value in ['a', 'bb', 'ccc', 'dddd', 'eeeee']:
+            acc.update(value)
+        self.assertEqual(len(acc.sample), 3)
+        self.assertEqual((acc.min, acc.max, acc.count), (1, 5, 5))
+
+    def test_str_top_k_merges_exactly(self):
+        # 21 distinct values: exact with k=21, bounded errors with k=10
+        values = ['v{}'.format(i % 7) * (i % 3 + 1) for i in range(40)]
+        options = StatsOptions(top_k=21)
+        expected = StrStats(options)
+        for value in values:
+            expected.update(value)
+        for split in [1, 13, 39]:
+            accs = [StrStats(options), StrStats(options)]
+            for acc, part in zip(accs, [values[:split], values[split:]]):
+                for value in part:
+                    acc.update(value)
+            merged = accs[0].merge(accs[1])
+            self.assertEqual(merged.to_dict()['top_k'],
+                             expected.to_dict()['top_k'])
+            self.assertEqual(len(merged.sample), 3)
+            self.assertTrue(set(merged.sample) <= set(values))
+
+        small = StrStats()
+        for value in values:
+            small.update(value)
+        for value, count, error in small.to_dict()['top_k']:
+            self.assertTrue(count - error <= values.count(value) <= count)
+
+    def test_str_sample_is_reproducible(self):
+        options = StatsOptions(sample_size=5)
+        samples = []
+        for _ in range(2):
+            acc = StrStats(options)
+            for i in range(1000):
+                acc.update('value{}'.format(i))
+            samples.append(acc.sample)
+        self.assertEqual(samples[0], samples[1])
+        self.assertEqual(len(set(samples[0])), 5)
+
+    def test_dict_round_trip(self):
+        stats = {'float': {'count': 2, 'max': 4.0, 'min': 2.0, 'mean': 3.0,
+                           'max_precision': 2, 'max_scale': 1,
+                           'fixed_length': True},
+                 'bool': {'count': 1},
+                 'base_key': 'bar'}
+        self.assertDictEqual(PathStats.from_dict(stats).to_dict(), stats)
+
+    def test_unknown_type_counts(self):
+        acc_cls = accumulator_class('Decimal')
+        self.assertIs(acc_cls, accumulator_class('Decimal'))
+        path_stats = PathStats('foo')
+        path_stats.update(acc_cls, object())
+        self.assertDictEqual(path_stats.to_dict(),
+                             {'Decimal': {'count': 1}, 'base_key': 'foo'})
+
+    def test_merge_copies_new_types(self):
+        first, second = PathStats('foo'), PathStats('foo')
+        second.update(IntStats, 1)
+        first.merge(second)
+        second.update(IntStats, 100)
+        self.assertEqual(first.types['int'].max, 1)
+
+
+class TestCombineAccumulators(unittest.TestCase):
+
+    def test_combine_path_stats(self):
+        first = mt.stats.recur_dict({}, {'foo': 1, 'bar': 'baz'})
+        second = mt.stats.recur_dict({}, {'foo': 3, 'qux': True})
+        combined = mt.stats.combine_stats(first, second)
+        self.assertIsInstance(combined['foo'], PathStats)
+        exported = mt.stats.export_stats(combined)
+        self.assertDictEqual(exported['foo'],
+                             {'int': {'count': 2, 'max': 3, 'min': 1,
+                                      'mean': 2.0,
+                                      'stddev': 1.0, 'p50': 1, 'p95': 3,
+                                      'p99': 3, 'p99.9': 3},
+                              'base_key': 'foo'})
+        self.assertDictEqual(exported['qux'],
+                             {'bool': {'count': 1}, 'base_key': 'qux'})
+        self.assertEqual(exported['total_records'], 2)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Backend Tests
+
+Test Runner: PyTest
+
+"""
+import operator
+import os
+import random
+import threading
+import unittest
+
+import pytest
+
+import malort as mt
+from malort.backends import (Backend, ThreadBackend, get_backend,
+                             prefix_reduce, tree_reduce)
+from malort.test_helpers import TestHelpers, TEST_FILES_2, TEST_FILES_4
+
+
+def square(x):
+    return x * x
+
+
+def pid(x):
+    return os.getpid()
+
+
+class TestBackends(unittest.TestCase):
+
+    def test_map(self):
+        for name in ['serial', 'thread', 'process', 'auto']:
+            with get_backend(name, workers=2) as backend:
+                results = backend.map(square, iter(range(50)))
+                self.assertEqual(sorted(results), [x * x for x in range(50)])
+
+    def test_dask_backend(self):
+        pytest.importorskip('dask.bag')
+        backend = get_backend('dask')
+        self.assertEqual(sorted(backend.map(square, range(5))),
+                         [0, 1, 4, 9, 16])
+
+    def test_auto_backend(self):
+        with get_backend(workers=2) as backend:
+            self.assertEqual(list(backend.map(pid, [0])), [os.getpid()])
+            self.assertIsNone(backend._process)
+            self.assertNotIn(os.getpid(), backend.map(pid, range(4)))
+            pool = backend._process
+            self.assertIsNotNone(pool)
+            self.assertEqual(list(backend.map(pid, [])), [])
+            self.assertEqual(backend.submit(pid, 0).result(), os.getpid())
+            list(backend.map(square, range(4)))
+            self.assertIs(backend._process, pool)
+        self.assertIsNone(backend._process)
+
+    def test_get_backend(self):
+        backend = ThreadBackend(workers=3)
+        self.assertIs(get_backend(backend), backend)
+        self.assertEqual(backend.max_pending, 6)
+        with self.assertRaises(ValueError):
+            get_backend('spark')
+
+    def test_bounded_and_cancelled(self):
+        submitted = []
+        release = threading.Event()
+
+        def items():
+            for i in range(100):
+                submitted.append(i)
+                yield i
+
+        def wait(x):
+            release.wait()
+            return x
+
+        with ThreadBackend(workers=2, max_pending=4) as backend:
+            results = backend.map(wait, items())
+            release.set()
+            next(results)
+            self.assertLessEqual(len(submitted), 6)
+            results.close()
+
+    def test_tree_reduce(self):
+        add = operator.add
+        self.assertEqual(tree_reduce(add, enumerate(range(11)), 2), 55)
+        self.assertEqual(tree_reduce(add, [(0, 'a')]), 'a')
+        self.assertIsNone(tree_reduce(add, []))
+        with self.assertRaises(ValueError):
+            tree_reduce(add, [(0, 1)], fan_in=1)
+
+    def test_tree_reduce_shape(self):
+        pair = lambda a, b: (a, b)
+        items = list(enumerate('abcdefg'))
+        for fan_in, expected in [
+                (2, ((('a', 'b'), ('c', 'd')), (('e', 'f'), 'g'))),
+                (3, (((('a', 'b'), 'c'), (('d', 'e'), 'f')), 'g')),
+                (8, ((((((('a', 'b'), 'c'), 'd'), 'e'), 'f'), 'g')))]:
+            for seed in range(5):
+                random.Random(seed).shuffle(items)
+                result = tree_reduce(pair, iter(items), fan_in)
+                self.assertEqual(result, expected, fan_in)
+
+    def test_tree_reduce_on_workers(self):
+        threads = []
+
+        def pair(a, b):
+            threads.append(threading.current_thread())
+            return (a, b)
+
+        items = list(enumerate('abcdefg'))
+        random.Random(0).shuffle(items)
+        merges = []
+        with ThreadBackend(workers=2) as backend:
+            result = tree_reduce(pair, iter(items), 2, backend.submit,
+                                 merges.append)
+        self.assertEqual(result, ((('a', 'b'), ('c', 'd')),
+                                  (('e', 'f'), 'g')))
+        # Complete nodes ran on the workers, the last ones in this thread
+        main = threading.current_thread()
+        self.assertEqual(len([t for t in threads if t is not main]), 4)
+        self.assertEqual(len(merges), 6)
+
+        with get_backend('process', workers=2) as backend:
+            self.assertEqual(tree_reduce(operator.add, enumerate(range(100)),
+                                         4, backend.submit), 4950)
+
+    def test_prefix_reduce(self):
+        items = [(2, 'c'), (0, 'a'), (3, 'd'), (1, 'b')]
+        self.assertEqual(prefix_reduce(operator.add, items), ('abcd', 4))
+        checked = []
+
+        def check(accum, count):
+            checked.append(accum)
+            return count == 2
+
+        self.assertEqual(prefix_reduce(operator.add, iter(items), check),
+                         ('ab', 2))
+        self.assertEqual(checked, ['a', 'ab'])
+        self.assertEqual(prefix_reduce(operator.add, [], check), (None, 0))
+
+
+class TestAnalyzeBackends(TestHelpers):
+
+    def test_backends_agree(self):
+        for path in [TEST_FILES_2, TEST_FILES_4]:
+            results = [mt.analyze(path, backend=backend, blocksize=50)
+                       for backend in ['serial', 'thread', 'process',
+                                       'auto']]
+            for result in results[1:]:
+                self.assertEqual(result.count, results[0].count)
+                self.assertDictEqual(result.stats, results[0].stats)
+
+    def test_backend_left_open(self):
+        class Counting(Backend):
+            closed = False
+
+            def map(self, func, items):
+                return map(func, items)
+
+            def close(self):
+                self.closed = True
+
+        backend = Counting()
+        result = mt.analyze(TEST_FILES_2, backend=backend)
+        self.assertEqual(result.count, 4)
+        self.assertFalse(backend.closed)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Compression Tests
+
+Test Runner: PyTest
+
+"""
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+import pytest
+
+import malort as mt
+from malort.compression import (detect_codec, iter_members, member_offsets,
+                                member_ranges, prefetch,
+                                strip_codec_extension)
+from malort.readers import (iter_file_records, iter_partition_records,
+                            iter_record_offsets, plan_partitions)
+from malort.test_helpers import TEST_FILES_2
+
+
+def bgzf(data, size):
+    """Compress `data` as BGZF: gzip members of `size` input bytes, with
+    their sizes in the header"""
+    members = []
+    for start in range(0, len(data), size):
+        block = data[start:start + size]
+        compress = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        body = compress.compress(block) + compress.flush()
+        header = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff'
+                  + struct.pack('<H2sHH', 6, b'BC', 2, len(body) + 25))
+        members.append(header + body + struct.pack(
+            '<II', zlib.crc32(block) & 0xFFFFFFFF, len(block)))
+    return b''.join(members)
+
+
+def zstd_raw_frame(payload):
+    """A zstd frame holding `payload` in one raw (uncompressed) block"""
+    return (b'\x28\xb5\x2f\xfd\x24' + struct.pack('<B', len(payload))
+            + struct.pack('<I', len(payload) << 3 | 1)[:3] + payload
+            + b'\x00' * 4)
+
+
+class TestCompression(unittest.TestCase):
+
+    lines = [json.dumps({'id': i, 'name': 'x' * (i % 37)}).encode('utf-8')
+             for i in range(3000)]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as fwrite:
+            fwrite.write(data)
+        return path
+
+    def test_detect_codec(self):
+        data = b'\n'.join(self.lines)
+        self.assertEqual(detect_codec(self.write('a.ndjson.gz', b'')), 'gzip')
+        self.assertEqual(detect_codec(self.write('b.zst', b'')), 'zstd')
+        self.assertEqual(detect_codec(self.write('c', bz2.compress(data))),
+                         'bz2')
+        self.assertEqual(detect_codec(self.write('d', gzip.compress(data))),
+                         'gzip')
+        self.assertIsNone(detect_codec(self.write('e.json', data)))
+        self.assertEqual(strip_codec_extension('x/a.json.GZ'), 'x/a.json')
+        self.assertEqual(strip_codec_extension('x/a.json'), 'x/a.json')
+
+    def test_iter_members(self):
+        first, second = gzip.compress(b'abc'), gzip.compress(b'def')
+        members = list(iter_members(io.BytesIO(first + second), 'gzip', 4))
+        self.assertEqual(b''.join(d for _, d in members), b'abcdef')
+        self.assertEqual(sorted(set(m for m, _ in members)),
+                         [0, len(first)])
+        with self.assertRaises(EOFError):
+            list(iter_members(io.BytesIO(first[:-5]), 'gzip'))
+
+    def test_member_offsets(self):
+        data = b'\n'.join(self.lines)
+        path = self.write('data.bgz', bgzf(data, 5000))
+        offsets = member_offsets(path, 'gzip')
+        self.assertEqual(len(offsets), (len(data) - 1) // 5000 + 1)
+        self.assertIsNone(member_offsets(self.write('plain.gz',
+                                                    gzip.compress(data)),
+                                         'gzip'))
+        self.assertEqual(member_ranges(path, 'gzip', 1 << 30), [(0, None)])
+
+        frames = [zstd_raw_frame(b'a' * 200),
+                  b'\x50\x2a\x4d\x18' + struct.pack('<I', 3) + b'xyz',
+                  zstd_raw_frame(b'b' * 100)]
+        path = self.write('data.zst', b''.join(frames))
+        self.assertEqual(member_offsets(path, 'zstd'), [0, 213, 224])
+
+    def test_records(self):
+        data = b'\n'.join(self.lines) + b'\n'
+        for name, blob in [('a.gz', gzip.compress(data)),
+                           ('b.bz2', bz2.compress(data)),
+                           ('c.xz', lzma.compress(data)),
+                           ('d.gz', gzip.compress(data[:9999])
+                            + gzip.compress(data[9999:]))]:
+            path = self.write(name, blob)
+            records = [r for r in iter_file_records(path) if r]
+            self.assertEqual(records, self.lines, name)
+
+    def test_split_members(self):
+        for delimiter in [b'\n', b'\r\n', b'|']:
+            path = self.write('data.bgz',
+                              bgzf(delimiter.join(self.lines), 777))
+            whole = set(k for k, r in iter_record_offsets(path, delimiter))
+            for blocksize in [1, 3000, 1 << 20]:
+                partitions = list(plan_partitions([path], blocksize))
+                records = [r for p in partitions
+                           for _, r in iter_partition_records(p, delimiter)]
+                self.assertEqual(records, self.lines, (delimiter, blocksize))
+                keys = set(k for p in partitions for f, s, e in p
+                           for k, _ in iter_record_offsets(f, delimiter, s,
+                                                           e))
+                self.assertEqual(keys, whole)
+
+    def test_prefetch(self):
+        self.assertEqual(list(prefetch(iter(range(100)), 2)),
+                         list(range(100)))
+
+        def failing():
+            yield 1
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            list(prefetch(failing()))
+        closed = []
+
+        def endless():
+            try:
+                while True:
+                    yield 1
+            finally:
+                closed.append(True)
+
+        items = prefetch(endless(), 2)
+        next(items)
+        items.close()
+        self.assertEqual(closed, [True])
+
+    def test_analyze(self):
+        expected = mt.analyze(TEST_FILES_2, backend='serial')
+        for name in sorted(os.listdir(TEST_FILES_2)):
+            with open(os.path.join(TEST_FILES_2, name), 'rb') as fread:
+                data = fread.read()
+            self.write(name + '.gz', gzip.compress(data))
+            self.write(name + '.bgz', bgzf(data, 50))
+        self.write('doc.json.bz2', bz2.compress(b'[{"foo": 1}]'))
+        for blocksize in [1, 1 << 20]:
+            result = mt.analyze(self.tmpdir, backend='serial',
+                                blocksize=blocksize)
+            self.assertEqual(result.count, 2 * expected.count + 1)
+            self.assertEqual(result.stats['charfield']['str']['count'],
+                             2 * expected.stats['charfield']['str']['count'])
+            self.assertEqual(result.get_redshift_types()['intfield'],
+                             expected.get_redshift_types()['intfield'])
+        result = mt.analyze(self.tmpdir, backend='serial',
+                            stream_arrays=True)
+        self.assertEqual(result.count, 2 * expected.count + 1)
+
+    def test_zstd(self):
+        zstandard = pytest.importorskip('zstandard')
+        data = b'\n'.join(self.lines)
+        compress = zstandard.ZstdCompressor().compress
+        path = self.write('data.zst', b''.join(
+            compress(data[i:i + 5000]) for i in range(0, len(data), 5000)))
+        for blocksize in [1, 1 << 20]:
+            partitions = list(plan_partitions([path], blocksize))
+            records = [r for p in partitions
+                       for _, r in iter_partition_records(p)]
+            self.assertEqual(records, self.lines)
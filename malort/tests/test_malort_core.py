@@ -9,7 +9,10 @@ Notes:
 could contain, not the exact values.
 
 """
+import json
 import os
+import shutil
+import tempfile
 
 import malort as mt
 from malort.test_helpers import (TestHelpers, TEST_FILES_1, TEST_FILES_2,
@@ -20,19 +23,32 @@ class TestCore(TestHelpers):
 
     expected_1_and_2 = {
         'charfield': {'str': {'count': 4, 'max': 11, 'mean': 11.0,
-                              'min': 11, 'sample': ['fixedlength']},
+                              'stddev': 0.0,
+                              'min': 11, 'p50': 11, 'p95': 11, 'p99': 11,
+                              'p99.9': 11, 'sample': ['fixedlength'],
+                              'top_k': [['fixedlength', 4, 0]]},
                       'base_key': 'charfield'},
         'floatfield': {'float': {'count': 4, 'max': 10.8392, 'mean': 5.244,
-                                 'min': 2.345, 'max_precision': 6,
+                                 'stddev': 3.352,
+                                 'min': 2.345, 'p50': 3.0012,
+                                 'p95': 10.8392, 'p99': 10.8392,
+                                 'p99.9': 10.8392, 'max_precision': 6,
                                  'max_scale': 4, 'fixed_length': False},
                        'base_key': 'floatfield'},
         'intfield': {'int': {'count': 4, 'max': 20, 'mean': 12.5,
-                             'min': 5},
+                             'stddev': 5.59,
+                             'min': 5, 'p50': 10, 'p95': 20, 'p99': 20,
+                             'p99.9': 20},
                      'base_key': 'intfield'},
         'varcharfield': {'str': {'count': 4, 'max': 12, 'mean': 7.5,
-                                 'min': 3,
+                                 'stddev': 3.354,
+                                 'min': 3, 'p50': 6, 'p95': 12, 'p99': 12,
+                                 'p99.9': 12,
                                  'sample': ['var', 'varyin', 'varyingle',
-                                            'varyinglengt']},
+                                            'varyinglengt'],
+                                 'top_k': [['var', 1, 0], ['varyin', 1, 0],
+                                           ['varyingle', 1, 0],
+                                           ['varyinglengt', 1, 0]]},
                          'base_key': 'varcharfield'},
         'datefield': {'datetime': {'count': 4}, 'base_key': 'datefield'},
     }
@@ -54,12 +70,19 @@ class TestCore(TestHelpers):
         expected = {'baz.qux': {'base_key': 'qux',
                                 'str': {'count': 3,
                                         'max': 5,
-                                        'mean': 3.667,
+                                        'mean': 3.667, 'stddev': 0.943,
                                         'min': 3,
-                                        'sample': ['One', 'Two', 'Three']}},
+                                        'p50': 3, 'p95': 5,
+                                        'p99': 5, 'p99.9': 5,
+                                        'sample': ['One', 'Two', 'Three'],
+                                        'top_k': [['One', 1, 0],
+                                                  ['Three', 1, 0],
+                                                  ['Two', 1, 0]]}},
                     'foo.bar': {'base_key': 'bar',
                                 'int': {'count': 3, 'max': 30, 'mean': 20.0,
-                                        'min': 10}},
+                                        'stddev': 8.165,
+                                        'min': 10, 'p50': 20, 'p95': 30,
+                                        'p99': 30, 'p99.9': 30}},
                     'qux': {'base_key': 'qux', 'bool': {'count': 1}}}
         self.assert_stats(mtresult.stats, expected)
         self.assertEqual(mtresult.count, 3)
@@ -69,23 +92,42 @@ class TestCore(TestHelpers):
         mtresult = mt.analyze(TEST_FILES_4)
         expected = {
             'bar': {'bool': {'count': 1},
-                    'float': {'count': 2, 'max': 4.0, 'mean': 3.0, 'min': 2.0,
-                              'max_precision': 2, 'max_scale': 1,
+                    'float': {'count': 2, 'max': 4.0, 'mean': 3.0,
+                              'stddev': 1.0, 'min': 2.0,
+                              'p50': 2.0, 'p95': 4.0, 'p99': 4.0,
+                              'p99.9': 4.0, 'max_precision': 2, 'max_scale': 1,
                               'fixed_length': True},
-                    'str': {'count': 1, 'max': 3, 'mean': 3.0, 'min': 3,
-                            'sample': ['bar']},
+                    'str': {'count': 1, 'max': 3, 'mean': 3.0,
+                            'stddev': 0.0, 'min': 3,
+                            'p50': 3, 'p95': 3, 'p99': 3, 'p99.9': 3,
+                            'sample': ['bar'], 'top_k': [['bar', 1, 0]]},
                     'base_key': 'bar'},
-            'baz': {'int': {'count': 2, 'max': 2, 'mean': 1.5, 'min': 1},
-                    'str': {'count': 2, 'max': 5, 'mean': 5.0, 'min': 5,
-                            'sample': ['fixed']},
+            'baz': {'int': {'count': 2, 'max': 2, 'mean': 1.5,
+                            'stddev': 0.5, 'min': 1,
+                            'p50': 1, 'p95': 2, 'p99': 2, 'p99.9': 2},
+                    'str': {'count': 2, 'max': 5, 'mean': 5.0,
+                            'stddev': 0.0, 'min': 5,
+                            'p50': 5, 'p95': 5, 'p99': 5, 'p99.9': 5,
+                            'sample': ['fixed'], 'top_k': [['fixed', 2, 0]]},
                     'base_key': 'baz'},
-            'foo': {'int': {'count': 2, 'max': 1000, 'mean': 505.0, 'min': 10},
-                    'str': {'count': 2, 'max': 3, 'mean': 3.0, 'min': 3,
-                            'sample': ['foo']},
+            'foo': {'int': {'count': 2, 'max': 1000, 'mean': 505.0,
+                            'stddev': 495.0, 'min': 10,
+                            'p50': 10, 'p95': 1000, 'p99': 1000,
+                            'p99.9': 1000},
+                    'str': {'count': 2, 'max': 3, 'mean': 3.0,
+                            'stddev': 0.0, 'min': 3,
+                            'p50': 3, 'p95': 3, 'p99': 3, 'p99.9': 3,
+                            'sample': ['foo'], 'top_k': [['foo', 2, 0]]},
                     'base_key': 'foo'},
-            'qux': {'int': {'count': 1, 'max': 10, 'mean': 10.0, 'min': 10},
-                    'str': {'count': 3, 'max': 9, 'mean': 6.0, 'min': 3,
-                            'sample': ['var', 'varyin', 'varyingle']},
+            'qux': {'int': {'count': 1, 'max': 10, 'mean': 10.0,
+                            'stddev': 0.0, 'min': 10,
+                            'p50': 10, 'p95': 10, 'p99': 10, 'p99.9': 10},
+                    'str': {'count': 3, 'max': 9, 'mean': 6.0,
+                            'stddev': 2.449, 'min': 3,
+                            'p50': 6, 'p95': 9, 'p99': 9, 'p99.9': 9,
+                            'sample': ['var', 'varyin', 'varyingle'],
+                            'top_k': [['var', 1, 0], ['varyin', 1, 0],
+                                      ['varyingle', 1, 0]]},
                     'base_key': 'qux'}
         }
 
@@ -93,6 +135,24 @@ class TestCore(TestHelpers):
         self.assertEqual(mtresult.count, 4)
         self.assert_stats(mtresult.get_conflicting_types(), expected)
 
+    def test_approx_distinct(self):
+        plain = mt.analyze(TEST_FILES_4, backend='serial')
+        self.assertNotIn('approx_distinct', plain.stats['qux']['str'])
+
+        whole = mt.analyze(TEST_FILES_4, backend='serial',
+                           distinct_precision=10)
+        self.assertEqual(whole.stats['qux']['str']['approx_distinct'], 3)
+        self.assertEqual(whole.stats['foo']['int']['approx_distinct'], 2)
+        self.assertEqual(whole.stats['baz']['str']['approx_distinct'], 1)
+        self.assertNotIn('approx_distinct', whole.stats['bar']['bool'])
+        split = mt.analyze(TEST_FILES_4, backend='thread', blocksize=1,
+                           distinct_precision=10)
+        # Samples depend on partitioning; everything else must not
+        for stats in (split.stats, whole.stats):
+            for value in stats.values():
+                value.get('str', {}).pop('sample', None)
+        self.assertDictEqual(split.stats, whole.stats)
+
     def test_gen_redshift_jsonpaths(self):
         mtresult = mt.analyze(TEST_FILES_3)
         jsonpaths = mtresult.gen_redshift_jsonpaths()
@@ -124,3 +184,78 @@ class TestCore(TestHelpers):
             'qux_bazBoo_fooBaz_fooBar'
         ]
         self.assertListEqual(sorted(expected), sorted(names))
+
+
+class TestStreamArrays(TestHelpers):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_matches_delimited(self):
+        records = []
+        for name in sorted(os.listdir(TEST_FILES_2)):
+            with open(os.path.join(TEST_FILES_2, name)) as fread:
+                records.extend(json.loads(line) for line in fread
+                               if line.strip())
+        with open(os.path.join(self.tmpdir, 'export.json'), 'w') as fwrite:
+            json.dump(records, fwrite, indent=2)
+
+        expected = mt.analyze(TEST_FILES_2, backend='serial')
+        whole = mt.analyze(self.tmpdir, backend='serial')
+        self.assertEqual(whole.count, 1)
+        for blocksize in [1, 100, 64 << 20]:
+            for backend in ['serial', 'process']:
+                result = mt.analyze(self.tmpdir, backend=backend,
+                                    blocksize=blocksize, stream_arrays=True)
+                self.assertEqual(result.count, len(records))
+                self.assertEqual(result.get_redshift_types(),
+                                 expected.get_redshift_types())
+        sampled = mt.analyze(self.tmpdir, blocksize=100, stream_arrays=True,
+                             sampling=mt.Sampling(records=2, seed=0),
+                             backend='serial')
+        self.assertEqual(sampled.count, 2)
+        self.assertEqual(sampled.sampling['records_seen'], len(records))
+
+
+class TestConvergence(TestHelpers):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_files(self, records):
+        for i, record in enumerate(records):
+            path = os.path.join(self.tmpdir, 'part{:03d}.json'.format(i))
+            with open(path, 'w') as fwrite:
+                json.dump(record, fwrite)
+
+    def test_stops_when_types_converge(self):
+        records = [{'id': i, 'name': 'abc'} for i in range(20)]
+        records[15]['extra'] = True
+        self.write_files(records)
+        for backend in ['serial', 'process']:
+            result = mt.analyze(self.tmpdir, converge_every=2,
+                                converge_checks=2, blocksize=1,
+                                backend=backend)
+            self.assertTrue(result.convergence['converged'])
+            self.assertEqual(result.convergence['partitions_read'], 6)
+            self.assertEqual(result.convergence['partitions_total'], 20)
+            self.assertEqual(result.convergence['checks'], 3)
+            self.assertEqual(result.count, 6)
+            self.assertNotIn('extra', result.stats)
+
+    def test_reads_everything_if_types_change(self):
+        self.write_files([{'name': 'x' * (i + 1)} for i in range(10)])
+        result = mt.analyze(self.tmpdir, converge_every=1,
+                            converge_checks=2, blocksize=1, backend='serial')
+        self.assertFalse(result.convergence['converged'])
+        self.assertEqual(result.convergence['reason'], 'all partitions read')
+        self.assertEqual(result.count, 10)
+        self.assertEqual(result.get_redshift_types()['name'], 'varchar(10)')
+        with self.assertRaises(ValueError):
+            mt.analyze(self.tmpdir, converge_every=0)
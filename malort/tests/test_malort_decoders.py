@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Decoder Tests
+
+Test Runner: PyTest
+
+"""
+import json
+import random
+import unittest
+
+import malort as mt
+from malort.accumulators import JSONFloat, float_precision_scale
+from malort.decoders import (FAST_DECODERS, available_decoders, get_decoder,
+                             has_inexact_numbers)
+from malort.stats import catch_json_error
+from malort.test_helpers import TEST_FILES_1, TEST_FILES_2
+
+
+RECORDS = [
+    '{"foo": 1.5, "bar": [1, -2.25, 0.001], "baz": "1.10"}',
+    '{"foo": 1.10, "bar": 1e5, "baz": -0.0}',
+    '{"foo": 123456789012345678901234567890}',
+    '{"foo": NaN, "bar": -Infinity}',
+    u'{"foo": "caf\\u00e9", "bar": {"baz": null, "qux": true}}',
+    '[1, 2.5e-07, "x"]',
+]
+
+
+def floats(value):
+    """Flatten a parsed record into (value, precision, scale) for floats"""
+    if isinstance(value, dict):
+        return sorted(f for v in value.values() for f in floats(v))
+    if isinstance(value, list):
+        return [f for v in value for f in floats(v)]
+    if isinstance(value, float) and value == value:
+        return [(value, ) + float_precision_scale(value)]
+    return []
+
+
+class TestDecoders(unittest.TestCase):
+
+    def test_has_inexact_numbers(self):
+        for blob in ['{"a": 1.5, "b": 10, "c": -0.0001}', '[100.0, 2]',
+                     '{"id": "4e52-8e9f", "a": "v1.2.3"}']:
+            self.assertFalse(has_inexact_numbers(blob))
+            self.assertFalse(has_inexact_numbers(blob.encode('utf-8')))
+        for blob in ['{"a": 1.10}', '{"a": 1e5}', '{"a": -2.5E-7}',
+                     '{"a": 0.00001}', '{"a": 0.1000000000000000055511}',
+                     '{"a": 1234567890123456789}']:
+            self.assertTrue(has_inexact_numbers(blob))
+            self.assertTrue(has_inexact_numbers(blob.encode('utf-8')))
+
+    def test_exact_floats(self):
+        rand = random.Random(0)
+        for _ in range(20000):
+            value = rand.uniform(-1, 1) * 10 ** rand.randint(-6, 18)
+            for token in ['{:.{}f}'.format(value, rand.randint(1, 12)),
+                          '{:.{}e}'.format(value, rand.randint(0, 3)),
+                          repr(value)]:
+                if not has_inexact_numbers(token):
+                    self.assertEqual(repr(float(token)), token)
+
+    def test_json_decoder(self):
+        loads = get_decoder('json')
+        self.assertIsInstance(loads('{"foo": 1.10}')['foo'], JSONFloat)
+        loads = get_decoder('auto', parse_float=float)
+        self.assertIs(type(loads('{"foo": 1.10}')['foo']), float)
+
+    def test_bad_options(self):
+        with self.assertRaises(ValueError):
+            get_decoder('yaml')
+        fast = available_decoders()[0]
+        if fast != 'json':
+            with self.assertRaises(ValueError):
+                get_decoder(fast, parse_float=float)
+        missing = [name for name, _ in FAST_DECODERS
+                   if name not in available_decoders()]
+        if missing:
+            with self.assertRaises(ValueError):
+                get_decoder(missing[0])
+
+    def test_same_results(self):
+        expected = [json.loads(r) for r in RECORDS]
+        for name in available_decoders():
+            loads = get_decoder(name)
+            for record, parsed in zip(RECORDS, expected):
+                for blob in [record, record.encode('utf-8')]:
+                    result = loads(blob)
+                    self.assertEqual(json.dumps(result),
+                                     json.dumps(parsed))
+                    self.assertEqual(floats(result),
+                                     floats(get_decoder('json')(blob)))
+
+    def test_error_messages(self):
+        for name in available_decoders():
+            with self.assertRaises(ValueError) as err:
+                catch_json_error('{"foo": 1', 'foo.txt', get_decoder(name))
+            self.assertEqual(
+                err.exception.args[0],
+                "JSON error reading foo.txt: Expecting ',' delimiter: "
+                "line 1 column 10 (char 9)!")
+
+    def test_analyze(self):
+        for path in [TEST_FILES_1, TEST_FILES_2]:
+            expected = mt.analyze(path, backend='serial',
+                                  decoder='json').stats
+            for name in available_decoders():
+                result = mt.analyze(path, backend='serial', decoder=name)
+                self.assertEqual(result.stats, expected)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Manifest Tests
+
+Test Runner: PyTest
+
+"""
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import malort as mt
+from malort import manifest
+from malort.test_helpers import TestHelpers
+
+
+class TestIncremental(TestHelpers):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = os.path.join(self.tmpdir, 'data')
+        self.state = os.path.join(self.tmpdir, 'state')
+        os.mkdir(self.data)
+        self.parsed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, records, mtime=None):
+        path = os.path.join(self.data, name)
+        with open(path, 'w') as fwrite:
+            fwrite.write('\n'.join(json.dumps(r) for r in records))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def analyze(self, **kwargs):
+        """Incremental analyze, recording which files were parsed"""
+        parsed = self.parsed
+
+        class Recording(mt.backends.SerialBackend):
+            def map(self, func, items):
+                for index, partition in items:
+                    parsed.extend(os.path.basename(f) for f, _, _ in partition)
+                    yield func((index, partition))
+
+        result = mt.analyze(self.data, state_dir=self.state,
+                            backend=Recording(), **kwargs)
+        full = mt.analyze(self.data, backend='serial', **kwargs)
+        self.assertEqual(result.count, full.count)
+        self.assertDictEqual(result.stats, full.stats)
+        return result
+
+    def batches(self):
+        with open(os.path.join(self.state, 'manifest.json')) as fread:
+            manifest = json.load(fread)
+        snapshots = sorted(f for f in os.listdir(self.state)
+                           if f.startswith('batch-'))
+        self.assertEqual(snapshots, sorted(b['snapshot'] for b in
+                                           manifest['batches'].values()))
+        return sorted(sorted(b['files']) for b in manifest['batches'].values())
+
+    def test_only_new_files_parsed(self):
+        self.write('a', [{'foo': 1}, {'foo': 2}], mtime=1000)
+        self.write('b', [{'bar': 'x'}], mtime=1000)
+        self.assertEqual(self.analyze().count, 3)
+        self.assertEqual(sorted(self.parsed), ['a', 'b'])
+
+        del self.parsed[:]
+        self.write('c', [{'foo': 3.5}], mtime=1000)
+        self.assertEqual(self.analyze().count, 4)
+        self.assertEqual(self.parsed, ['c'])
+        # Small batches are compacted without parsing them again
+        self.assertEqual(self.batches(), [['a', 'b', 'c']])
+
+        del self.parsed[:]
+        self.analyze()
+        self.assertEqual(self.parsed, [])
+
+    @mock.patch('malort.manifest.BATCH_FILES', 2)
+    def test_modified_and_deleted_files(self):
+        self.write('a', [{'foo': 1}], mtime=1000)
+        self.write('b', [{'foo': 2}], mtime=1000)
+        self.analyze()
+        self.write('c', [{'foo': 3}], mtime=1000)
+        self.analyze()
+
+        # Modifying a recomputes its batch, with b
+        del self.parsed[:]
+        self.write('a', [{'foo': 10}, {'foo': 'ten'}], mtime=2000)
+        self.assertEqual(self.analyze().count, 4)
+        self.assertEqual(sorted(self.parsed), ['a', 'b'])
+        self.assertEqual(self.batches(), [['a', 'b'], ['c']])
+
+        del self.parsed[:]
+        os.remove(os.path.join(self.data, 'c'))
+        self.assertEqual(self.analyze().count, 3)
+        self.assertEqual(self.parsed, [])
+        self.assertEqual(self.batches(), [['a', 'b']])
+
+    @mock.patch('malort.manifest.BATCH_FILES', 3)
+    def test_modified_old_file(self):
+        for i in range(9):
+            self.write('f{}'.format(i), [{'n': i}], mtime=1000)
+        self.analyze()
+        self.assertEqual(self.batches(), [['f0', 'f1', 'f2'],
+                                          ['f3', 'f4', 'f5'],
+                                          ['f6', 'f7', 'f8']])
+
+        # Only the modified file's batch is parsed again
+        del self.parsed[:]
+        self.write('f4', [{'n': 'four'}], mtime=2000)
+        self.analyze()
+        self.assertEqual(sorted(self.parsed), ['f3', 'f4', 'f5'])
+
+        # Adding files reads the combined stats, not every batch
+        read = []
+        original = manifest.read_snapshot
+
+        def read_snapshot(path):
+            read.append(os.path.basename(path))
+            return original(path)
+
+        del self.parsed[:]
+        self.write('g', [{'n': 9}], mtime=1000)
+        with mock.patch('malort.manifest.read_snapshot', read_snapshot):
+            self.analyze()
+        self.assertEqual(self.parsed, ['g'])
+        self.assertEqual(len(read), 1)
+        self.assertTrue(read[0].startswith('combined-'))
+        self.assertEqual(len(self.batches()), 4)
+
+    @mock.patch('malort.manifest.BATCH_FILES', 3)
+    def test_compaction(self):
+        for i in range(5):
+            self.write('f{}'.format(i), [{'n': i}], mtime=1000)
+            self.analyze()
+        self.assertEqual(self.batches(), [['f0', 'f1', 'f2'], ['f3', 'f4']])
+        snapshots = [f for f in os.listdir(self.state)
+                     if f.startswith('combined-')]
+        self.assertEqual(len(snapshots), 1)
+
+    def test_hash_files(self):
+        self.write('a', [{'foo': 1}], mtime=1000)
+        # New files are hashed as they are parsed, not read again
+        with mock.patch('malort.manifest.file_hash') as hashed:
+            self.analyze(hash_files=True)
+            self.assertFalse(hashed.called)
+        with open(os.path.join(self.state, 'manifest.json')) as fread:
+            batch, = json.load(fread)['batches'].values()
+        self.assertEqual(batch['files']['a']['hash'],
+                         manifest.file_hash(os.path.join(self.data, 'a')))
+        del self.parsed[:]
+        self.write('a', [{'foo': 1}], mtime=2000)
+        self.analyze(hash_files=True)
+        self.assertEqual(self.parsed, [])
+        self.write('a', [{'foo': 2}], mtime=3000)
+        self.analyze(hash_files=True)
+        self.assertEqual(self.parsed, ['a'])
+
+    def test_options_change_recomputes(self):
+        self.write('a', [{'foo': '2015-01-01'}], mtime=1000)
+        self.analyze()
+        del self.parsed[:]
+        result = self.analyze(parse_timestamps=False)
+        self.assertEqual(self.parsed, ['a'])
+        self.assertIn('str', result.stats['foo'])
+        self.assertEqual(len(self.batches()), 1)
@@ -67,6 +67,18 @@ class TestRedshiftMapper(unittest.TestCase):
         stats['sample'] = ['t', 'yes', 'false']
         self.assertEqual(self.rs.strings(stats), "BOOLEAN")
 
+        # An empty sample (without top_k) maps to BOOLEAN, as it always has
+        stats['sample'] = []
+        self.assertEqual(self.rs.strings(stats), "BOOLEAN")
+
+        # Full-stream counts override a sample that happens to look boolean
+        stats['count'] = 100
+        stats['top_k'] = [['t', 60, 0], ['f', 39, 0], ['maybe', 1, 0]]
+        self.assertEqual(self.rs.strings(stats), 'varchar(6)')
+
+        stats['top_k'] = [['t', 60, 0], ['f', 40, 0]]
+        self.assertEqual(self.rs.strings(stats), "BOOLEAN")
+
     def test_ints(self):
         stats = {'min': 45, 'max': 45}
         self.assertEqual(self.rs.ints(stats), 'SMALLINT')
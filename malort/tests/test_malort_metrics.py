@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Metrics Tests
+
+Test Runner: PyTest
+
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import malort as mt
+from malort.metrics import Metrics, PartitionMetrics
+from malort.readers import plan_partitions
+from malort.stats import export_stats, partition_stats
+from malort.test_helpers import TEST_FILES_1, TEST_FILES_2
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_partition_stats(self):
+        files = sorted(os.path.join(TEST_FILES_2, f)
+                       for f in os.listdir(TEST_FILES_2))
+        partition = next(iter(plan_partitions(files, 1 << 20)))
+        for batch_size in [0, 1024]:
+            metrics = PartitionMetrics(0)
+            stats = partition_stats(partition, batch_size=batch_size,
+                                    metrics=metrics)
+            count = stats.pop('total_records')
+            expected = partition_stats(partition, batch_size=batch_size)
+            self.assertEqual(count, expected.pop('total_records'))
+            self.assertEqual(export_stats(stats)['intfield'],
+                             export_stats(expected)['intfield'])
+            self.assertEqual(metrics.records, count)
+            self.assertEqual(sum(f[0] for f in metrics.files.values()),
+                             metrics.records)
+            self.assertEqual(sum(f[1] for f in metrics.files.values()),
+                             metrics.bytes)
+            self.assertEqual(set(metrics.files), set(files))
+            self.assertAlmostEqual(sum(f[2] for f in metrics.files.values()),
+                                   sum(metrics.phases.values()))
+
+    def test_analyze(self):
+        partitions = []
+        finished = []
+        for backend in ['serial', 'process']:
+            metrics = mt.Metrics(on_partition=partitions.append,
+                                 on_finish=finished.append)
+            result = mt.analyze(TEST_FILES_1, backend=backend, blocksize=1,
+                                metrics=metrics)
+            self.assertIs(result.metrics, metrics)
+            self.assertIs(finished[-1], result)
+            metrics = result.metrics
+            self.assertEqual(metrics.records, result.count)
+            self.assertEqual(metrics.elapsed, result.execution_time)
+            self.assertEqual(metrics.files_listed,
+                             len(os.listdir(TEST_FILES_1)))
+            self.assertEqual(
+                set(metrics.phases),
+                set(['list', 'read', 'decode', 'stats', 'merge']))
+            self.assertEqual(metrics.bytes,
+                             sum(p['bytes'] for p in metrics.partitions))
+            self.assertEqual(len(partitions), len(metrics.partitions))
+            del partitions[:]
+
+            exported = json.loads(metrics.to_json())
+            self.assertEqual(exported['records'], result.count)
+            self.assertGreater(exported['records_per_second'], 0)
+            self.assertEqual([p['index'] for p in exported['partitions']],
+                             list(range(len(metrics.partitions))))
+            slowest = exported['slowest_files']
+            self.assertEqual([f['seconds'] for f in slowest],
+                             sorted((f['seconds'] for f in slowest),
+                                    reverse=True))
+            self.assertEqual(sum(f['records'] for f in slowest),
+                             result.count)
+
+        with self.assertRaises(ValueError):
+            mt.analyze(TEST_FILES_1, backend='serial', metrics=metrics)
+
+    def test_other_runs(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            result = mt.analyze(TEST_FILES_2, backend='serial',
+                                state_dir=tmpdir)
+            self.assertEqual(result.metrics.records, result.count)
+            # Nothing left to read on the second run
+            result = mt.analyze(TEST_FILES_2, backend='serial',
+                                state_dir=tmpdir)
+            self.assertEqual(result.metrics.records, 0)
+            path = os.path.join(tmpdir, 'metrics.json')
+            result.metrics.to_json(path)
+            with open(path) as fread:
+                self.assertEqual(json.load(fread)['partitions'], [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+        result = mt.analyze(TEST_FILES_2, backend='serial',
+                            converge_every=1)
+        self.assertEqual(result.metrics.records, result.count)
+        result = mt.analyze(TEST_FILES_2, backend='serial',
+                            sampling=mt.Sampling(records=2, seed=0))
+        self.assertEqual(result.metrics.records,
+                         result.sampling['records_seen'])
+        self.assertIn('sample', result.metrics.phases)
+
+    def test_logger(self):
+        logger = logging.getLogger('malort.tests.metrics')
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            mt.analyze(TEST_FILES_1, backend='serial',
+                       metrics=mt.Metrics(logger=logger))
+        finally:
+            logger.removeHandler(handler)
+        messages = [r.getMessage() for r in records]
+        self.assertTrue(messages[0].startswith('Malort run finished'))
+        self.assertIn('records/s', messages[1])
+
+    def test_summary(self):
+        metrics = Metrics()
+        self.assertEqual(metrics.summary(), 'no timings')
+        self.assertIsNone(metrics.records_per_second)
+        self.assertEqual(metrics.to_dict()['slowest_files'], [])
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Reader Tests
+
+Test Runner: PyTest
+
+"""
+import bz2
+import gzip
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import malort as mt
+from malort.manifest import file_hash
+from malort.readers import (array_ranges, array_spans, array_start,
+                            iter_array_records, iter_file_records,
+                            iter_partition_records, plan_partitions,
+                            split_buffer, split_stream, to_bytes)
+
+
+class TestSplitters(unittest.TestCase):
+
+    def random_text(self, delimiter, seed=0):
+        rand = random.Random(seed)
+        parts = [''.join(rand.choice('ab|\n{}"') for _ in
+                         range(rand.choice([0, 1, 5, 40, 300])))
+                 for _ in range(200)]
+        return delimiter.join(parts)
+
+    def test_split_stream_matches_split(self):
+        for delimiter in ['\n', '|', '||', '\r\n', 'abab']:
+            text = self.random_text(delimiter)
+            expected = text.split(delimiter)
+            for bufsize in [1, 2, 3, 7, 64, 4096]:
+                records = list(split_stream(io.StringIO(text), delimiter,
+                                            bufsize))
+                self.assertEqual(records, expected, (delimiter, bufsize))
+                data = text.encode('utf-8')
+                records = list(split_stream(io.BytesIO(data),
+                                            to_bytes(delimiter), bufsize))
+                self.assertEqual(records, data.split(to_bytes(delimiter)))
+                expected_buffer = data.split(to_bytes(delimiter))
+                if not expected_buffer[-1]:
+                    expected_buffer.pop()
+                records = list(split_buffer(data, to_bytes(delimiter),
+                                            bufsize=bufsize))
+                self.assertEqual(records, expected_buffer)
+
+    def test_split_buffer(self):
+        data = b'{"a": 1}|{"b": 2}||{"c": 3}|'
+        self.assertEqual(list(split_buffer(data, b'|')),
+                         [b'{"a": 1}', b'{"b": 2}', b'', b'{"c": 3}'])
+        self.assertEqual(list(split_buffer(b'', b'|')), [])
+
+    def test_split_buffer_ranges(self):
+        for delimiter in ['\n', '|', '\r\n', 'ab']:
+            data = self.random_text(delimiter, seed=1).encode('utf-8')
+            delim = to_bytes(delimiter)
+            expected = list(split_buffer(data, delim))
+            for blocksize in [1, 2, 5, 17, 300, len(data)]:
+                records = []
+                for start in range(0, len(data), blocksize):
+                    records.extend(split_buffer(data, delim, start,
+                                                start + blocksize, bufsize=7))
+                self.assertEqual(records, expected, (delimiter, blocksize))
+
+    def test_array_spans(self):
+        doc = (b'\xef\xbb\xbf [1, {"a": [1, {}], "b": "x,]}\\""},\n'
+               b' "q\\\\", [], [[2]]]  ')
+        self.assertEqual([doc[a:b] for a, b in array_spans(doc)],
+                         [b'1', b' {"a": [1, {}], "b": "x,]}\\""}',
+                          b'\n "q\\\\"', b' []', b' [[2]]'])
+        self.assertEqual(list(array_spans(b'[ ]')), [(1, 2)])
+        self.assertEqual(list(array_spans(b'[1, {"a"')), [(1, 2), (3, 8)])
+        self.assertIsNone(array_start(b' {"a": [1]}'))
+        with self.assertRaises(ValueError):
+            list(array_spans(b'{"a": [1]}'))
+
+    def test_delimited_compat(self):
+        records = list(mt.stats.delimited(io.StringIO(u'a\nb\n'), '\n'))
+        self.assertEqual(records, ['a', 'b', ''])
+
+
+class TestFileRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as fwrite:
+            fwrite.write(data)
+        return path
+
+    def test_mmap_records(self):
+        big = b'{"foo": "' + b'x' * 100000 + b'"}'
+        path = self.write('records', big + b'\r\n{"bar": 1}\r\n')
+        records = list(iter_file_records(path, '\r\n'))
+        self.assertEqual(records, [big, b'{"bar": 1}'])
+        self.assertEqual(list(iter_file_records(self.write('empty', b''))),
+                         [])
+
+    def test_array_records(self):
+        elements = [u'{{"id": {}, "s": "{}"}}'.format(i, u'é],{' * (i % 4))
+                    for i in range(50)]
+        data = u'[\n  {}\n]\n'.format(u',\n  '.join(elements))
+        path = self.write('array.json', data.encode('utf-8'))
+        expected = [e.encode('utf-8') for e in elements]
+        records = [r.strip() for r in iter_array_records(path)]
+        self.assertEqual(records, expected)
+        for blocksize in [1, 30, 200, len(data) * 2]:
+            ranges = array_ranges(path, blocksize)
+            records = [r.strip() for start, stop in ranges
+                       for r in iter_array_records(path, start, stop)]
+            self.assertEqual(records, expected, blocksize)
+
+        doc = self.write('doc.json', b'{"a": 1}')
+        self.assertEqual(list(iter_array_records(doc)), [b'{"a": 1}'])
+        self.assertEqual(array_ranges(doc, 1), [(0, None)])
+        partitions = list(plan_partitions([path, doc], 200,
+                                          stream_arrays=True))
+        self.assertEqual(len(partitions), len(array_ranges(path, 200)) + 1)
+        self.assertEqual(partitions[-1], [(doc, 0, None)])
+        records = [r for p in partitions
+                   for r in iter_partition_records(p, stream_arrays=True)]
+        self.assertEqual(len(records), 51)
+        self.assertEqual(records[-1], (doc, b'{"a": 1}'))
+
+    def test_dict_generator_delimiters(self):
+        self.write('piped', u'{"foo": "é"}|{"bar": 2}|\n'.encode('utf-8'))
+        self.write('doc.json', b'{"baz": 3}')
+        blobs = list(mt.stats.dict_generator(self.tmpdir, '|'))
+        self.assertEqual(sorted(blobs, key=lambda b: list(b)),
+                         [{'bar': 2}, {'baz': 3}, {'foo': u'é'}])
+
+    def test_plan_partitions(self):
+        big = self.write('big', b'{"a": 1}\n' * 100)
+        small = [self.write('small{}'.format(i), b'{"b": 2}\n')
+                 for i in range(5)]
+        doc = self.write('doc.json', b'[' + b'1, ' * 200 + b'1]')
+        partitions = list(plan_partitions([big] + small + [doc], 300))
+        self.assertEqual(partitions[:3], [[(big, 0, 300)],
+                                          [(big, 300, 600)],
+                                          [(big, 600, 900)]])
+        self.assertEqual(partitions[3:],
+                         [[(f, 0, None) for f in small] + [(doc, 0, None)]])
+
+        records = [r for p in partitions for r in iter_partition_records(p)]
+        self.assertEqual(len(records), 106)
+        self.assertEqual(records[:100], [(big, b'{"a": 1}')] * 100)
+        self.assertEqual(records[-1][0], doc)
+
+    def test_partition_digests(self):
+        records = b'{"a": 1}\n' * 100
+        whole = [self.write('plain', records),
+                 self.write('empty', b''),
+                 self.write('doc.json', b'{"b": 2}'),
+                 self.write('plain.gz', gzip.compress(records)),
+                 self.write('plain.bz2', bz2.compress(records))]
+        compressed_doc = self.write('doc.json.gz', gzip.compress(b'{}'))
+        big = self.write('big', records)
+        partitions = [[(f, 0, None) for f in whole + [compressed_doc]],
+                      [(big, 0, 300)], [(big, 300, None)]]
+        digests = {}
+        for partition in partitions:
+            list(iter_partition_records(partition, digests=digests))
+        self.assertEqual(digests, dict((f, file_hash(f)) for f in whole))
+
+        digests = {}
+        list(iter_partition_records(partitions[0], head=1, digests=digests))
+        self.assertEqual(digests, {})
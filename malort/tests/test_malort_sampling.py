@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Sampling Tests
+
+Test Runner: PyTest
+
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import malort as mt
+from malort.sampling import (merge_reservoirs, partition_reservoir,
+                             sample_file_list, wilson_interval)
+from malort.test_helpers import TestHelpers
+
+
+class TestSampling(TestHelpers):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(10):
+            path = os.path.join(self.tmpdir, 'part{:02d}'.format(i))
+            with open(path, 'w') as fwrite:
+                for j in range(10 * (i + 1)):
+                    record = {'file': i, 'row': j}
+                    if j % 2:
+                        record['odd'] = 'yes'
+                    fwrite.write(json.dumps(record) + '\n')
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_sample_file_list(self):
+        picked = sample_file_list(self.files, 0.3, seed=1)
+        self.assertEqual(len(picked), 3)
+        # One file from each size stratum
+        self.assertEqual([self.files.index(f) // 4 for f in picked]
+                         [:2], [0, 1])
+        self.assertEqual(picked, sample_file_list(self.files, 0.3, seed=1))
+        self.assertEqual(len(sample_file_list(self.files, 0.01)), 1)
+        with self.assertRaises(ValueError):
+            sample_file_list(self.files, 1.5)
+
+    def test_reservoir_independent_of_partitioning(self):
+        partitions = [[(f, 0, None)] for f in self.files]
+        seen, sample = merge_reservoirs(
+            [partition_reservoir(p, 20, seed=3) for p in partitions[::-1]],
+            20)
+        self.assertEqual(seen, 550)
+        self.assertEqual(len(sample), 20)
+        grouped = [[(f, 0, None) for f in self.files]]
+        self.assertEqual(merge_reservoirs(
+            [partition_reservoir(p, 20, seed=3) for p in grouped], 20),
+            (seen, sample))
+        other = merge_reservoirs(
+            [partition_reservoir(p, 20, seed=4) for p in partitions], 20)
+        self.assertNotEqual(other[1], sample)
+
+    def test_wilson_interval(self):
+        low, high = wilson_interval(50, 100)
+        self.assertAlmostEqual(low, 0.4038, places=4)
+        self.assertAlmostEqual(high, 0.5962, places=4)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+
+    def test_analyze_record_budget(self):
+        sampling = mt.Sampling(records=50, seed=7)
+        result = mt.analyze(self.tmpdir, sampling=sampling,
+                            backend='serial')
+        self.assertTrue(result.sampled)
+        self.assertEqual(result.count, 50)
+        self.assertEqual(result.sampling['records_seen'], 550)
+        self.assertEqual(result.sampling['seed'], 7)
+        again = mt.analyze(self.tmpdir, sampling=sampling,
+                           backend='thread', blocksize=100)
+        self.assertDictEqual(again.stats, result.stats)
+        odd = result.stats['odd']['str']['count']
+        self.assertTrue(result.sample_notes['odd'].startswith(
+            'key seen in {} of 50 sampled records'.format(odd)))
+
+    def test_analyze_head_and_files(self):
+        result = mt.analyze(self.tmpdir, sampling=mt.Sampling(head=5),
+                            backend='serial', blocksize=10)
+        self.assertEqual(result.count, 50)
+        self.assertEqual(result.stats['row']['int']['max'], 4)
+        self.assertIsNotNone(result.sampling['seed'])
+
+        result = mt.analyze(self.tmpdir,
+                            sampling=mt.Sampling(files=0.2, seed=0),
+                            backend='serial')
+        self.assertEqual(result.sampling['files_sampled'], 2)
+        self.assertEqual(result.sampling['files_total'], 10)
+
+        full = mt.analyze(self.tmpdir, backend='serial')
+        self.assertFalse(full.sampled)
+        self.assertIsNone(full.sample_notes)
+        with self.assertRaises(ValueError):
+            mt.analyze(self.tmpdir, sampling=mt.Sampling(head=1),
+                       state_dir=self.tmpdir)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Sketch Tests
+
+Test Runner: PyTest
+
+"""
+import pickle
+import random
+import unittest
+
+from malort.sketches import (HyperLogLog, KLLSketch, ReservoirSample,
+                             SpaceSaving)
+
+
+def rank(values, value):
+    return sum(1 for v in values if v <= value) / float(len(values))
+
+
+class TestKLLSketch(unittest.TestCase):
+
+    def test_exact_when_small(self):
+        sketch = KLLSketch()
+        for value in [5, 1, 9, 3]:
+            sketch.update(value)
+        self.assertEqual(sketch.quantiles([0.5, 0.75, 0.999]), [3, 5, 9])
+        self.assertEqual(KLLSketch().quantiles([0.5]), [None])
+
+    def test_bounded_and_accurate(self):
+        rand = random.Random(0)
+        values = [rand.expovariate(1) for _ in range(50000)]
+        sketch = KLLSketch(k=128)
+        for value in values:
+            sketch.update(value)
+        self.assertEqual(sketch.n, 50000)
+        self.assertLess(sum(len(level) for level in sketch.levels),
+                        3 * 128 + 8 * len(sketch.levels))
+        for fraction, value in zip([0.5, 0.95, 0.99],
+                                   sketch.quantiles([0.5, 0.95, 0.99])):
+            self.assertAlmostEqual(rank(values, value), fraction, delta=0.03)
+
+    def test_merge_and_state(self):
+        rand = random.Random(1)
+        values = [rand.randint(0, 10000) for _ in range(20000)]
+        parts = [KLLSketch() for _ in range(5)]
+        for i, value in enumerate(values):
+            parts[i % 5].update(value)
+        merged = parts[0].copy()
+        for part in parts[1:]:
+            merged.merge(part)
+        self.assertEqual(merged.n, 20000)
+        self.assertEqual(parts[0].n, 4000)
+        median = merged.quantiles([0.5])[0]
+        self.assertAlmostEqual(rank(values, median), 0.5, delta=0.03)
+
+        loaded = KLLSketch.from_state(merged.to_state())
+        self.assertEqual(loaded.quantiles([0.5, 0.99]),
+                         merged.quantiles([0.5, 0.99]))
+        unpickled = pickle.loads(pickle.dumps(merged))
+        self.assertEqual(unpickled.to_state(), merged.to_state())
+
+
+def update_in_chunks(sketch, values, seed=0):
+    rand = random.Random(seed)
+    start = 0
+    while start < len(values):
+        stop = start + rand.randint(1, 500)
+        sketch.update_many(values[start:stop])
+        start = stop
+    return sketch
+
+
+class TestUpdateMany(unittest.TestCase):
+
+    def test_same_as_update(self):
+        rand = random.Random(2)
+        numbers = [rand.random() for _ in range(5000)]
+        strings = ['s{}'.format(rand.randint(0, 30)) for _ in range(5000)]
+        for cls, values in [(KLLSketch, numbers), (ReservoirSample, strings),
+                            (SpaceSaving, strings)]:
+            for n in [0, 10, 5000]:
+                expected = cls()
+                for value in values[:n]:
+                    expected.update(value)
+                self.assertEqual(
+                    update_in_chunks(cls(), values[:n]).to_state(),
+                    expected.to_state())
+
+
+class TestHyperLogLog(unittest.TestCase):
+
+    def test_estimates(self):
+        for n in [0, 1, 50, 20000]:
+            hll = HyperLogLog(12)
+            for i in range(n):
+                hll.add(str(i).encode('ascii'))
+                hll.add(str(i).encode('ascii'))
+            self.assertAlmostEqual(hll.estimate(), n, delta=max(1, n * 0.05))
+
+    def test_merge_and_state(self):
+        first, second = HyperLogLog(10), HyperLogLog(10)
+        for i in range(3000):
+            first.add(str(i).encode('ascii'))
+            second.add(str(i + 1500).encode('ascii'))
+        merged = first.copy().merge(second)
+        self.assertAlmostEqual(merged.estimate(), 4500, delta=4500 * 0.1)
+        self.assertEqual(HyperLogLog.from_state(merged.to_state()).registers,
+                         merged.registers)
+        with self.assertRaises(ValueError):
+            first.merge(HyperLogLog(11))
+        with self.assertRaises(ValueError):
+            HyperLogLog(3)
+
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def test_heavy_hitters(self):
+        rng = random.Random(3)
+        values = ['heavy'] * 300 + ['medium'] * 150 + [
+            'rare{}'.format(rng.randint(0, 500)) for _ in range(550)]
+        rng.shuffle(values)
+        summary = SpaceSaving(10)
+        for value in values:
+            summary.update(value)
+        self.assertEqual(len(summary.counters), 10)
+        top = summary.top()
+        self.assertEqual([v for v, _, _ in top[:2]], ['heavy', 'medium'])
+        for value, count, error in top:
+            self.assertTrue(count - error <= values.count(value) <= count)
+
+    def test_merge_and_state(self):
+        values = ['v{}'.format(i % 13) * (i % 4 + 1) for i in range(400)]
+        whole = SpaceSaving(8)
+        parts = [SpaceSaving(8), SpaceSaving(8)]
+        for i, value in enumerate(values):
+            whole.update(value)
+            parts[i % 2].update(value)
+        merged = parts[0].copy().merge(parts[1])
+        self.assertEqual(merged.n, 400)
+        self.assertEqual(len(merged.counters), 8)
+        for value, count, error in merged.top():
+            self.assertTrue(count - error <= values.count(value) <= count)
+        self.assertEqual(SpaceSaving.from_state(merged.to_state()).top(),
+                         merged.top())
+
+
+class TestReservoirSample(unittest.TestCase):
+
+    def test_uniform(self):
+        n, size, trials = 20, 3, 3000
+        hits = [0] * n
+        for trial in range(trials):
+            first, second = ReservoirSample(size), ReservoirSample(size)
+            for i in range(n):
+                (first if i < 7 else second).update((trial, i))
+            for _, i in first.merge(second).values:
+                hits[i] += 1
+        expected = trials * size / n
+        for count in hits:
+            self.assertAlmostEqual(count, expected, delta=expected * 0.25)
+
+    def test_merge_same_first_value(self):
+        # Partitions of an enum-like column that all start with the same
+        # value, salted per partition, mix evenly when merged
+        counts = {'x': 0, 'y': 0}
+        for trial in range(2000):
+            merged = ReservoirSample(2)
+            for partition in range(4):
+                sample = ReservoirSample(2, salt=trial * 4 + partition)
+                sample.update_many(['x', 'y'] * 5)
+                merged.merge(sample)
+            for value in merged.values:
+                counts[value] += 1
+        self.assertAlmostEqual(counts['x'] / 4000, 0.5, delta=0.05)
+
+    def test_state(self):
+        sample = ReservoirSample(4)
+        for i in range(100):
+            sample.update('value{}'.format(i))
+        loaded = ReservoirSample.from_state(sample.to_state())
+        self.assertEqual(loaded.values, sample.values)
+        for i in range(100, 200):
+            sample.update('value{}'.format(i))
+            loaded.update('value{}'.format(i))
+        self.assertEqual(loaded.values, sample.values)
+
+        rebuilt = ReservoirSample.from_values(['a', 'b'], 10)
+        self.assertEqual(rebuilt.values, ['a', 'b'])
+        self.assertEqual(rebuilt.n, 10)
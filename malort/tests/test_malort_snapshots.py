@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Snapshot Tests
+
+Test Runner: PyTest
+
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+import malort as mt
+from malort.core import MalortResult
+from malort.snapshots import read_snapshot, write_snapshot
+from malort.test_helpers import TestHelpers, TEST_FILES_2, TEST_FILES_4
+
+
+class TestSnapshots(TestHelpers):
+    maxDiff = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def shard(self, name, path, files):
+        shard_dir = os.path.join(self.tmpdir, name)
+        os.mkdir(shard_dir)
+        for f in files:
+            shutil.copy(os.path.join(path, f), shard_dir)
+        return shard_dir
+
+    @staticmethod
+    def unsampled(stats):
+        """Stats without str samples, which depend on partitioning"""
+        stats = json.loads(json.dumps(stats))
+        for value in stats.values():
+            if isinstance(value, dict):
+                value.get('str', {}).pop('sample', None)
+        return stats
+
+    def test_round_trip(self):
+        for precision in [None, 8]:
+            result = mt.analyze(TEST_FILES_4, backend='serial',
+                                distinct_precision=precision)
+            path = os.path.join(self.tmpdir, 'snap.json.gz')
+            result.to_snapshot(path)
+            loaded = MalortResult.from_snapshot(path)
+            self.assertEqual(loaded.count, result.count)
+            self.assertDictEqual(loaded.stats, result.stats)
+            self.assertEqual(loaded.get_redshift_types(),
+                             result.get_redshift_types())
+
+    def test_merge_shards(self):
+        for path in [TEST_FILES_2, TEST_FILES_4]:
+            files = sorted(os.listdir(path))
+            shards = [self.shard('{}{}'.format(i, os.path.basename(path)),
+                                 path, [f]) for i, f in enumerate(files)]
+            whole = mt.analyze(path, backend='serial', blocksize=1)
+            snapshots = []
+            for i, shard in enumerate(shards):
+                snapshot = os.path.join(self.tmpdir, 'shard{}.gz'.format(i))
+                mt.analyze(shard, backend='serial').to_snapshot(snapshot)
+                snapshots.append(snapshot)
+
+            merged = mt.merge(snapshots)
+            self.assertEqual(merged.count, whole.count)
+            self.assertDictEqual(self.unsampled(merged.stats),
+                                 self.unsampled(whole.stats))
+
+            mixed = mt.merge([mt.analyze(shards[0], backend='serial')]
+                             + snapshots[1:])
+            self.assertDictEqual(self.unsampled(mixed.stats),
+                                 self.unsampled(whole.stats))
+
+    def test_merge_plain_results(self):
+        stats = {'foo': {'base_key': 'foo',
+                         'int': {'count': 2, 'max': 3, 'min': 1,
+                                 'mean': 2.0}}}
+        merged = mt.merge([MalortResult(stats, 2), MalortResult(stats, 2)])
+        self.assertEqual(merged.count, 4)
+        self.assertDictEqual(merged.stats['foo']['int'],
+                             {'count': 4, 'max': 3, 'min': 1, 'mean': 2.0})
+        self.assertEqual(mt.merge([]).count, 0)
+
+    def test_unrounded_state(self):
+        stats = {}
+        for value in [1, 1, 2]:
+            mt.stats.recur_dict(stats, {'foo': value})
+        path = os.path.join(self.tmpdir, 'snap.gz')
+        write_snapshot(stats, path)
+        with gzip.open(path, 'rb') as fread:
+            snapshot = json.loads(fread.read().decode('utf-8'))
+        self.assertEqual(snapshot['version'], 1)
+        int_state = snapshot['paths']['foo']['types']['int']
+        self.assertEqual(int_state['mean'], 4 / 3)
+        self.assertEqual(int_state['sum'], 4)
+        self.assertAlmostEqual(int_state['m2'], 2 / 3)
+        self.assertEqual(read_snapshot(path)['total_records'], 3)
+
+        # Snapshots from before stddev load without one
+        for key in ['sum', 'sum_error', 'm2']:
+            del int_state[key]
+        with gzip.open(path, 'wb') as fwrite:
+            fwrite.write(json.dumps(snapshot).encode('utf-8'))
+        loaded = read_snapshot(path)['foo'].to_dict()['int']
+        self.assertEqual(loaded['mean'], 1.333)
+        self.assertNotIn('stddev', loaded)
+
+    def test_bad_snapshots(self):
+        path = os.path.join(self.tmpdir, 'bad')
+        for content in [b'not gzip', None]:
+            if content is None:
+                with gzip.open(path, 'wb') as fwrite:
+                    fwrite.write(b'{"format": "malort-snapshot", '
+                                 b'"version": 99}')
+            else:
+                with open(path, 'wb') as fwrite:
+                    fwrite.write(content)
+            with self.assertRaises(ValueError):
+                read_snapshot(path)
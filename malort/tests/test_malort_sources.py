@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Sources Tests
+
+Test Runner: PyTest
+
+"""
+import datetime
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import malort as mt
+from malort.sources import (_entries, list_files, partition_matches,
+                            path_partitions)
+from malort.stats import dict_generator
+
+
+class TestListFiles(unittest.TestCase):
+
+    files = ['a.json', 'b.txt', 'sub/c.json', 'sub/deep/d.json',
+             'year=2026/day=2026-09-30/e.json',
+             'year=2026/day=2026-10-01/f.json',
+             'year=2026/day=2026-10-02/g.txt',
+             'year=2026/day=2026-10-02/h.json',
+             'year=2025/day=2025-10-01/i.json']
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for i, name in enumerate(self.files):
+            path = os.path.join(self.tmpdir, *name.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fwrite:
+                fwrite.write('{"n": %d}' % i + ' ' * i * 10)
+            os.utime(path, (1000000 + i, 1000000 + i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def listed(self, **kwargs):
+        return [os.path.relpath(f, self.tmpdir).replace(os.sep, '/')
+                for f in list_files(self.tmpdir, **kwargs)]
+
+    def test_flat(self):
+        self.assertEqual(self.listed(), ['a.json', 'b.txt'])
+
+    def test_recursive(self):
+        self.assertEqual(self.listed(recursive=True), sorted(self.files))
+        self.assertEqual(self.listed(recursive=True, max_depth=1),
+                         ['a.json', 'b.txt', 'sub/c.json'])
+
+    def test_patterns(self):
+        self.assertEqual(self.listed(recursive=True, include='*.txt'),
+                         ['b.txt', 'year=2026/day=2026-10-02/g.txt'])
+        self.assertEqual(self.listed(recursive=True, include='sub/*'),
+                         ['sub/c.json', 'sub/deep/d.json'])
+        self.assertEqual(self.listed(recursive=True,
+                                     exclude=['year=*', 'deep', '*.txt']),
+                         ['a.json', 'sub/c.json'])
+        self.assertEqual(self.listed(recursive=True,
+                                     include=re.compile(r'^year=2025/')),
+                         ['year=2025/day=2025-10-01/i.json'])
+
+    def test_stat_filters(self):
+        sizes = dict((f, os.path.getsize(os.path.join(self.tmpdir, f)))
+                     for f in self.listed(recursive=True))
+        self.assertEqual(self.listed(recursive=True, min_size=50),
+                         sorted(f for f in sizes if sizes[f] >= 50))
+        self.assertEqual(self.listed(recursive=True, max_size=50),
+                         sorted(f for f in sizes if sizes[f] <= 50))
+        self.assertEqual(self.listed(recursive=True, modified_after=1000007),
+                         sorted(self.files[7:]))
+        before = datetime.datetime.utcfromtimestamp(1000001)
+        self.assertEqual(self.listed(recursive=True, modified_before=before),
+                         ['a.json', 'b.txt'])
+
+    def test_partition_filter(self):
+        listed = self.listed(recursive=True, partition_filter={
+            'day': ('2026-10-01', '2026-10-02')})
+        self.assertEqual(listed, ['a.json', 'b.txt', 'sub/c.json',
+                                  'sub/deep/d.json',
+                                  'year=2026/day=2026-10-01/f.json',
+                                  'year=2026/day=2026-10-02/g.txt',
+                                  'year=2026/day=2026-10-02/h.json'])
+        listed = self.listed(recursive=True, include='*.json',
+                             partition_filter={'year': '2025'})
+        self.assertIn('year=2025/day=2025-10-01/i.json', listed)
+        self.assertNotIn('year=2026/day=2026-10-01/f.json', listed)
+
+        # Pruned directories are never listed
+        visited = []
+
+        def entries(directory):
+            visited.append(os.path.relpath(directory, self.tmpdir))
+            return _entries(directory)
+
+        with mock.patch('malort.sources._entries', entries):
+            self.listed(recursive=True, partition_filter={'year': ['2026']})
+        self.assertNotIn('year=2025', visited)
+        self.assertIn(os.path.join('year=2026', 'day=2026-10-01'), visited)
+
+    def test_partition_matches(self):
+        self.assertTrue(partition_matches(('01', None), '02'))
+        self.assertFalse(partition_matches((None, '01'), '02'))
+        self.assertTrue(partition_matches({'a', 'b'}, 'a'))
+        self.assertTrue(partition_matches(lambda v: v.endswith('2'), '02'))
+        self.assertFalse(partition_matches('eu', 'us'))
+
+    def test_path_partitions(self):
+        path = os.path.join(self.tmpdir, 'year=2026', 'day=2026-10-01',
+                            'f.json')
+        self.assertEqual(list(path_partitions(path, self.tmpdir).items()),
+                         [('year', '2026'), ('day', '2026-10-01')])
+        self.assertEqual(path_partitions(os.path.join(self.tmpdir, 'a=b'),
+                                         self.tmpdir), {})
+
+    def test_analyze(self):
+        result = mt.analyze(self.tmpdir, backend='serial', recursive=True,
+                            partition_filter={'year': '2026'})
+        self.assertEqual(result.count, 8)
+        result = mt.analyze(self.tmpdir, backend='serial', recursive=True,
+                            include='*.json',
+                            sampling=mt.Sampling(files=1.0, seed=0))
+        self.assertEqual(result.count, 7)
+        records = list(dict_generator(self.tmpdir, recursive=True,
+                                      exclude='year=*'))
+        self.assertEqual(records, [{'n': 0}, {'n': 1}, {'n': 2}, {'n': 3}])
@@ -10,6 +10,7 @@ could contain, not the exact values.
 
 """
 import os
+import random
 import unittest
 
 import pytest
@@ -24,6 +25,13 @@ class TestDictGenerator(TestHelpers):
         gen = mt.stats.dict_generator(TEST_FILES_1)
         self.assertEquals(len([d for d in gen]), 4)
 
+    def test_float_tokens(self):
+        for blob in mt.stats.dict_generator(TEST_FILES_1, decoder='json'):
+            self.assertIsInstance(blob['floatfield'], mt.stats.JSONFloat)
+
+        parsed = mt.stats.json_loads('{"foo": 1.10}', parse_float=float)
+        self.assertIs(type(parsed['foo']), float)
+
 
 class TestUpdateEntryStats(TestHelpers):
 
@@ -31,20 +39,23 @@ class TestUpdateEntryStats(TestHelpers):
         vtype1, update_1 = mt.stats.updated_entry_stats('Foooo', {})
         print(update_1)
         self.assertEquals(update_1,
-                          {'count': 1, 'mean': 5.0, 'max': 5,
+                          {'count': 1, 'mean': 5.0, 'stddev': 0.0, 'max': 5,
                            'min': 5, 'sample': ['Foooo']})
 
         vtype2, update_2 = mt.stats.updated_entry_stats('Foooo',
                                                       {'str': update_1})
         self.assertEquals(update_2,
-                          {'count': 2, 'mean': 5.0, 'max': 5,
+                          {'count': 2, 'mean': 5.0, 'stddev': 0.0, 'max': 5,
                            'min': 5, 'sample': ['Foooo', 'Foooo']})
 
         vtype3, update_3 = mt.stats.updated_entry_stats(
           'Foo', {'str': update_2})
+        # The sample is ordered by reservoir priority, not arrival
+        self.assertCountEqual(update_3.pop('sample'),
+                              ['Foooo', 'Foooo', 'Foo'])
         self.assertEquals(update_3,
-                          {'count': 3, 'mean': 4.333, 'max': 5,
-                           'min': 3, 'sample': ['Foooo', 'Foooo', 'Foo']})
+                          {'count': 3, 'mean': 4.333, 'stddev': 0.943,
+                           'max': 5, 'min': 3})
 
         vtype4, update_4 = mt.stats.updated_entry_stats('2014-08-07 10:00:00',
                                                        {})
@@ -70,27 +81,27 @@ class TestUpdateEntryStats(TestHelpers):
     def test_stats_number(self):
         vtype1, update_1 = mt.stats.updated_entry_stats(1, {})
         self.assertEquals(update_1,
-                          {'count': 1, 'mean': 1.0, 'max': 1,
+                          {'count': 1, 'mean': 1.0, 'stddev': 0.0, 'max': 1,
                            'min': 1})
 
         vtype2, update_2 = mt.stats.updated_entry_stats(2.0, {'int': update_1})
         self.assertEquals(update_2,
-                          {'count': 1, 'mean': 2.0, 'max': 2.0,
+                          {'count': 1, 'mean': 2.0, 'stddev': 0.0, 'max': 2.0,
                            'min': 2.0, 'max_precision': 2,
                            'max_scale': 1, 'fixed_length': True})
 
         vtype3, update_3 = mt.stats.updated_entry_stats(2, {'int': update_1,
                                                           'float': update_2})
         self.assertEquals(update_3,
-                          {'count': 2, 'mean': 1.5, 'max': 2,
+                          {'count': 2, 'mean': 1.5, 'stddev': 0.5, 'max': 2,
                            'min': 1})
 
         vtype4, update_4 = mt.stats.updated_entry_stats(4.555,
                                                       {'int': update_3,
                                                        'float': update_2})
         self.assertEquals(update_4,
-                          {'count': 2, 'mean': 3.277, 'max': 4.555,
-                           'min': 2.0, 'max_precision': 4,
+                          {'count': 2, 'mean': 3.277, 'stddev': 1.277,
+                           'max': 4.555, 'min': 2.0, 'max_precision': 4,
                            'max_scale': 3, 'fixed_length': False})
 
         for v in [vtype1, vtype3]:
@@ -105,29 +116,46 @@ class TestRecurDict(TestHelpers):
         simple1 = {'key1': 1, 'key2': 'Foo', 'key3': 4.0, 'key4': True,
                    'key5': ['one', 'two', 'three']}
         expected = {
-            'key1': {'int': {'count': 1, 'max': 1, 'mean': 1.0, 'min': 1},
+            'key1': {'int': {'count': 1, 'max': 1, 'mean': 1.0,
+                             'stddev': 0.0, 'min': 1,
+                             'p50': 1, 'p95': 1,
+                             'p99': 1, 'p99.9': 1},
                      'base_key': 'key1'},
-            'key2': {'str': {'count': 1, 'max': 3, 'mean': 3.0, 'min': 3,
-                             'sample': ['Foo']},
+            'key2': {'str': {'count': 1, 'max': 3, 'mean': 3.0,
+                             'stddev': 0.0, 'min': 3,
+                             'p50': 3, 'p95': 3,
+                             'p99': 3, 'p99.9': 3,
+                             'sample': ['Foo'],
+                             'top_k': [['Foo', 1, 0]]},
                      'base_key': 'key2'},
             'key3': {'float': {'count': 1, 'max': 4.0, 'mean': 4.0,
-                               'min': 4.0, 'max_precision': 2,
+                               'stddev': 0.0,
+                               'min': 4.0,
+                               'p50': 4.0, 'p95': 4.0,
+                               'p99': 4.0, 'p99.9': 4.0,
+                               'max_precision': 2,
                                'max_scale': 1, 'fixed_length': True},
                      'base_key': 'key3'},
             'key4': {'bool': {'count': 1}, 'base_key': 'key4'},
-            'key5': {'str': {'count': 1, 'max': 23, 'mean': 23.0, 'min': 23,
-                     'sample': ['["one", "two", "three"]']},
+            'key5': {'str': {'count': 1, 'max': 23, 'mean': 23.0,
+                             'stddev': 0.0, 'min': 23,
+                             'p50': 23, 'p95': 23,
+                             'p99': 23, 'p99.9': 23,
+                     'sample': ['["one", "two", "three"]'],
+                     'top_k': [['["one", "two", "three"]', 1, 0]]},
                      'base_key': 'key5'},
             'total_records': 1
         }
 
         stats = mt.stats.recur_dict({}, simple1)
-        self.assertDictEqual(stats, expected)
+        self.assertDictEqual(mt.stats.export_stats(stats), expected)
 
         updated_stats = mt.stats.recur_dict(stats, {'key1': 2})
-        self.assertDictEqual(updated_stats['key1'],
+        self.assertDictEqual(updated_stats['key1'].to_dict(),
                              {'int': {'count': 2, 'max': 2, 'mean': 1.5,
-                                      'min': 1}, 'base_key': 'key1'})
+                                      'stddev': 0.5, 'min': 1, 'p50': 1,
+                                      'p95': 2, 'p99': 2, 'p99.9': 2},
+                              'base_key': 'key1'})
 
 
     def test_recur_depth_one(self):
@@ -139,39 +167,55 @@ class TestRecurDict(TestHelpers):
         }
         expected = {'key1': {'base_key': 'key1',
                              'int': {'count': 1, 'max': 1, 'mean': 1.0,
-                                     'min': 1}},
+                                     'stddev': 0.0,
+                                     'min': 1,
+                                     'p50': 1, 'p95': 1,
+                                     'p99': 1, 'p99.9': 1}},
                     'key2': {'base_key': 'key2',
                              'str': {'count': 1,
                                      'max': 3,
-                                     'mean': 3.0,
+                                     'mean': 3.0, 'stddev': 0.0,
                                      'min': 3,
-                                     'sample': ['Foo']}},
+                                     'p50': 3, 'p95': 3,
+                                     'p99': 3, 'p99.9': 3,
+                                     'sample': ['Foo'],
+                                     'top_k': [['Foo', 1, 0]]}},
                     'key3': {'base_key': 'key3',
                              'float': {'count': 1,
                                        'fixed_length': True,
                                        'max': 4.0,
                                        'max_precision': 2,
                                        'max_scale': 1,
-                                       'mean': 4.0,
-                                       'min': 4.0}},
+                                       'mean': 4.0, 'stddev': 0.0,
+                                       'min': 4.0,
+                                       'p50': 4.0, 'p95': 4.0,
+                                       'p99': 4.0, 'p99.9': 4.0}},
                     'key4': {'base_key': 'key4', 'bool': {'count': 1}},
                     'key5.key1': {'base_key': 'key1',
                                   'int': {'count': 1, 'max': 2, 'mean': 2.0,
-                                          'min': 2}},
+                                          'stddev': 0.0,
+                                          'min': 2,
+                                          'p50': 2, 'p95': 2,
+                                          'p99': 2, 'p99.9': 2}},
                     'key5.key2': {'base_key': 'key2',
                                   'str': {'count': 1,
                                           'max': 5,
-                                          'mean': 5.0,
+                                          'mean': 5.0, 'stddev': 0.0,
                                           'min': 5,
-                                          'sample': ['Foooo']}},
+                                          'p50': 5, 'p95': 5,
+                                          'p99': 5, 'p99.9': 5,
+                                          'sample': ['Foooo'],
+                                          'top_k': [['Foooo', 1, 0]]}},
                     'key5.key3': {'base_key': 'key3',
                                   'float': {'count': 1,
                                             'fixed_length': True,
                                             'max': 8.0,
                                             'max_precision': 2,
                                             'max_scale': 1,
-                                            'mean': 8.0,
-                                            'min': 8.0}},
+                                            'mean': 8.0, 'stddev': 0.0,
+                                            'min': 8.0,
+                                            'p50': 8.0, 'p95': 8.0,
+                                            'p99': 8.0, 'p99.9': 8.0}},
                     'key5.key4': {'base_key': 'key4', 'bool': {'count': 1}},
                     'total_records': 1}
 
@@ -181,62 +225,85 @@ class TestRecurDict(TestHelpers):
     @property
     def depth_two_expected(self):
         return {'key1': {'base_key': 'key1',
-                         'int': {'count': 1, 'max': 1, 'mean': 1.0, 'min': 1}},
+                         'int': {'count': 1, 'max': 1, 'mean': 1.0,
+                                 'stddev': 0.0, 'min': 1,
+                                 'p50': 1, 'p95': 1,
+                                 'p99': 1, 'p99.9': 1}},
                 'key2': {'base_key': 'key2',
                          'str': {'count': 1,
                                  'max': 3,
-                                 'mean': 3.0,
+                                 'mean': 3.0, 'stddev': 0.0,
                                  'min': 3,
-                                 'sample': ['Foo']}},
+                                 'p50': 3, 'p95': 3,
+                                 'p99': 3, 'p99.9': 3,
+                                 'sample': ['Foo'],
+                                 'top_k': [['Foo', 1, 0]]}},
                 'key3': {'base_key': 'key3',
                          'float': {'count': 1,
                                    'fixed_length': True,
                                    'max': 4.0,
                                    'max_precision': 2,
                                    'max_scale': 1,
-                                   'mean': 4.0,
-                                   'min': 4.0}},
+                                   'mean': 4.0, 'stddev': 0.0,
+                                   'min': 4.0,
+                                   'p50': 4.0, 'p95': 4.0,
+                                   'p99': 4.0, 'p99.9': 4.0}},
                 'key4': {'base_key': 'key4', 'bool': {'count': 1}},
                 'key5.key1': {'base_key': 'key1',
                               'int': {'count': 1, 'max': 2, 'mean': 2.0,
-                                      'min': 2}},
+                                      'stddev': 0.0,
+                                      'min': 2,
+                                      'p50': 2, 'p95': 2,
+                                      'p99': 2, 'p99.9': 2}},
                 'key5.key2': {'base_key': 'key2',
                               'str': {'count': 1,
                                       'max': 5,
-                                      'mean': 5.0,
+                                      'mean': 5.0, 'stddev': 0.0,
                                       'min': 5,
-                                      'sample': ['Foooo']}},
+                                      'p50': 5, 'p95': 5,
+                                      'p99': 5, 'p99.9': 5,
+                                      'sample': ['Foooo'],
+                                      'top_k': [['Foooo', 1, 0]]}},
                 'key5.key3': {'base_key': 'key3',
                               'float': {'count': 1,
                                         'fixed_length': True,
                                         'max': 8.0,
                                         'max_precision': 2,
                                         'max_scale': 1,
-                                        'mean': 8.0,
-                                        'min': 8.0}},
+                                        'mean': 8.0, 'stddev': 0.0,
+                                        'min': 8.0,
+                                        'p50': 8.0, 'p95': 8.0,
+                                        'p99': 8.0, 'p99.9': 8.0}},
                 'key5.key4': {'base_key': 'key4', 'bool': {'count': 1}},
                 'key5.key6.key1': {'base_key': 'key1',
                                    'str': {'count': 1,
                                            'max': 3,
-                                           'mean': 3.0,
+                                           'mean': 3.0, 'stddev': 0.0,
                                            'min': 3,
-                                           'sample': ['Foo']}},
+                                           'p50': 3, 'p95': 3,
+                                           'p99': 3, 'p99.9': 3,
+                                           'sample': ['Foo'],
+                                           'top_k': [['Foo', 1, 0]]}},
                 'key5.key6.key2': {'base_key': 'key2',
                                    'float': {'count': 1,
                                              'fixed_length': True,
                                              'max': 3.0,
                                              'max_precision': 2,
                                              'max_scale': 1,
-                                             'mean': 3.0,
-                                             'min': 3.0}},
+                                             'mean': 3.0, 'stddev': 0.0,
+                                             'min': 3.0,
+                                             'p50': 3.0, 'p95': 3.0,
+                                             'p99': 3.0, 'p99.9': 3.0}},
                 'key5.key6.key3': {'base_key': 'key3',
                                    'float': {'count': 1,
                                              'fixed_length': True,
                                              'max': 2.0,
                                              'max_precision': 2,
                                              'max_scale': 1,
-                                             'mean': 2.0,
-                                             'min': 2.0}},
+                                             'mean': 2.0, 'stddev': 0.0,
+                                             'min': 2.0,
+                                             'p50': 2.0, 'p95': 2.0,
+                                             'p99': 2.0, 'p99.9': 2.0}},
                 'key5.key6.key4': {'base_key': 'key4', 'bool': {'count': 1}},
                 'total_records': 1}
 
@@ -276,19 +343,29 @@ class TestRecurDict(TestHelpers):
         stats = mt.stats.recur_dict({}, with_list)
         expected = {'key1': {'base_key': 'key1',
                              'int': {'count': 1, 'max': 1,
-                                     'mean': 1.0, 'min': 1}},
+                                     'mean': 1.0, 'stddev': 0.0, 'min': 1,
+                                     'p50': 1, 'p95': 1,
+                                     'p99': 1, 'p99.9': 1}},
                     'key2': {'base_key': 'key2',
                              'str': {'count': 1,
                                      'max': 21,
-                                     'mean': 21.0,
+                                     'mean': 21.0, 'stddev': 0.0,
                                      'min': 21,
-                                     'sample': ['["foo", "bar", "baz"]']}},
+                                     'p50': 21, 'p95': 21,
+                                     'p99': 21, 'p99.9': 21,
+                                     'sample': ['["foo", "bar", "baz"]'],
+                                     'top_k': [['["foo", "bar", "baz"]', 1,
+                                                0]]}},
                     'key3.key2': {'base_key': 'key2',
                                   'str': {'count': 1,
                                           'max': 14,
-                                          'mean': 14.0,
+                                          'mean': 14.0, 'stddev': 0.0,
                                           'min': 14,
-                                          'sample': ['["foo", "bar"]']}},
+                                          'p50': 14, 'p95': 14,
+                                          'p99': 14, 'p99.9': 14,
+                                          'sample': ['["foo", "bar"]'],
+                                          'top_k': [['["foo", "bar"]', 1,
+                                                     0]]}},
                     'total_records': 1}
         self.assert_stats(stats, expected)
 
@@ -302,6 +379,116 @@ class TestRecurDict(TestHelpers):
             mt.stats.recur_dict({}, with_values)
 
 
+class TestShapeCache(TestHelpers):
+
+    records = [
+        {'key1': 1, 'key2': 'Foo', 'key3': 4.0,
+         'key5': [{'key1': 2, 'key2': 'Foooo'}, {'key6': {'key1': 'Foo'}}],
+         'key7': ['foo', 'bar'], 'key8': [{'key2': ['foo']}, 'baz']},
+        {'key1': 2, 'key2': 'Bar', 'key3': 2.5,
+         'key5': [{'key1': 3, 'key2': 'Baaaar'}, {'key6': {'key1': 'Qux'}}],
+         'key7': ['qux'], 'key8': [{'key2': ['bar']}, 'qux']},
+        {'key2': 'Foo', 'key1': None, 'key5': {'key1': 10}},
+    ]
+
+    def test_matches_recursive_walk(self):
+        cache = mt.stats.ShapeCache()
+        walked, cached = {}, {}
+        for record in self.records:
+            mt.stats.recur_dict(walked, record)
+            mt.stats.recur_dict(cached, record, shape_cache=cache)
+        self.assertDictEqual(mt.stats.export_stats(cached),
+                             mt.stats.export_stats(walked))
+        self.assertEqual(len(cache), 2)
+
+    def test_shape_distinguishes_nesting(self):
+        shape = mt.stats.record_shape
+        self.assertNotEqual(shape({'a': {}, 'b': 1}), shape({'a': 1, 'b': {}}))
+        self.assertNotEqual(shape({'a': 1}), shape({'a': [1]}))
+        self.assertEqual(shape({'a': [1, 2]}), shape({'a': [3]}))
+
+    def test_lru_eviction(self):
+        cache = mt.stats.ShapeCache(maxsize=2)
+        stats = {}
+        for key in ['a', 'b', 'a', 'c']:
+            mt.stats.recur_dict(stats, {key: 1}, shape_cache=cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(list(cache._plans), [('a',), ('c',)])
+        self.assertEqual(stats['total_records'], 4)
+
+
+class TestPartitionStats(TestHelpers):
+
+    def counts(self, stats):
+        return dict((path, dict((t, s['count']) for t, s in v.items()
+                                if t != 'base_key'))
+                    for path, v in mt.stats.export_stats(stats).items()
+                    if path != 'total_records')
+
+    def test_byte_ranges_match_whole_files(self):
+        files = [os.path.join(TEST_FILES_2, f)
+                 for f in sorted(os.listdir(TEST_FILES_2))]
+        whole = mt.stats.partition_stats([(f, 0, None) for f in files])
+        for blocksize in [1, 50, 333]:
+            partitions = mt.readers.plan_partitions(files, blocksize)
+            stats = {}
+            for partition in partitions:
+                mt.stats.combine_stats(
+                    stats, mt.stats.partition_stats(partition))
+            self.assertEqual(stats['total_records'], whole['total_records'])
+            self.assertDictEqual(self.counts(stats), self.counts(whole))
+
+
+class TestBatchStats(TestHelpers):
+
+    def records(self, n=3000):
+        rand = random.Random(11)
+        blobs = list(TestShapeCache.records)
+        for _ in range(n):
+            blob = {'id': rand.randint(-1000, 1000),
+                    'name': 'name{}'.format(rand.randint(0, 30)),
+                    'score': mt.stats.JSONFloat(
+                        '{:.3f}'.format(rand.random() * 10)),
+                    'when': rand.choice(['2014-09-26 17:00:00', '2014-09-26',
+                                         'later']),
+                    'nested': {'flag': rand.random() < 0.5, 'none': None}}
+            if rand.random() < 0.3:
+                blob['score'] = rand.randint(0, 5)
+            if rand.random() < 0.3:
+                blob['items'] = [{'x': rand.random()},
+                                 ['a', rand.randint(0, 3)]]
+            blobs.append(blob)
+        return blobs
+
+    def test_matches_recur_dict(self):
+        blobs = self.records()
+        for options in [None, mt.accumulators.StatsOptions(
+                distinct_precision=8, top_k=5, sample_size=4)]:
+            expected = {}
+            for blob in blobs:
+                mt.stats.recur_dict(expected, blob, options=options)
+            for batch_size in [1, 100, len(blobs)]:
+                for cache in [None, mt.stats.ShapeCache(maxsize=2)]:
+                    stats = {}
+                    for start in range(0, len(blobs), batch_size):
+                        mt.stats.batch_stats(
+                            stats, blobs[start:start + batch_size],
+                            shape_cache=cache, options=options)
+                    self.assertDictEqual(mt.stats.export_stats(stats),
+                                         mt.stats.export_stats(expected))
+
+    def test_partition_batch_size(self):
+        files = [os.path.join(TEST_FILES_2, f)
+                 for f in sorted(os.listdir(TEST_FILES_2))]
+        partition = [(f, 0, None) for f in files]
+        expected = mt.stats.export_stats(
+            mt.stats.partition_stats(partition, batch_size=0))
+        for batch_size in [1, 3, 1024]:
+            stats = mt.stats.partition_stats(partition, batch_size=batch_size)
+            self.assertDictEqual(mt.stats.export_stats(stats), expected)
+        self.assertEqual(mt.stats.batch_stats({}, []), {})
+
+
 class TestStatsCombiner(TestHelpers):
 
     def test_simple_stat_agg(self):
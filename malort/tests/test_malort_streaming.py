@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Streaming Tests
+
+Test Runner: PyTest
+
+"""
+import json
+import threading
+
+import malort as mt
+from malort.test_helpers import TestHelpers, TEST_FILES_2
+
+
+class TestStreamAnalyzer(TestHelpers):
+
+    def records(self):
+        return list(mt.stats.dict_generator(TEST_FILES_2))
+
+    def test_matches_analyze(self):
+        analyzer = mt.StreamAnalyzer()
+        records = self.records()
+        analyzer.feed(json.dumps(records[0]))
+        analyzer.feed_many(records[1:])
+        snapshot = analyzer.snapshot()
+        expected = mt.analyze(TEST_FILES_2, backend='serial')
+        self.assertEqual(snapshot.count, 4)
+        # Samples are salted per partition, so analyze may sample other
+        # values than the stream; both sample the values seen
+        for stats in [snapshot.stats, expected.stats]:
+            for key, path_stats in stats.items():
+                if 'str' in path_stats:
+                    values = set(r.get(key) for r in records)
+                    self.assertTrue(set(path_stats['str'].pop('sample'))
+                                    <= values)
+        self.assertDictEqual(snapshot.stats, expected.stats)
+
+        analyzer.feed(records[0])
+        self.assertEqual(snapshot.count, 4)
+        self.assertEqual(analyzer.snapshot().count, 5)
+        analyzer.reset()
+        self.assertEqual(analyzer.snapshot().count, 0)
+
+    def test_sample_across_snapshots(self):
+        analyzer = mt.StreamAnalyzer(sample_size=50)
+        for delta in range(50):
+            analyzer.feed({'s': 'first'})
+            for offset in range(1, 20):
+                analyzer.feed({'s': '{}-{}'.format(delta, offset)})
+            analyzer.snapshot()
+        sample = analyzer.snapshot().stats['s']['str']['sample']
+        self.assertEqual(len(sample), 50)
+        # Deltas starting with the same value still sample other offsets
+        offsets = set(v.split('-')[1] for v in sample if v != 'first')
+        self.assertGreater(len(offsets), 5)
+
+    def test_snapshots_while_feeding(self):
+        analyzer = mt.StreamAnalyzer()
+        records = [{'id': i, 'name': 'n{}'.format(i)} for i in range(2000)]
+
+        def feed():
+            for record in records:
+                analyzer.feed(record)
+
+        threads = [threading.Thread(target=feed) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        counts = []
+        while any(t.is_alive() for t in threads):
+            counts.append(analyzer.snapshot().count)
+        for thread in threads:
+            thread.join()
+        counts.append(analyzer.snapshot().count)
+        self.assertEqual(counts, sorted(counts))
+        final = analyzer.snapshot()
+        self.assertEqual(final.count, 6000)
+        self.assertEqual(final.stats['id']['int']['count'], 6000)
+
+    def test_max_paths(self):
+        for shape_cache_size in [0, 256]:
+            analyzer = mt.StreamAnalyzer(max_paths=3,
+                                         shape_cache_size=shape_cache_size)
+            for i in range(10):
+                analyzer.feed({'key{}'.format(i): i, 'fixed': 1})
+                if i % 4 == 0:
+                    analyzer.snapshot()
+            snapshot = analyzer.snapshot()
+            self.assertEqual(len(snapshot.stats), 3)
+            self.assertEqual(snapshot.stats['fixed']['int']['count'], 10)
+            self.assertEqual(snapshot.count, 10)
+            self.assertEqual(analyzer.dropped_paths, 8)
+
+            # Drops are counted per record, also for a cached shape
+            analyzer.feed({'a': 1, 'b': 1, 'c': 1})
+            analyzer.feed_many([{'a': 2, 'd': 2}] * 5)
+            self.assertEqual(analyzer.dropped_paths, 13)
+            # Then once per path dropped when merged into the snapshot
+            snapshot = analyzer.snapshot()
+            self.assertEqual(analyzer.dropped_paths, 16)
+            self.assertEqual(snapshot.count, 16)
+
+    def test_analyze_iter(self):
+        records = ({'id': i} for i in range(25))
+        snapshots = list(mt.analyze_iter(records, snapshot_every=10))
+        self.assertEqual([s.count for s in snapshots], [10, 20, 25])
+        self.assertEqual(snapshots[-1].stats['id']['int']['max'], 24)
+
+
+class TestWindowedAnalyzer(TestHelpers):
+
+    def test_tumbling(self):
+        closed = []
+        analyzer = mt.WindowedAnalyzer(60, time_key='ts',
+                                       on_expire=closed.append)
+        for ts in range(0, 180, 10):
+            analyzer.feed({'ts': ts, 'foo': ts if ts < 120 else str(ts)})
+        self.assertEqual([r.window for r in closed],
+                         [{'start': 0, 'end': 60}, {'start': 60, 'end': 120}])
+        self.assertEqual([r.count for r in closed], [6, 6])
+        current = analyzer.snapshot()
+        self.assertEqual(current.window, {'start': 120, 'end': 180})
+        self.assertEqual(current.count, 6)
+        self.assertEqual(sorted(current.stats['foo']), ['base_key', 'str'])
+
+    def test_sliding(self):
+        analyzer = mt.WindowedAnalyzer(30, step=10)
+        for ts in range(50):
+            analyzer.feed({'foo': ts}, timestamp=ts)
+        snapshot = analyzer.snapshot()
+        self.assertEqual(snapshot.window, {'start': 20, 'end': 50})
+        self.assertEqual(snapshot.count, 30)
+        self.assertEqual(snapshot.stats['foo']['int']['min'], 20)
+        self.assertEqual(len(analyzer._buckets), 3)
+
+        # Late records within the window still count, older ones don't
+        analyzer.feed({'foo': 'late'}, timestamp=25)
+        analyzer.feed({'foo': 'old'}, timestamp=5)
+        self.assertEqual(analyzer.late_records, 1)
+        self.assertEqual(analyzer.snapshot().count, 31)
+
+        later = analyzer.snapshot(now=65)
+        self.assertEqual(later.window, {'start': 40, 'end': 70})
+        self.assertEqual(later.count, 10)
+        self.assertEqual(len(analyzer._buckets), 1)
+
+    def test_clock_and_datetimes(self):
+        import datetime
+        now = [1000.0]
+        analyzer = mt.WindowedAnalyzer(100, time_key='when',
+                                       clock=lambda: now[0])
+        analyzer.feed({'foo': 1})
+        analyzer.feed({'when': datetime.datetime(1970, 1, 1, 0, 16, 50)})
+        self.assertEqual(analyzer.snapshot().count, 2)
+        now[0] = 1100.0
+        analyzer.feed('{"foo": 2}')
+        self.assertEqual(analyzer.snapshot().count, 1)
+        with self.assertRaises(ValueError):
+            analyzer.feed({'when': 'yesterday'})
+        with self.assertRaises(ValueError):
+            mt.WindowedAnalyzer(60, step=25)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Timestamp Tests
+
+Test Runner: PyTest
+
+"""
+import random
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from malort.accumulators import PathStats
+from malort.timestamps import (ISO8601, ISO8601_LAYOUT, SHAPE_TABLE,
+                               is_timestamp, layout_matcher)
+
+
+class TestIsTimestamp(unittest.TestCase):
+
+    tricky = ['2014', '+2014', '-2014-01', '201401', '20140101',
+              '2014-01-01T', '2014-01-01 ', '2014-01-01\n', '2014-W05-3',
+              '2014-366', '2014-367', '2014-01-01T24:00', '2014-01-01T24:00:00',
+              '2014-13-01', '2014-12-00', '2014-12-31T23:59:60',
+              '2014-01-01T10+05:', '2014-01-01T10:00:00,5-0530',
+              u'٢٠١٤', 'fixedlength', '', '1.2', '+', '12345678901',
+              '2014001', '2014400', '20141301', '+201401', '123456789',
+              '2014-09-26 17:00:00', '2014-09-26T17:00:00.123Z']
+
+    def assert_matches_regex(self, values, path_stats=None):
+        for value in values:
+            self.assertEqual(is_timestamp(value, path_stats),
+                             bool(ISO8601.match(value)), repr(value))
+
+    def test_tricky_values(self):
+        self.assert_matches_regex(self.tricky)
+        self.assert_matches_regex(self.tricky, PathStats('foo'))
+
+    def test_fuzz_with_layout_memo(self):
+        rand = random.Random(42)
+        templates = ['dddd-dd-dd', 'dddd-dd-dd dd:dd:dd',
+                     'dddd-dd-ddTdd:dd:dd.dddZ', 'dddd-dd-ddTdd:dd:dd+dd:dd',
+                     'dddd-dd-ddTdd:dd:dd-dddd', 'dddd-dd-ddTdd:dd:dd,d+dd']
+        path_stats = PathStats('foo')
+        values = []
+        for _ in range(20000):
+            if rand.random() < 0.8:
+                template = rand.choice(templates)
+                values.append(''.join(str(rand.randint(0, 9)) if c == 'd'
+                                      else c for c in template))
+            else:
+                values.append(''.join(rand.choice('0123456789-:TZ+ .,W')
+                                      for _ in range(rand.randint(0, 24))))
+        self.assert_matches_regex(values, path_stats)
+
+    def test_rejected_layout_memo(self):
+        path_stats = PathStats('foo')
+        self.assert_matches_regex(['2021x8f3a', '2021.04.1'], path_stats)
+        self.assertEqual(path_stats.timestamp_rejected, '0000.00.0')
+        with mock.patch('malort.timestamps.ISO8601') as regex:
+            self.assertFalse(is_timestamp('2019.12.7', path_stats))
+            self.assertFalse(regex.match.called)
+
+        # Layouts that fail only for their digits are not remembered
+        path_stats = PathStats('foo')
+        self.assert_matches_regex(['2014-13-01', '2014-12-01'], path_stats)
+        self.assertIsNone(path_stats.timestamp_rejected)
+
+        rand = random.Random(7)
+        values = [''.join(rand.choice('0123456789-:Tx.') for _ in range(n))
+                  for n in [rand.randint(4, 12) for _ in range(20000)]]
+        self.assert_matches_regex(['2014' + v for v in values],
+                                  PathStats('foo'))
+        for value in self.tricky + values:
+            if ISO8601.match(value):
+                self.assertTrue(ISO8601_LAYOUT.match(
+                    value.translate(SHAPE_TABLE)), value)
+
+    def test_layout_matchers_are_exact(self):
+        base = ['2014-09-26', '2014-09-26 17:00:00',
+                '2014-09-26T17:00:00.123', '2014-09-26T17:00:00Z',
+                '2014-09-26T17:00:00+05:30', '2014-09-26T17:00:00-0530',
+                '2014-09-26T17:00:00+05']
+        for value in base:
+            matcher = layout_matcher(value)
+            self.assertIsNotNone(matcher)
+            digits = [i for i, c in enumerate(value) if c.isdigit()]
+            for i in digits[4:-1]:
+                for field in range(100):
+                    candidate = (value[:i] + '{:02d}'.format(field)
+                                 + value[i + 2:])
+                    if bool(matcher(candidate)):
+                        self.assertTrue(ISO8601.match(candidate), candidate)
+                    elif ISO8601.match(candidate):
+                        self.assertNotEqual(layout_matcher(candidate),
+                                            matcher, candidate)
+
+    def test_uncommon_layouts_use_regex(self):
+        self.assertIsNone(layout_matcher('2014-W05-3'))
+        self.assertIsNone(layout_matcher('20140926'))
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Malort Timestamps
+-------
+
+ISO8601 timestamp classification for string values
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import re
+
+
+ISO8601 = re.compile(r"""^([\+-]?\d{4}(?!\d{2}\b))((-?)((0[1-9]|1[0-2])(\3([12]
+                      \d|0[1-9]|3[01]))?|W([0-4]\d|5[0-2])(-?[1-7])?|(00[1-9]
+                      |0[1-9]\d|[12]\d{2}|3([0-5]\d|6[1-6])))([T\s]((([01]\d|
+                      2[0-3])((:?)[0-5]\d)?|24\:?00)([\.,]\d+(?!:))?)?(\17[0-5]
+                      \d([\.,]\d+)?)?([zZ]|([\+-])([01]\d|2[0-3]):?([0-5]\d)?)
+                      ?)?)?$""", re.VERBOSE)
+
+
+
+def _relax_digits(pattern):
+    """
+    Replace every digit and digit class of a regex with \\d, keeping
+    repetition counts and backreferences, so it accepts a string if it
+    accepts any string with the same layout (digits in the same places)
+    """
+    def relax(match):
+        token = match.group()
+        if token[0] == '[' and re.match(r'\[[0-9-]+\]\Z', token):
+            return r'\d'
+        return r'\d' if token.isdigit() else token
+    return re.sub(r'\\[0-9]+|\\.|\{[0-9]+\}|\[[^\]]*\]|[0-9]', relax,
+                  pattern)
+
+
+# ISO8601 with any digit allowed wherever it allows one. A layout it
+# rejects is never a timestamp, whatever the digits.
+ISO8601_LAYOUT = re.compile(_relax_digits(ISO8601.pattern), re.VERBOSE)
+
+# Common layouts, with every ASCII digit replaced by 0
+COMMON_LAYOUT = re.compile(r"0000-00-00(?:([T ])00:00:00([.,]0+)?"
+                           r"(Z|[+-]00(:?)(00)?)?)?\Z")
+
+SIGNS = (u'+', u'-')
+
+SHAPE_TABLE = dict((ord(c), u'0') for c in u'123456789')
+
+_layout_matchers = {}
+
+
+def could_be_timestamp(value):
+    """
+    Cheap necessary condition for ISO8601.match: four digits at the start
+    of the string after an optional sign, and, for strings made only of
+    digits, a length of 4 (YYYY), 7 (YYYYDDD) or 8 (YYYYMMDD).
+    """
+    start = 1 if value[:1] in SIGNS else 0
+    year = value[start:start + 4]
+    if len(year) != 4 or not year.isdigit():
+        return False
+    return not value.isdigit() or len(value) in (4, 7, 8)
+
+
+def layout_matcher(value):
+    """
+    Return a compiled matcher for the layout of `value` if it is one of the
+    common ISO8601 layouts (date, or date and time with optional fraction
+    and zone), else None. The matcher only accepts strings with exactly that
+    layout, and accepts a subset of what ISO8601 accepts.
+    """
+    shape = value.translate(SHAPE_TABLE)
+    if shape in _layout_matchers:
+        return _layout_matchers[shape]
+
+    layout = COMMON_LAYOUT.match(shape)
+    matcher = None
+    if layout:
+        sep, fraction, zone, zone_colon, zone_minutes = layout.groups()
+        pattern = r'[0-9]{4}-(?:0[1-9]|1[0-2])-(?:[12][0-9]|0[1-9]|3[01])'
+        if sep:
+            pattern += (sep + r'(?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]')
+        if fraction:
+            pattern += r'\{}[0-9]{{{}}}'.format(fraction[0], len(fraction) - 1)
+        if zone == 'Z':
+            pattern += 'Z'
+        elif zone:
+            pattern += r'\{}(?:[01][0-9]|2[0-3])'.format(zone[0])
+            if zone_minutes:
+                pattern += zone_colon + '[0-5][0-9]'
+        matcher = re.compile(pattern + r'\Z').match
+
+    if len(_layout_matchers) < 64:
+        _layout_matchers[shape] = matcher
+    return matcher
+
+
+def is_timestamp(value, path_stats=None):
+    """
+    Return True if the string `value` matches ISO8601. Always gives the same
+    answer as `ISO8601.match`, but avoids running it where possible:
+
+    * Strings that cannot match (see `could_be_timestamp`) are rejected
+      without running a regex.
+    * If `path_stats` is given, the layout of the last timestamp seen at
+      that path is remembered, and values with the same layout are checked
+      against a small layout-specific pattern instead of the full regex.
+    * Likewise, the layout of the last value rejected at that path is
+      remembered if no digits in that layout could match (e.g. version
+      strings or IDs that start with a year), and values with the same
+      layout are rejected without running the regex.
+
+    Parameters
+    ----------
+    value: str
+    path_stats: PathStats, default None
+        Stats for the key path the value came from
+    """
+    if path_stats is not None:
+        matcher = path_stats.timestamp_layout
+        if matcher is not None and matcher(value):
+            return True
+
+    # Inlined could_be_timestamp
+    start = 1 if value[:1] in SIGNS else 0
+    year = value[start:start + 4]
+    if len(year) != 4 or not year.isdigit():
+        return False
+    if value.isdigit() and len(value) not in (4, 7, 8):
+        return False
+
+    shape = None
+    if path_stats is not None:
+        rejected = path_stats.timestamp_rejected
+        if rejected is not None and len(rejected) == len(value):
+            shape = value.translate(SHAPE_TABLE)
+            if shape == rejected:
+                return False
+    if not ISO8601.match(value):
+        if path_stats is not None:
+            shape = shape or value.translate(SHAPE_TABLE)
+            if not ISO8601_LAYOUT.match(shape):
+                path_stats.timestamp_rejected = shape
+        return False
+
+    if path_stats is not None:
+        path_stats.timestamp_layout = layout_matcher(value)
+    return True
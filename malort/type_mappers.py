@@ -47,13 +47,16 @@ class RedshiftMapper(AbstractMapper):
     def strings(stat):
         trues = ['TRUE', 't', 'true', 'y', 'yes']
         falses = ['FALSE', 'f', 'false', 'n', 'no']
-        matcher_bool = []
-        for entry in stat['sample']:
-            if entry in trues or entry in falses:
-                matcher_bool.append(True)
-            else:
-                matcher_bool.append(False)
-        if all(matcher_bool):
+        if 'top_k' in stat:
+            # Boolean only if the top-k counts prove every value is one
+            bool_count = sum(count - error for entry, count, error
+                             in stat['top_k']
+                             if entry in trues or entry in falses)
+            is_bool = bool_count == stat['count']
+        else:
+            is_bool = all(entry in trues or entry in falses
+                          for entry in stat['sample'])
+        if is_bool:
             return "BOOLEAN"
         else:
             if stat['min'] == stat['max'] == int(stat['mean']):
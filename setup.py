@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import sys
+
 try:
     from setuptools import setup
 except ImportError:
     from distutils.core import setup
 
-reqs = ["dask>=0.7.0",
-        "dill>=0.2.4",
+reqs = ["dill>=0.2.4",
         "numpy>=1.9.2",
         "pandas>=0.16.2",
         "python-dateutil>=2.4.2",
@@ -15,6 +16,9 @@ reqs = ["dask>=0.7.0",
         "toolz>=0.7.2",
         "wheel>=0.24.0"]
 
+if sys.version_info[0] == 2:
+    reqs.append("futures>=3.0.3")
+
 
 setup(
     name='malort',
@@ -31,5 +35,7 @@ setup(
                  'Programming Language :: Python :: 3',
                  'License :: OSI Approved :: MIT License'],
     packages=['malort'],
-    install_requires=reqs
+    install_requires=reqs,
+    extras_require={'dask': ["dask>=0.7.0"],
+                    'zstd': ["zstandard"]}
 )